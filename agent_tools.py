@@ -1,8 +1,14 @@
 import os
 from enum import StrEnum
-from typing import Optional, TypedDict, List, Type, TypeVar, Generic
+from typing import Optional, TypedDict, List, Type, TypeVar, Generic, AsyncIterator, Iterator, Callable
 import httpx
 from config import Config
+from model_router import model_router, TaskClass
+from llm_gateway import llm_gateway, Provider
+from reasoning_stream import (ReasoningModelResponse, ReasoningBackend, ReasoningEvent, ReasoningEventType,
+                                stream_reasoning, collect_reasoning, stop_after_lines, stop_after_marker, stop_after_json_object)
+from citations import CitedText, SearchResult, splice_grounding_citations, splice_grounding_parts, parse_marked_citations
+from telemetry import span, record_span
 import requests
 import json
 from firecrawl import FirecrawlApp
@@ -15,7 +21,6 @@ from pydantic_ai.exceptions import UsageLimitExceeded
 from pydantic_ai.usage import UsageLimits
 from google import genai
 from google.genai import types
-from openai import OpenAI, AsyncOpenAI
 
 from crawl4ai import *
 import aiohttp
@@ -25,7 +30,13 @@ config = Config()
 
 # BaseAgent without dependencies, simple to use
 class BasicAgent():
-    def __init__(self, result_type = str, system_prompt: str = "", model: Model = None):
+    def __init__(self, result_type = str, system_prompt: str = "", model: Model = None, 
+                    task_class: TaskClass = TaskClass.EXTRACTION):
+        """
+        Without a model, the model router picks the model for every call (based on task_class).
+        """
+        self.routed = not model
+        self.task_class = task_class
         if not model:
             model = GeminiModel(config.BASEAGENT_MODEL)
 
@@ -35,22 +46,72 @@ class BasicAgent():
             system_prompt=system_prompt)
 
     async def __call__(self, user_input):
-        return await self.agent.run(user_input)
+        return await self.run(user_input)
 
     async def run(self, user_input):
-        return await self.agent.run(user_input)
+        if not self.routed:
+            return await self.agent.run(user_input)
+
+        model_name = model_router.choose(self.task_class, prompt_tokens=len(user_input) // 4)
+        start = time.time()
+        result = await self.agent.run(user_input, model=GeminiModel(model_name))
+        model_router.record(model_name, time.time() - start)
+        return result
+
+def get_history_summary_prompt(history: list[types.Content], previous_summary: Optional[str] = None) -> str:
+    conversation = ""
+    for content in history:
+        text = "".join(part.text or "" for part in content.parts)
+        conversation += f"{content.role}: {text}\n\n"
+
+    prompt = f"""
+    Please summarize the following conversation between a user and an assistant.
+    Keep all facts, decisions, search queries and URLs that could be needed to continue the conversation.
+    """
+    if previous_summary:
+        prompt += f"""
+    # Summary of the conversation before:
+    {previous_summary}
+    """
+    prompt += f"""
+    # Conversation:
+    {conversation}
+    """
+    return prompt
+
+def get_summary_history(summary: Optional[str]) -> list[types.Content]:
+    if not summary:
+        return []
+
+    return [
+        types.Content(role="user", parts=[types.Part(text=f"Summary of our conversation so far:\n{summary}")]),
+        types.Content(role="model", parts=[types.Part(text="Understood.")])
+    ]
+
+def get_history_turn(question: str, answer: str) -> list[types.Content]:
+    return [
+        types.Content(role="user", parts=[types.Part(text=question)]),
+        types.Content(role="model", parts=[types.Part(text=answer)])
+    ]
 
 class ReasoningModelAsync:
     """
     A class to handle chats using the genai Client and Chat objects.
+
+    Every instance is its own chat session (create one per research run).
+    With max_history_turns set, only the last turns are resent to the model; 
+    older turns are dropped or (with summarize_history) condensed into a short summary.
     """
     
-    def __init__(self, api_key: str = None, model: Model = None):
+    def __init__(self, api_key: str = None, model: Model = None, 
+                    max_history_turns: Optional[int] = None, summarize_history: bool = False):
         """
         Initializes the ChatHandler with the given API key and model.
         
         :param api_key: Your Gemini API key.
         :param model: The model identifier to be used for the chat.
+        :param max_history_turns: Maximum number of question/answer turns kept in the chat history (None = unlimited).
+        :param summarize_history: Summarize dropped turns (with config.LITE2_MODEL) instead of discarding them.
         """
 
         if not model:
@@ -59,8 +120,21 @@ class ReasoningModelAsync:
         else:
             model_name = model.model_name
 
+        self.model_name = model_name
+        self.max_history_turns = max_history_turns
+        self.summarize_history = summarize_history
         self.client = genai.Client(api_key=api_key)
-        self.chat = self.client.aio.chats.create(model=model_name) # async
+        self.reset()
+
+    def reset(self, history: Optional[list[types.Content]] = None, summary: Optional[str] = None):
+        """
+        Starts a new chat session (optionally seeded with previous turns and a summary).
+        """
+        self.history = list(history or [])
+        self.summary = summary
+        self.chat = self.client.aio.chats.create(
+            model=self.model_name, 
+            history=get_summary_history(self.summary) + self.history) # async
     
     async def __call__(self, question: str) -> str:
         """
@@ -69,20 +143,64 @@ class ReasoningModelAsync:
         :param question: The question you want to ask.
         :return: The text response from the chat.
         """
+        start = time.time()
         response = await self.chat.send_message(question)
+        model_router.record(self.model_name, time.time() - start, response.usage_metadata)
+        self.history.extend(get_history_turn(question, response.text))
+        await self._window_history()
         return response.text
 
+    async def stream(self, question: str) -> AsyncIterator[str]:
+        """
+        Sends a question to the chat and yields the text response in chunks (as they arrive).
+        
+        :param question: The question you want to ask.
+        :return: Async iterator over the text chunks of the response.
+        """
+        chunks = []
+        async for chunk in await self.chat.send_message_stream(question):
+            if chunk.text:
+                chunks.append(chunk.text)
+                yield chunk.text
+
+        self.history.extend(get_history_turn(question, "".join(chunks)))
+        await self._window_history()
+
+    async def _window_history(self):
+        if self.max_history_turns is None or len(self.history) <= 2 * self.max_history_turns:
+            return
+
+        split = len(self.history) - 2 * self.max_history_turns
+        dropped, kept = self.history[:split], self.history[split:]
+        summary = self.summary
+
+        if self.summarize_history:
+            response = await self.client.aio.models.generate_content(
+                model=config.LITE2_MODEL,
+                contents=get_history_summary_prompt(dropped, self.summary)
+            )
+            summary = response.text
+
+        self.reset(kept, summary)
+
 class ReasoningModel:
     """
     A class to handle chats using the genai Client and Chat objects.
+
+    Every instance is its own chat session (create one per research run).
+    With max_history_turns set, only the last turns are resent to the model; 
+    older turns are dropped or (with summarize_history) condensed into a short summary.
     """
     
-    def __init__(self, api_key: str = None, model: Model = None):
+    def __init__(self, api_key: str = None, model: Model = None, 
+                    max_history_turns: Optional[int] = None, summarize_history: bool = False):
         """
         Initializes the ChatHandler with the given API key and model.
         
         :param api_key: Your Gemini API key.
         :param model: The model identifier to be used for the chat.
+        :param max_history_turns: Maximum number of question/answer turns kept in the chat history (None = unlimited).
+        :param summarize_history: Summarize dropped turns (with config.LITE2_MODEL) instead of discarding them.
         """
 
         if not model:
@@ -91,8 +209,21 @@ class ReasoningModel:
         else:
             model_name = model.model_name
 
+        self.model_name = model_name
+        self.max_history_turns = max_history_turns
+        self.summarize_history = summarize_history
         self.client = genai.Client(api_key=api_key)
-        self.chat = self.client.chats.create(model=model_name) # sync
+        self.reset()
+
+    def reset(self, history: Optional[list[types.Content]] = None, summary: Optional[str] = None):
+        """
+        Starts a new chat session (optionally seeded with previous turns and a summary).
+        """
+        self.history = list(history or [])
+        self.summary = summary
+        self.chat = self.client.chats.create(
+            model=self.model_name, 
+            history=get_summary_history(self.summary) + self.history) # sync
     
     def __call__(self, question: str) -> str:
         """
@@ -101,10 +232,51 @@ class ReasoningModel:
         :param question: The question you want to ask.
         :return: The text response from the chat.
         """
+        start = time.time()
         response = self.chat.send_message(question)
+        model_router.record(self.model_name, time.time() - start, response.usage_metadata)
+        self.history.extend(get_history_turn(question, response.text))
+        self._window_history()
 
         return response.text
+
+    def stream(self, question: str) -> Iterator[str]:
+        """
+        Sends a question to the chat and yields the text response in chunks (as they arrive).
+        
+        :param question: The question you want to ask.
+        :return: Iterator over the text chunks of the response.
+        """
+        chunks = []
+        for chunk in self.chat.send_message_stream(question):
+            if chunk.text:
+                chunks.append(chunk.text)
+                yield chunk.text
+
+        self.history.extend(get_history_turn(question, "".join(chunks)))
+        self._window_history()
+
+    def _window_history(self):
+        if self.max_history_turns is None or len(self.history) <= 2 * self.max_history_turns:
+            return
+
+        split = len(self.history) - 2 * self.max_history_turns
+        dropped, kept = self.history[:split], self.history[split:]
+        summary = self.summary
+
+        if self.summarize_history:
+            response = self.client.models.generate_content(
+                model=config.LITE2_MODEL,
+                contents=get_history_summary_prompt(dropped, self.summary)
+            )
+            summary = response.text
+
+        self.reset(kept, summary)
     
+class PerplexityResult(TypedDict):
+    text_response: str
+    citations: list[str]
+
 class BasicSearchModel:
     """
     A class to handle basic websearch usinig the google grounding tool.
@@ -122,13 +294,7 @@ class BasicSearchModel:
         self.perplexity = perplexity_search
         
 
-    def __call__(self, query: str):
-        """
-        Sends a search query and returns the search results in form of text.
-        
-        :param query: The query you want to search for.
-        :return: The text response from the chat.
-        """
+    def _build_query(self, query: str) -> str:
         import datetime
         now = datetime.datetime.now()
         date_time_string = now.strftime("%Y-%m-%d %H:%M:%S")
@@ -137,71 +303,171 @@ class BasicSearchModel:
         
         Search Query:
         {query}"""
+        return modified_query
 
-        response = self.client.models.generate_content(
-            model=config.FLASH2_MODEL,
-            contents=modified_query,
-            config=types.GenerateContentConfig(
-                tools=[types.Tool(
-                    google_search=types.GoogleSearchRetrieval
-                )]
-            )
+    def _generate_config(self) -> types.GenerateContentConfig:
+        return types.GenerateContentConfig(
+            tools=[types.Tool(
+                google_search=types.GoogleSearchRetrieval
+            )]
         )
 
-        # Build the text response from the JSON response
-        main_response = response.candidates[0].content.parts[0].text
-        output_text = f"{main_response}"
+    def _cited_text(self, response) -> CitedText:
+        # Build the cited text from the grounding metadata (offset-based per content part, see citations.py)
+        candidate = response.candidates[0]
+        metadata = candidate.grounding_metadata
+        part_texts = [part.text or "" for part in candidate.content.parts]
 
-        grounding_chunks = response.candidates[0].grounding_metadata.grounding_chunks
-        grounding_supports = response.candidates[0].grounding_metadata.grounding_supports
+        if not metadata:
+            return CitedText(text="".join(part_texts))
+        return splice_grounding_parts(part_texts, metadata.grounding_supports, metadata.grounding_chunks)
 
-        for grounding_support in grounding_supports:
-            #confidence_scores = grounding_support.confidence_scores
-            indices = grounding_support.grounding_chunk_indices
-            segment = grounding_support.segment
-            #end_index = segment.end_index
-            segment_text = segment.text
+    def _perplexity_cited_text(self, perplexity_results: PerplexityResult) -> CitedText:
+        return parse_marked_citations(perplexity_results['text_response'], perplexity_results['citations'])
 
-            new_segment_text = f"{segment_text} "
-
-            for k in indices:
-                new_segment_text += f"[{k+1}]"
+    def search(self, query: str) -> SearchResult:
+        """
+        Sends a search query and returns the structured search result (texts, cited spans and sources).
+        
+        :param query: The query you want to search for.
+        :return: The search result.
+        """
+        model_name = model_router.choose(TaskClass.SEARCH, grounding=True)
+        start = time.time()
+        with span("search.api", provider="google"):
+            response = self.client.models.generate_content(
+                model=model_name,
+                contents=self._build_query(query),
+                config=self._generate_config()
+            )
+        model_router.record(model_name, time.time() - start, response.usage_metadata)
+        result = SearchResult(query=query, answers=[self._cited_text(response)])
 
-            output_text = output_text.replace(segment_text, new_segment_text)
+        if self.perplexity and (perplexity_results := perplexity_sonar_reasoning(query)):
+            result.answers.append(self._perplexity_cited_text(perplexity_results))
 
-        if len(grounding_chunks) > 0:
+        return result
 
-            output_text += f"""
-            
-            References:
-            
-            """
+    async def _google_search_async(self, query: str) -> CitedText:
+        model_name = model_router.choose(TaskClass.SEARCH, grounding=True)
+        start = time.time()
+        with span("search.api", provider="google"):
+            response = await self.client.aio.models.generate_content(
+                model=model_name,
+                contents=self._build_query(query),
+                config=self._generate_config()
+            )
+        model_router.record(model_name, time.time() - start, response.usage_metadata)
+        return self._cited_text(response)
 
-            for k, grounding_chunk in enumerate(grounding_chunks):
-                output_text += f"[{k+1}] {grounding_chunk.web.title} {grounding_chunk.web.uri}\n"
+    async def _perplexity_search_async(self, query: str) -> CitedText | None:
+        perplexity_results = await perplexity_sonar_reasoning_async(query)
+        return self._perplexity_cited_text(perplexity_results) if perplexity_results else None
 
+    async def search_async(self, query: str, google_deadline: float = config.GOOGLE_SEARCH_DEADLINE,
+                                perplexity_deadline: float = config.PERPLEXITY_SEARCH_DEADLINE) -> SearchResult:
+        """
+        Async version of search. The google grounding and Perplexity calls run at the same time,
+        each provider has its own deadline and the answers that arrived in time are merged.
+        A failed or timed out provider is skipped, the call only fails if no provider answered.
+        
+        :param query: The query you want to search for.
+        :param google_deadline: Seconds to wait for the google grounding answer.
+        :param perplexity_deadline: Seconds to wait for the Perplexity answer.
+        :return: The search result.
+        """
+        providers = {"Google": (self._google_search_async(query), google_deadline)}
         if self.perplexity:
-            perplexity_results = perplexity_sonar_reasoning(query)
-
-            citation_text = ""
-            for k, url in enumerate(perplexity_results['citations']):
-                citation_text += f"[{k}] {url}\n"
-
-            output_text = f"""Google Search Results: 
-
-            {output_text}
-            
-            --------------------------
-            Perplexity Search Results:
+            providers["Perplexity"] = (self._perplexity_search_async(query), perplexity_deadline)
+
+        outcomes = await asyncio.gather(
+            *(asyncio.wait_for(coroutine, timeout=deadline) for coroutine, deadline in providers.values()),
+            return_exceptions=True)
+
+        result = SearchResult(query=query)
+        errors = []
+        for provider, outcome in zip(providers, outcomes):
+            if isinstance(outcome, asyncio.TimeoutError):
+                print(f"{provider} search timed out after {providers[provider][1]}s: {query}")
+                errors.append(outcome)
+            elif isinstance(outcome, BaseException):
+                print(f"{provider} search failed: {outcome}")
+                errors.append(outcome)
+            elif outcome:
+                result.answers.append(outcome)
+
+        if not result.answers and errors:
+            raise errors[0]
+        return result
 
-            {perplexity_results['text_response']}
+    def __call__(self, query: str):
+        """
+        Sends a search query and returns the search results in form of text.
+        
+        :param query: The query you want to search for.
+        :return: The text response from the chat.
+        """
+        return self.search(query).render()
 
-            References:
+    async def run_async(self, query: str) -> str:
+        """
+        Async version of __call__ (non-blocking google grounding and Perplexity calls).
+        
+        :param query: The query you want to search for.
+        :return: The text response from the chat.
+        """
+        return (await self.search_async(query)).render()
 
-            {citation_text}
+    async def stream_async(self, query: str, on_result: Optional[Callable[[SearchResult], None]] = None
+                            ) -> AsyncIterator[str]:
+        """
+        Streams the search result text as it arrives.
 
-            """
-        return output_text
+        The grounding metadata is only complete at the end of the stream, so the text is streamed 
+        without inline citation markers and the reference list (and the Perplexity results) follow at the end.
+        Once the stream ended, the complete search result (with the inline citation markers of the final
+        grounding metadata) is passed to on_result, e.g., to replace the streamed text.
+        
+        :param query: The query you want to search for.
+        :param on_result: Called with the complete search result after the stream.
+        :return: Async iterator over the text chunks.
+        """
+        perplexity_task = asyncio.create_task(perplexity_sonar_reasoning_async(query)) if self.perplexity else None
+        texts, grounding_supports, grounding_chunks = [], [], []
+        start = time.time()
+
+        async for chunk in await self.client.aio.models.generate_content_stream(
+            model=model_router.choose(TaskClass.SEARCH, grounding=True),
+            contents=self._build_query(query),
+            config=self._generate_config()
+        ):
+            if chunk.text:
+                texts.append(chunk.text)
+                yield chunk.text
+            if chunk.candidates and (metadata := chunk.candidates[0].grounding_metadata):
+                grounding_supports = metadata.grounding_supports or grounding_supports
+                grounding_chunks = metadata.grounding_chunks or grounding_chunks
+        # Traced after the stream ended (an open span would leak into the consumer's context)
+        record_span("search.api", start, time.time(), provider="google", stream=True)
+
+        # The segment offsets of the final metadata refer to the complete streamed text
+        result = SearchResult(query, [splice_grounding_citations("".join(texts), grounding_supports, grounding_chunks)])
+        if grounding_chunks:
+            yield f"\n\nReferences:\n\n{result.answers[0].render_references()}\n"
+
+        if perplexity_task:
+            try:
+                perplexity_results = await asyncio.wait_for(perplexity_task, timeout=config.PERPLEXITY_SEARCH_DEADLINE)
+            except asyncio.TimeoutError:
+                print(f"Perplexity search timed out after {config.PERPLEXITY_SEARCH_DEADLINE}s: {query}")
+                perplexity_results = None
+            if perplexity_results:
+                perplexity_answer = self._perplexity_cited_text(perplexity_results)
+                result.answers.append(perplexity_answer)
+                yield f"\n\n{SearchResult(query, [perplexity_answer]).render()}"
+
+        if on_result:
+            on_result(result)
 
 async def count_tokens(content: str, model_name: str):
     client = genai.Client(api_key=config.GEMINI_API_KEY)
@@ -267,7 +533,8 @@ async def google_general_search_async(search_query: str,
     }
 
     async with httpx.AsyncClient() as client:
-        response = await client.post(config.SERPER_BASE_URL, headers=headers, json=payload)
+        with span("search.api", provider="serper"):
+            response = await client.post(config.SERPER_BASE_URL, headers=headers, json=payload)
         response.raise_for_status()
         return response.json()
 
@@ -287,11 +554,12 @@ async def google_scholar_search_async(search_query: str, num_pages: int = 1) ->
                 'Content-Type': 'application/json'
             }
 
-            response = await client.post(
-                config.SERPER_BASE_URL,
-                headers=headers,
-                data=payload
-            )
+            with span("search.api", provider="serper.scholar"):
+                response = await client.post(
+                    config.SERPER_SCHOLAR_URL,
+                    headers=headers,
+                    data=payload
+                )
             if response.status_code != 200:
                 print(f"Scholar search failed with status {response.status_code}")
                 return []
@@ -325,11 +593,12 @@ async def google_news_search_async(search_query: str, num_pages: int = 1) -> dic
                 'Content-Type': 'application/json'
             }
 
-            response = await client.post(
-                config.SERPER_BASE_URL,
-                headers=headers,
-                data=payload
-            )
+            with span("search.api", provider="serper.news"):
+                response = await client.post(
+                    config.SERPER_NEWS_URL,
+                    headers=headers,
+                    data=payload
+                )
             if response.status_code != 200:
                 print(f"News search failed with status {response.status_code}")
                 return []
@@ -339,28 +608,21 @@ async def google_news_search_async(search_query: str, num_pages: int = 1) -> dic
 
     return news_articles
 
-class PerplexityResult(TypedDict):
-    text_response: str
-    citations: list[str]
-
 async def perplexity_search_async(search_query: str) -> PerplexityResult | None:
-    """Async version using AsyncOpenAI"""
+    """Async version using the pooled gateway client"""
     try:
-        client = AsyncOpenAI(
-            api_key=config.PERPLEXITY_API_KEY,
-            base_url=config.PERPLEXITY_BASE_URL
-        )
-
-        response = await client.chat.completions.create(
-            model="sonar-pro",
-            messages=[{
-                "role": "system",
-                "content": "You are an artificial intelligence assistant that engages in helpful, detailed conversations.",
-            }, {   
-                "role": "user",
-                "content": search_query,
-            }],
-        )
+        with span("search.api", provider="perplexity"):
+            response = await llm_gateway.complete(
+                Provider.PERPLEXITY,
+                model="sonar-pro",
+                messages=[{
+                    "role": "system",
+                    "content": "You are an artificial intelligence assistant that engages in helpful, detailed conversations.",
+                }, {   
+                    "role": "user",
+                    "content": search_query,
+                }],
+            )
 
         message = response.choices[0].message.content + "\n\n"
 
@@ -377,19 +639,16 @@ async def perplexity_search_async(search_query: str) -> PerplexityResult | None:
 def perplexity_sonar_reasoning(search_query: str) -> PerplexityResult | None:
 
     try:
-        client = OpenAI(
-        base_url=config.OPENROUTER_BASE_URL,
-        api_key=config.OPENROUTER_API_KEY,
-        )
-
-        completion = client.chat.completions.create(
-        model=config.OPENROUTER_PERPLEXITY_SONAR_REASONING,
-        messages=[
-            {
-            "role": "user",
-            "content": search_query
-            }
-        ])
+        with span("search.api", provider="openrouter.perplexity"):
+            completion = llm_gateway.complete_sync(
+            Provider.OPENROUTER,
+            model=config.OPENROUTER_PERPLEXITY_SONAR_REASONING,
+            messages=[
+                {
+                "role": "user",
+                "content": search_query
+                }
+            ])
 
         response = PerplexityResult(
                 text_response = completion.choices[0].message.content.strip(),
@@ -402,8 +661,31 @@ def perplexity_sonar_reasoning(search_query: str) -> PerplexityResult | None:
         return None
 
 
-def perplexity_deep_research(search_query: str):
-    messages = [
+async def perplexity_sonar_reasoning_async(search_query: str) -> PerplexityResult | None:
+    """Async version of perplexity_sonar_reasoning (via OpenRouter)"""
+    try:
+        with span("search.api", provider="openrouter.perplexity"):
+            completion = await llm_gateway.complete(
+                Provider.OPENROUTER,
+                model=config.OPENROUTER_PERPLEXITY_SONAR_REASONING,
+                messages=[{
+                    "role": "user",
+                    "content": search_query
+                }]
+            )
+
+        response = PerplexityResult(
+                text_response = completion.choices[0].message.content.strip(),
+                citations=completion.citations
+            )
+
+        return response
+    except Exception as e:
+        print(f"Perplexity search failed: {e}")
+        return None
+
+def get_deep_research_messages(search_query: str) -> list[dict]:
+    return [
         {
             "role": "system",
             "content": (
@@ -416,12 +698,16 @@ def perplexity_deep_research(search_query: str):
         },
     ]
 
-    client = OpenAI(api_key=config.PERPLEXITY_API_KEY, base_url=config.PERPLEXITY_BASE_URL)
-
+def perplexity_deep_research(search_query: str):
+    """
+    Blocking Perplexity deep research call (can take several minutes).
+    For long running research use the async job mode in deep_research_jobs.py instead.
+    """
     # chat completion without streaming
-    response = client.chat.completions.create(
+    response = llm_gateway.complete_sync(
+        Provider.PERPLEXITY,
         model=config.PERPLEXITY_DEEP_RESEARCH,
-        messages=messages,
+        messages=get_deep_research_messages(search_query),
     )
     print(response)
 
@@ -432,11 +718,12 @@ async def papers_with_code_search_async(query: str, items_per_page: int = 200) -
     """Async version of papers with code search"""
     try:
         async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://paperswithcode.com/api/v1/search/",
-                params={"items_per_page": items_per_page, "q": query},
-                headers={"accept": "application/json", "X-CSRFToken": config.PAPERS_WITH_CODE_CSRF_TOKEN}
-            )
+            with span("search.api", provider="paperswithcode"):
+                response = await client.get(
+                    "https://paperswithcode.com/api/v1/search/",
+                    params={"items_per_page": items_per_page, "q": query},
+                    headers={"accept": "application/json", "X-CSRFToken": config.PAPERS_WITH_CODE_CSRF_TOKEN}
+                )
             response.raise_for_status()
             data = response.json()
             sorted_list = sorted(data['results'], key=lambda x: x['repository']['stars'], reverse=True)
@@ -519,9 +806,16 @@ async def crawl4ai_website_async(url_webpage: str) -> str:
     Returns:
         str: The crawled content in markdown format.
     """
+    with span("crawl", url=url_webpage) as crawl_span:
+        text = await _crawl4ai_website_async(url_webpage, crawl_span)
+        crawl_span.set(chars=len(text or ""))
+        return text
+
+async def _crawl4ai_website_async(url_webpage: str, crawl_span) -> str:
     md = MarkItDown()
 
     if is_pdf_url(url_webpage):
+        crawl_span.set(method="pdf")
         result = md.convert(url_webpage)
         return result.text_content
         
@@ -529,6 +823,7 @@ async def crawl4ai_website_async(url_webpage: str) -> str:
     async with aiohttp.ClientSession() as session:
         async with session.get(url_webpage) as response:
             html_text = await response.text()
+    crawl_span.set(bytes=len(html_text.encode("utf-8")))
 
     # Extract text from the HTML to determine if it has useful content
     soup = BeautifulSoup(html_text, 'html.parser')
@@ -536,116 +831,38 @@ async def crawl4ai_website_async(url_webpage: str) -> str:
 
     # If the extracted text is insufficient, likely due to JavaScript rendering issues, use the crawler
     if len(text_content) < 100:
+        crawl_span.set(method="browser")
         async with AsyncWebCrawler() as crawler:
             result = await crawler.arun(url=url_webpage)
             return result.markdown
     else:
+        crawl_span.set(method="markitdown")
         result = md.convert(url_webpage)
         return result.text_content
 
-class ReasoningModelResponse(BaseModel):
-    reasoning_content: Optional[str] = Field(description="The reasoning/thinking chain-of-thought output of the model.")
-    final_answer: str = Field(description="The final response/answer of the model (after thinking).")
-
 def deepseekR1_call(user_input: str) -> ReasoningModelResponse:
     """
     Call the DeepSeek Reasoner model to process user input.
 
     This function sends a user query to the DeepSeek Reasoner model and processes
     the streamed response, separating the reasoning content from the final answer.
+    (Use stream_reasoning to consume the thought and answer deltas while they arrive.)
 
     Args:
         user_input (str): The user's query or input to be processed by the model.
 
     Returns:
-        DeepseekR1Response: An object containing the reasoning content and final answer.
+        ReasoningModelResponse: An object containing the reasoning content and final answer.
 
     Raises:
         Exception: If there's an error in API communication or response processing.
     """
-
-    deepseek_client = OpenAI(
-        api_key=config.DEEPSEEK_API_KEY,
-        base_url=config.DEEPSEEK_BASE_URL
-    )
-    model = config.DEEPSEEK_R1
-
-    deepseek_messages = []
-    deepseek_messages.append({
-        "role": "user", 
-        "content": user_input
-        })
-    
-    response = deepseek_client.chat.completions.create(
-                model=model,
-                #max_tokens=1,
-                messages=deepseek_messages,
-                stream=True
-            )
-
-    reasoning_content = ""
-    final_content = ""
-
-    for chunk in response:
-        if chunk.choices[0].delta.reasoning_content:
-            reasoning_piece = chunk.choices[0].delta.reasoning_content
-            reasoning_content += reasoning_piece
-        elif chunk.choices[0].delta.content:
-            final_content += chunk.choices[0].delta.content
-
-    response = ReasoningModelResponse(
-        reasoning_content=reasoning_content, 
-        final_answer=final_content)
-    return response        
+    return llm_gateway.run_sync(collect_reasoning(user_input, ReasoningBackend.DEEPSEEK))
 
 def openrouter_deepseekR1_call(user_input: str) -> ReasoningModelResponse:
-
-    url = f"{config.OPENROUTER_BASE_URL}/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {config.OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "model": config.OPENROUTER_DEEPSEEK_R1,
-        "messages": [
-            {"role": "user", "content": user_input}
-        ],
-        "include_reasoning": True
-    }
-
-    response = requests.post(url, headers=headers, data=json.dumps(payload))
-
-    thinking_part = response.json()['choices'][0]['message']['reasoning']
-    final_answer = response.json()['choices'][0]['message']['content']
-
-    response = ReasoningModelResponse(
-        reasoning_content=thinking_part, 
-        final_answer=final_answer)
-    return response 
+    """DeepSeek R1 via OpenRouter (streamed, see deepseekR1_call)."""
+    return llm_gateway.run_sync(collect_reasoning(user_input, ReasoningBackend.OPENROUTER))
 
 def gemini_flash2_thinking_call(user_input: str) -> ReasoningModelResponse:
-    
-    # Only run this block for Gemini Developer API
-    client = genai.Client(api_key=config.GEMINI_API_KEY)
-    response = client.models.generate_content(
-        model=config.FLASH2T_MODEL,
-        contents=user_input,
-        config=types.GenerateContentConfig(
-            thinking_config=types.ThinkingConfig(include_thoughts=True),
-            http_options=types.HttpOptions(api_version='v1alpha'),
-        )
-    )
-    if len(response.candidates[0].content.parts) > 1:
-
-        thinking_part = response.candidates[0].content.parts[0].text
-        final_answer = response.candidates[0].content.parts[1].text
-
-        response = ReasoningModelResponse(
-            reasoning_content=thinking_part, 
-            final_answer=final_answer)
-    else:
-        response = ReasoningModelResponse(
-            reasoning_content=None, 
-            final_answer=response.candidates[0].content.parts[0].text)
-        
-    return response 
+    """Gemini flash thinking (streamed, see deepseekR1_call)."""
+    return llm_gateway.run_sync(collect_reasoning(user_input, ReasoningBackend.GEMINI))
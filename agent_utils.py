@@ -1,6 +1,6 @@
 import os
 import time
-import pickle
+import dataclasses
 from os.path import join, exists, basename
 from os import listdir, makedirs
 from datetime import datetime
@@ -26,9 +26,6 @@ from typing import Dict, Optional, List
 from typing import TypeVar, Generic
 from markitdown import MarkItDown
 import asyncio
-import nest_asyncio 
-# Add this line to allow nested event loops
-nest_asyncio.apply()
 import copy
 import re
 from collections import deque
@@ -36,6 +33,7 @@ from functools import wraps
 import threading
 
 from config import Config
+from artifact_store import artifact_store
 
 from loguru import logger
 import logfire
@@ -49,27 +47,83 @@ def cprint(text: str, markdown: bool = True):
     else:
         console.print(text)
 
+# Schema version of the save_data artifacts (increase it when the stored data changes its shape)
+DATA_SCHEMA_VERSION = 2
+
+# Pydantic models and dataclasses that save_data stores with their class (only these are restored by load_data)
+DATA_TYPES: Dict[str, type] = {}
+
+def register_data_type(cls: type, name: Optional[str] = None) -> type:
+    """
+    Allows save_data to store a pydantic model or dataclass (usable as class decorator).
+
+    Args:
+        cls (type): The class.
+        name (Optional[str]): Name of the class in the stored data (default: the class name).
+    """
+    if not (issubclass(cls, BaseModel) or dataclasses.is_dataclass(cls)):
+        raise TypeError(f"{cls.__name__} is neither a pydantic model nor a dataclass")
+    name = name or cls.__name__
+    if DATA_TYPES.get(name, cls) is not cls:
+        raise ValueError(f"Another data type is already registered as {name}")
+    DATA_TYPES[name] = cls
+    return cls
+
+def _get_type_name(value) -> Optional[str]:
+    if not (isinstance(value, BaseModel) or (dataclasses.is_dataclass(value) and not isinstance(value, type))):
+        return None
+    for name, cls in DATA_TYPES.items():
+        if type(value) is cls:
+            return name
+    raise TypeError(f"{type(value).__name__} isn't a registered data type (see register_data_type)")
+
+def _restore(type_name: Optional[str], value):
+    if not type_name:
+        return value
+    cls = DATA_TYPES.get(type_name)
+    if cls is None:
+        raise TypeError(f"Stored data type {type_name} isn't registered (see register_data_type)")
+    if issubclass(cls, BaseModel):
+        return cls.model_validate(value)
+    return cls(**value)
+
 def save_data(data, name):
+    """
+    Stores data in the artifact store (as JSON, no pickle).
 
-    if not exists("temp_data"):
-        makedirs("temp_data")
-        
-    dump_folder = "temp_data/"
-    file_path = join(dump_folder, name + ".pkl")
-    with open(file_path, "wb") as f:
-        pickle.dump(data, f)
+    Pydantic models and dataclasses (also as items of a list) are loaded as the same class again,
+    their class has to be registered with register_data_type (load_data only creates registered classes).
+    Other values come back as their JSON equivalent (e.g., tuples and sets as lists, nested dataclasses as dicts).
 
-def load_data(name):
-    dump_folder = "temp_data/"
-    file_path = join(dump_folder, name + ".pkl")
+    Raises:
+        TypeError: If the data is a pydantic model or dataclass of a class that isn't registered.
+    """
+    if isinstance(data, list) and data and len({type(item) for item in data}) == 1:
+        record = {"item_type": _get_type_name(data[0]), "data": data}
+    else:
+        record = {"type": _get_type_name(data), "data": data}
+    artifact_store.put(name, record, schema="data", version=DATA_SCHEMA_VERSION)
 
-    if exists(file_path):
-        with open(file_path, "rb") as f:
-            data = pickle.load(f)
+def load_data(name):
+    """
+    Loads the latest data stored under the name (None if there is none with the current schema version).
 
-        return data
-    
-    return None
+    Raises:
+        RuntimeError: If there is only a pickle file of the old save_data (temp_data/<name>.pkl), which isn't loaded.
+    """
+    record = artifact_store.get(name, schema="data", version=DATA_SCHEMA_VERSION)
+    if record is None:
+        pickle_path = join(config.ARTIFACT_DIR, name + ".pkl")
+        if exists(pickle_path):
+            raise RuntimeError(
+                f"{pickle_path} was stored by an old version of save_data with pickle, which is no longer loaded "
+                f"(unpickling is unsafe). Recreate the data, or if you trust the file, convert it once with "
+                f"save_data(pickle.load(open({pickle_path!r}, 'rb')), {name!r}).")
+        return None
+
+    if "item_type" in record:
+        return [_restore(record["item_type"], item) for item in record["data"]]
+    return _restore(record["type"], record["data"])
 
 class RateLimiter:
     def __init__(self, rpm: int = 10, window: float = 60.0):
@@ -94,6 +148,39 @@ class RateLimiter:
             return func(*args, **kwargs)
         return wrapper
 
+class AsyncRateLimiter:
+    """
+    Sliding window rate limiter for async code. Waiting callers sleep without blocking their event loop,
+    the bookkeeping is thread-safe, so one limiter can be shared by several event loops.
+    """
+    def __init__(self, rpm: int = 10, window: float = 60.0):
+        self.rpm = rpm
+        self.window = window
+        self.timestamps = deque(maxlen=rpm)
+        self.lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        # Reserve the next free slot and return how long the caller has to wait for it
+        with self.lock:
+            now = time.time()
+            start = now
+            if len(self.timestamps) >= self.rpm:
+                start = max(now, self.timestamps[0] + self.window)
+            self.timestamps.append(start)
+            return start - now
+
+    async def acquire(self):
+        wait_time = self._reserve()
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
+
+    def __call__(self, func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            await self.acquire()
+            return await func(*args, **kwargs)
+        return wrapper
+
 def apply_rate_limit(functions, agent_name, rpm_value):
     rate_limiter = RateLimiter(rpm=rpm_value) # Create a rate limiter instance
     return [rate_limiter(func) for func in functions]
@@ -129,6 +216,44 @@ class AsyncFunctionCallLimiter:
 
         return wrapper
 
+def in_notebook() -> bool:
+    """True inside a Jupyter kernel (its event loop is already running when a cell runs)."""
+    try:
+        from IPython import get_ipython
+    except ImportError:
+        return False
+    shell = get_ipython()
+    return shell is not None and hasattr(shell, "kernel")
+
+def allow_nested_event_loops():
+    """
+    Lets the sync helpers (e.g., run_sync of the agents) start an event loop inside the running loop of a notebook.
+    Only applied in notebooks: nest_asyncio patches asyncio globally, the app's shared loops
+    (TaskManager, LLMGateway) don't need it.
+    """
+    if in_notebook():
+        import nest_asyncio
+        nest_asyncio.apply()
+
+allow_nested_event_loops()
+
+def iterate_sync(async_iterator):
+    """
+    Iterates over an async iterator from synchronous code (e.g., Streamlit or a QThread).
+
+    The iterator runs on its own event loop, every chunk is yielded as soon as it arrives.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(async_iterator.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
 def scrubbing_callback(m: logfire.ScrubMatch):
     if (
         m.path == ('message', 'prompt')
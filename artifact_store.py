@@ -0,0 +1,233 @@
+import os
+import json
+import mmap
+import shutil
+import time
+import zlib
+import threading
+import dataclasses
+from dataclasses import dataclass, field
+from os.path import join, exists
+from typing import Any, Iterator, Optional
+
+from config import Config
+
+config = Config()
+
+RECORDS_FILE = "records.dat"  # zlib compressed JSON records, appended one after the other
+BODIES_FILE = "bodies.dat"    # large text bodies (raw UTF-8, read through mmap)
+INDEX_FILE = "index.jsonl"    # one line per record: collection, offsets, schema and version
+
+BODY_KEY = "__body__"
+
+
+@dataclass
+class RecordEntry:
+    collection: str
+    offset: int
+    length: int
+    schema: str
+    version: int
+    created_at: float
+    replace: bool = False  # Written by put (only the latest record of the collection is kept by compact)
+
+
+@dataclass
+class TextBody:
+    """A large text of a record that is only read when needed (see ArtifactStore.read with bodies=False)."""
+    store: "ArtifactStore" = field(repr=False)
+    offset: int
+    length: int
+
+    def read(self) -> str:
+        return self.store._read_body(self.offset, self.length)
+
+    def __len__(self):
+        return self.length
+
+
+def _encode(value):
+    # JSON fallback for the objects we store (pydantic models, dataclasses, sets)
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json")
+    if dataclasses.is_dataclass(value):
+        return dataclasses.asdict(value)
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} can't be stored as artifact")
+
+
+class ArtifactStore:
+    """
+    Append-only store for research intermediates (search results, crawled corpora, ...).
+
+    Every record is JSON compressed with zlib and appended to one data file, the index (a small JSONL file)
+    keeps the offset of every record, so a single record is read without loading the rest.
+    String fields above mmap_threshold characters are kept uncompressed in a separate body file and read
+    through mmap, a corpus can be scanned without reading its text bodies.
+    Every record carries a schema name and version; records of another version are treated as missing.
+
+    A collection is either a single artifact (put/get, the latest record wins) or a list of records (append/read).
+    The files only grow, compact rewrites them without the replaced artifact versions and unused text bodies.
+    """
+
+    def __init__(self, folder: str = config.ARTIFACT_DIR, mmap_threshold: int = config.ARTIFACT_MMAP_THRESHOLD):
+        """
+        Args:
+            folder (str): Folder of the store files (created on the first write).
+            mmap_threshold (int): Min. length of a string field that is stored as separate text body.
+        """
+        self.folder = folder
+        self.mmap_threshold = mmap_threshold
+        self.lock = threading.RLock()
+        self.index: Optional[dict[str, list[RecordEntry]]] = None
+        self.bodies_map: Optional[mmap.mmap] = None
+
+    def _path(self, file_name: str) -> str:
+        return join(self.folder, file_name)
+
+    def _load_index(self) -> dict[str, list[RecordEntry]]:
+        if self.index is None:
+            self.index = {}
+            if exists(self._path(INDEX_FILE)):
+                with open(self._path(INDEX_FILE), "r", encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            entry = RecordEntry(**json.loads(line))
+                            self.index.setdefault(entry.collection, []).append(entry)
+        return self.index
+
+    def _append(self, file_name: str, data: bytes) -> int:
+        # Appends bytes to a store file and returns their offset
+        os.makedirs(self.folder, exist_ok=True)
+        with open(self._path(file_name), "ab") as f:
+            offset = f.tell()
+            f.write(data)
+        return offset
+
+    def _extract_bodies(self, value):
+        # Replaces large strings by references into the body file
+        if isinstance(value, str) and len(value) >= self.mmap_threshold:
+            data = value.encode("utf-8")
+            return {BODY_KEY: [self._append(BODIES_FILE, data), len(data)]}
+        if isinstance(value, dict):
+            return {key: self._extract_bodies(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._extract_bodies(item) for item in value]
+        return value
+
+    def _read_body(self, offset: int, length: int) -> str:
+        with self.lock:
+            if self.bodies_map is None or offset + length > len(self.bodies_map):
+                # The body file grew since it was mapped
+                if self.bodies_map is not None:
+                    self.bodies_map.close()
+                with open(self._path(BODIES_FILE), "rb") as f:
+                    self.bodies_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return self.bodies_map[offset:offset + length].decode("utf-8")
+
+    def _resolve_bodies(self, value, bodies: bool):
+        if isinstance(value, dict):
+            if BODY_KEY in value and len(value) == 1:
+                offset, length = value[BODY_KEY]
+                return self._read_body(offset, length) if bodies else TextBody(self, offset, length)
+            return {key: self._resolve_bodies(item, bodies) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._resolve_bodies(item, bodies) for item in value]
+        return value
+
+    def _add(self, collection: str, record: Any, schema: str, version: int, replace: bool,
+                created_at: Optional[float] = None) -> int:
+        with self.lock:
+            index = self._load_index()
+            payload = json.dumps(self._extract_bodies(json.loads(json.dumps(record, default=_encode))))
+            data = zlib.compress(payload.encode("utf-8"), config.ARTIFACT_COMPRESSION_LEVEL)
+
+            entry = RecordEntry(collection, self._append(RECORDS_FILE, data), len(data), schema, version,
+                                created_at or time.time(), replace)
+            self._append(INDEX_FILE, (json.dumps(dataclasses.asdict(entry)) + "\n").encode("utf-8"))
+            index.setdefault(collection, []).append(entry)
+            return len(index[collection]) - 1
+
+    def append(self, collection: str, record: Any, schema: str = "data", version: int = 1) -> int:
+        """
+        Appends a record (JSON serializable, pydantic models and dataclasses are converted) to a collection.
+
+        Returns:
+            int: Position of the record in the collection.
+        """
+        return self._add(collection, record, schema, version, replace=False)
+
+    def _read_entry(self, entry: RecordEntry, bodies: bool) -> Any:
+        with open(self._path(RECORDS_FILE), "rb") as f:
+            f.seek(entry.offset)
+            data = f.read(entry.length)
+        return self._resolve_bodies(json.loads(zlib.decompress(data)), bodies)
+
+    def _entries(self, collection: str, schema: Optional[str], version: Optional[int]) -> list[RecordEntry]:
+        with self.lock:
+            entries = self._load_index().get(collection, [])
+        return [entry for entry in entries
+                    if (schema is None or entry.schema == schema) and (version is None or entry.version == version)]
+
+    def read(self, collection: str, position: int, bodies: bool = True) -> Any:
+        """Reads one record of a collection (random access). With bodies=False large texts are returned as TextBody."""
+        return self._read_entry(self._load_index()[collection][position], bodies)
+
+    def iter_records(self, collection: str, schema: Optional[str] = None, version: Optional[int] = None,
+                        bodies: bool = True) -> Iterator[Any]:
+        """Iterates over the records of a collection (one record in memory at a time)."""
+        for entry in self._entries(collection, schema, version):
+            yield self._read_entry(entry, bodies)
+
+    def count(self, collection: str) -> int:
+        with self.lock:
+            return len(self._load_index().get(collection, []))
+
+    def put(self, name: str, data: Any, schema: str = "data", version: int = 1):
+        """Stores an artifact (a new record, earlier versions stay in the file until compact)."""
+        self._add(name, data, schema, version, replace=True)
+
+    def get(self, name: str, schema: Optional[str] = None, version: Optional[int] = None, bodies: bool = True) -> Any:
+        """The latest record of an artifact with matching schema/version (None if there is none)."""
+        entries = self._entries(name, schema, version)
+        return self._read_entry(entries[-1], bodies) if entries else None
+
+    def compact(self) -> int:
+        """
+        Rewrites the store files with only the records that are still used: the latest record of every
+        artifact stored with put and all records of the append collections (text bodies are copied only
+        for the kept records). Not safe while another process writes to the store.
+
+        Returns:
+            int: Number of removed records.
+        """
+        with self.lock:
+            index = self._load_index()
+            if not index:
+                return 0
+
+            compacted = ArtifactStore(join(self.folder, "compact"), self.mmap_threshold)
+            shutil.rmtree(compacted.folder, ignore_errors=True)  # Left by an interrupted compaction
+            removed = 0
+            for collection, entries in index.items():
+                kept = entries[-1:] if entries[-1].replace else entries
+                removed += len(entries) - len(kept)
+                for entry in kept:
+                    compacted._add(collection, self._read_entry(entry, bodies=True), entry.schema, entry.version,
+                                    entry.replace, entry.created_at)
+
+            if self.bodies_map is not None:
+                self.bodies_map.close()
+                self.bodies_map = None
+            for file_name in (RECORDS_FILE, BODIES_FILE, INDEX_FILE):
+                if exists(compacted._path(file_name)):
+                    os.replace(compacted._path(file_name), self._path(file_name))
+                elif exists(self._path(file_name)):
+                    os.remove(self._path(file_name))
+            os.rmdir(compacted.folder)
+            self.index = compacted.index
+            return removed
+
+
+artifact_store = ArtifactStore()
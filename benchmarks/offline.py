@@ -0,0 +1,305 @@
+"""
+Offline replacements for the external services of the research pipeline (used by run_benchmarks.py).
+
+The Gemini client, the Serper searches and the crawled web pages are served from the recorded fixtures
+in benchmarks/fixtures with a synthetic latency, so the pipeline code itself runs unchanged without network.
+"""
+import json
+import time
+import zlib
+import random
+import asyncio
+import threading
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, AsyncIterator, Iterator, Optional
+from unittest import mock
+
+from google.genai import types
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+STREAM_CHUNK_CHARS = 200
+
+
+class CallCounter:
+    """Thread-safe counts of the simulated external calls (per kind, e.g. "gemini.grounding")."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts: Counter = Counter()
+
+    def add(self, kind: str):
+        with self.lock:
+            self.counts[kind] += 1
+
+    def snapshot(self) -> Counter:
+        with self.lock:
+            return Counter(self.counts)
+
+
+class SyntheticLatency:
+    """
+    Latency of the simulated calls: the recorded latency of the fixture times scale, with a seeded jitter.
+    A scale of 0 removes the latency (pure CPU benchmark of the pipeline code).
+    """
+
+    def __init__(self, scale: float = 0.01, jitter: float = 0.2, seed: int = 0):
+        self.scale = scale
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def get(self, recorded: float) -> float:
+        with self.lock:
+            factor = 1 + self.random.uniform(-self.jitter, self.jitter)
+        return max(recorded * self.scale * factor, 0.0)
+
+    async def wait_async(self, recorded: float):
+        if delay := self.get(recorded):
+            await asyncio.sleep(delay)
+
+    def wait(self, recorded: float):
+        if delay := self.get(recorded):
+            time.sleep(delay)
+
+
+def load_fixtures(path: Path = FIXTURES_DIR / "responses.json") -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def get_text(contents) -> str:
+    if isinstance(contents, str):
+        return contents
+    return str(contents)
+
+
+def get_usage(prompt: str, text: str) -> types.GenerateContentResponseUsageMetadata:
+    # Same estimate as context_packer.estimate_tokens (4 characters per token)
+    prompt_tokens, completion_tokens = len(prompt) // 4, len(text) // 4
+    return types.GenerateContentResponseUsageMetadata(
+        prompt_token_count=prompt_tokens,
+        candidates_token_count=completion_tokens,
+        total_token_count=prompt_tokens + completion_tokens)
+
+
+def text_response(prompt: str, text: str) -> types.GenerateContentResponse:
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role="model", parts=[types.Part(text=text)]),
+                                    finish_reason=types.FinishReason.STOP)],
+        usage_metadata=get_usage(prompt, text))
+
+
+class FakeGemini:
+    """
+    Answers Gemini calls from the fixtures: google search grounding (picked by a hash of the query, so the same
+    query always gets the same answer), structured query plans, summaries and the report of the chats.
+    """
+
+    def __init__(self, fixtures: dict, latency: SyntheticLatency, calls: CallCounter):
+        self.fixtures = fixtures
+        self.latency = latency
+        self.calls = calls
+
+    def get_response(self, contents, config: Optional[types.GenerateContentConfig]) -> tuple[float, types.GenerateContentResponse]:
+        prompt = get_text(contents)
+        if config and config.tools:
+            self.calls.add("gemini.grounding")
+            grounding = self.fixtures["grounding"]
+            # The search prompt starts with the current date/time, only the query picks the answer
+            query = prompt.rsplit("Search Query:", 1)[-1].strip()
+            fixture = grounding[zlib.crc32(query.encode("utf-8")) % len(grounding)]
+            response = types.GenerateContentResponse.model_validate(fixture["response"])
+            response.usage_metadata = get_usage(prompt, response.text)
+            return fixture["latency"], response
+
+        if config and config.response_schema:
+            self.calls.add("gemini.plan")
+            plan = self.fixtures["plan"]
+            return plan["latency"], text_response(prompt, json.dumps({"queries": plan["queries"]}))
+
+        self.calls.add("gemini.generate")
+        summary = self.fixtures["summary"]
+        return summary["latency"], text_response(prompt, summary["text"])
+
+    def generate_content(self, model: str, contents, config: Optional[types.GenerateContentConfig] = None):
+        recorded, response = self.get_response(contents, config)
+        self.latency.wait(recorded)
+        return response
+
+    async def generate_content_async(self, model: str, contents, config: Optional[types.GenerateContentConfig] = None):
+        recorded, response = self.get_response(contents, config)
+        await self.latency.wait_async(recorded)
+        return response
+
+    def report_chunks(self, prompt: str) -> Iterator[types.GenerateContentResponse]:
+        text = self.fixtures["report"]["text"]
+        for k in range(0, len(text), STREAM_CHUNK_CHARS):
+            yield text_response(prompt, text[k:k + STREAM_CHUNK_CHARS])
+
+
+class FakeChat:
+    def __init__(self, gemini: FakeGemini):
+        self.gemini = gemini
+
+    def send_message(self, message: str):
+        self.gemini.calls.add("gemini.chat")
+        report = self.gemini.fixtures["report"]
+        self.gemini.latency.wait(report["latency"])
+        return text_response(get_text(message), report["text"])
+
+    def send_message_stream(self, message: str) -> Iterator[types.GenerateContentResponse]:
+        self.gemini.calls.add("gemini.chat")
+        chunks = list(self.gemini.report_chunks(get_text(message)))
+        delay = self.gemini.fixtures["report"]["latency"] / len(chunks)
+        for chunk in chunks:
+            self.gemini.latency.wait(delay)
+            yield chunk
+
+
+class FakeAsyncChat(FakeChat):
+    async def send_message(self, message: str):
+        self.gemini.calls.add("gemini.chat")
+        report = self.gemini.fixtures["report"]
+        await self.gemini.latency.wait_async(report["latency"])
+        return text_response(get_text(message), report["text"])
+
+    async def send_message_stream(self, message: str) -> AsyncIterator[types.GenerateContentResponse]:
+        self.gemini.calls.add("gemini.chat")
+        chunks = list(self.gemini.report_chunks(get_text(message)))
+        delay = self.gemini.fixtures["report"]["latency"] / len(chunks)
+
+        async def stream():
+            for chunk in chunks:
+                await self.gemini.latency.wait_async(delay)
+                yield chunk
+        return stream()
+
+
+class FakeModels:
+    def __init__(self, gemini: FakeGemini):
+        self.generate_content = gemini.generate_content
+
+
+class FakeAsyncModels:
+    def __init__(self, gemini: FakeGemini):
+        self.generate_content = gemini.generate_content_async
+
+
+class FakeChats:
+    def __init__(self, gemini: FakeGemini, chat_type: type):
+        self.gemini = gemini
+        self.chat_type = chat_type
+
+    def create(self, model: str, history: Any = None, config: Any = None):
+        return self.chat_type(self.gemini)
+
+
+class FakeAio:
+    def __init__(self, gemini: FakeGemini):
+        self.models = FakeAsyncModels(gemini)
+        self.chats = FakeChats(gemini, FakeAsyncChat)
+
+
+class FakeGenaiClient:
+    """Drop-in replacement of genai.Client for the calls the pipeline makes (models, chats and their aio versions)."""
+
+    def __init__(self, gemini: FakeGemini):
+        self.models = FakeModels(gemini)
+        self.chats = FakeChats(gemini, FakeChat)
+        self.aio = FakeAio(gemini)
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    server: "PageServer"
+
+    def do_GET(self):
+        page = self.server.pages.get(self.path.lstrip("/"))
+        self.server.calls.add("http.page")
+        self.server.latency.wait(self.server.recorded_latency)
+        if page is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(page)))
+        self.end_headers()
+        self.wfile.write(page)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PageServer(ThreadingHTTPServer):
+    """Serves the recorded web pages (fixtures/pages) on localhost, so crawling runs the real download and conversion."""
+
+    daemon_threads = True
+
+    def __init__(self, latency: SyntheticLatency, calls: CallCounter, recorded_latency: float,
+                    pages_dir: Path = FIXTURES_DIR / "pages"):
+        super().__init__(("127.0.0.1", 0), PageHandler)
+        self.latency = latency
+        self.calls = calls
+        self.recorded_latency = recorded_latency
+        self.pages = {path.name: path.read_bytes() for path in sorted(pages_dir.glob("*.html"))}
+
+    @property
+    def urls(self) -> list[str]:
+        host, port = self.server_address[:2]
+        return [f"http://{host}:{port}/{name}" for name in self.pages]
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+class OfflineServices:
+    """The simulated external services of one benchmark run (shared fixtures, latency and call counts)."""
+
+    def __init__(self, fixtures: dict, latency: SyntheticLatency):
+        self.fixtures = fixtures
+        self.latency = latency
+        self.calls = CallCounter()
+        self.gemini = FakeGemini(fixtures, latency, self.calls)
+        self.client = FakeGenaiClient(self.gemini)
+
+    async def scholar_search_async(self, search_query: str, num_pages: int = 1) -> list[dict]:
+        self.calls.add("serper.scholar")
+        await self.latency.wait_async(self.fixtures["scholar"]["latency"])
+        return list(self.fixtures["scholar"]["items"])
+
+    async def news_search_async(self, search_query: str, num_pages: int = 1) -> list[dict]:
+        self.calls.add("serper.news")
+        await self.latency.wait_async(self.fixtures["news"]["latency"])
+        return list(self.fixtures["news"]["items"])
+
+    def page_server(self) -> PageServer:
+        return PageServer(self.latency, self.calls, self.fixtures["page_latency"])
+
+    @contextmanager
+    def patched(self):
+        """Routes the pipeline's Gemini clients, chats and Serper searches to the fixtures."""
+        import extensive_search
+        from agent_tools import ReasoningModelAsync
+
+        get_reasoning_chat_async = extensive_search.get_reasoning_chat_async
+
+        def offline_reasoning_chat() -> ReasoningModelAsync:
+            chat = get_reasoning_chat_async()
+            chat.client = self.client
+            chat.reset()
+            return chat
+
+        with ExitStack() as stack:
+            stack.enter_context(mock.patch.object(extensive_search, "geminiClient", self.client))
+            stack.enter_context(mock.patch.object(extensive_search.basicSearchAgent, "client", self.client))
+            stack.enter_context(mock.patch.object(extensive_search, "get_reasoning_chat_async", offline_reasoning_chat))
+            stack.enter_context(mock.patch.object(extensive_search, "google_scholar_search_async", self.scholar_search_async))
+            stack.enter_context(mock.patch.object(extensive_search, "google_news_search_async", self.news_search_async))
+            yield self
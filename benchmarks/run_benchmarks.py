@@ -0,0 +1,328 @@
+"""
+Offline end-to-end benchmarks of the research pipeline.
+
+Every stage runs the real pipeline code against the recorded fixtures in benchmarks/fixtures (see offline.py),
+with the recorded API latencies scaled by --latency-scale. Per stage the wall time, throughput, peak RSS and
+the number of simulated external calls are reported and saved as JSON, so runs can be compared over time.
+
+Usage:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --latency-scale 0 --repeat 5     # CPU time of the pipeline code only
+    python benchmarks/run_benchmarks.py --stages crawl export_pdf
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/benchmark_20250301-120000.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+from contextlib import redirect_stdout, nullcontext
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = REPO_DIR / "benchmarks" / "results"
+sys.path.insert(0, str(REPO_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from offline import OfflineServices, SyntheticLatency, load_fixtures
+
+
+@dataclass
+class StageResult:
+    name: str
+    runs: int
+    items: int  # work items of one run (queries, pages, tasks, ...)
+    wall_times: list[float] = field(default_factory=list)
+    peak_rss_mb: float = 0.0
+    calls: dict[str, int] = field(default_factory=dict)  # simulated external calls (all runs)
+    error: Optional[str] = None
+
+    @property
+    def wall_time(self) -> float:
+        return sum(self.wall_times)
+
+    @property
+    def throughput(self) -> float:
+        """Work items per second."""
+        return len(self.wall_times) * self.items / self.wall_time if self.wall_time else 0.0
+
+    def to_dict(self) -> dict:
+        return asdict(self) | {
+            "wall_time": self.wall_time,
+            "wall_time_mean": self.wall_time / len(self.wall_times) if self.wall_times else None,
+            "wall_time_min": min(self.wall_times, default=None),
+            "throughput": self.throughput,
+        }
+
+
+def reset_peak_rss() -> bool:
+    """Resets the peak RSS of the process (Linux only), so every stage reports its own peak."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def get_peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Peak of the whole process (ru_maxrss is in kB on Linux)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class BenchmarkContext:
+    """State shared by the stages (offline services, work directory and the inputs of the later stages)."""
+
+    def __init__(self, services: OfflineServices, workdir: Path, max_searches: int, tasks: int):
+        self.services = services
+        self.workdir = workdir
+        self.max_searches = max_searches
+        self.tasks = tasks
+        self.query = services.fixtures["query"]
+        self.report = services.fixtures["report"]["text"]
+        self.search_results = None
+
+    @property
+    def planned_queries(self) -> list[str]:
+        return [planned_query["query"] for planned_query in self.services.fixtures["plan"]["queries"]]
+
+    def get_search_results(self) -> list:
+        if self.search_results is None:
+            bench_citations(self)
+        return self.search_results
+
+
+def noop_task() -> str:
+    return "done"
+
+
+def bench_task_manager(ctx: BenchmarkContext) -> int:
+    """TaskManager lifecycle of ctx.tasks tasks: add, checkpoints, start/complete, queries and removal."""
+    from task_manager import TaskManager
+
+    manager = TaskManager(db_path=str(ctx.workdir / "benchmark_tasks.db"))
+    task_ids = []
+    for k in range(ctx.tasks):
+        task_id = manager.add_task(f"{ctx.query} ({k})", "Benchmark")
+        for stage in ("plan", "context", "report"):
+            manager.save_checkpoint(task_id, stage, "data", ctx.report)
+        manager.load_checkpoints(task_id, "context")
+        manager.start_task(task_id, noop_task)
+        if thread := manager.running_tasks.get(task_id):
+            thread.join()
+        manager.get_task(task_id)
+        task_ids.append(task_id)
+
+    manager.get_all_tasks()
+    manager.get_unfinished_tasks()
+    for task_id in task_ids:
+        manager.remove_task(task_id)
+    return ctx.tasks
+
+
+def bench_citations(ctx: BenchmarkContext) -> int:
+    """BasicSearchModel searches of all planned queries: grounding citations, merged answers and rendering."""
+    import extensive_search
+    from config import Config
+
+    semaphore = asyncio.Semaphore(Config().SEARCH_CONCURRENCY)
+
+    async def search(query: str):
+        async with semaphore:
+            result = await extensive_search.basicSearchAgent.search_async(query)
+            result.render()
+            return result
+
+    async def search_all():
+        return list(await asyncio.gather(*(search(query) for query in ctx.planned_queries)))
+
+    ctx.search_results = asyncio.run(search_all())
+    return len(ctx.search_results)
+
+
+def bench_search_result_text(ctx: BenchmarkContext) -> int:
+    """Packing the search results into the report prompt (merged references, token budget)."""
+    from extensive_search import get_search_result_text
+
+    results = ctx.get_search_results()
+    get_search_result_text(results, ctx.query)
+    return len(results)
+
+
+def bench_crawl(ctx: BenchmarkContext) -> int:
+    """Download and markdown conversion of the recorded pages (served on localhost)."""
+    from agent_tools import crawl4ai_website_async
+    from config import Config
+
+    semaphore = asyncio.Semaphore(Config().CRAWL_CONCURRENCY)
+
+    async def crawl(url: str) -> str:
+        async with semaphore:
+            return await crawl4ai_website_async(url)
+
+    with ctx.services.page_server() as server:
+        async def crawl_all():
+            return await asyncio.gather(*(crawl(url) for url in server.urls))
+
+        texts = asyncio.run(crawl_all())
+
+    if not all(texts):
+        raise RuntimeError("A page was converted to an empty text")
+    return len(texts)
+
+
+def bench_run_research(ctx: BenchmarkContext) -> int:
+    """The full research pipeline (run_research): planning, searches, retrieval and report."""
+    from extensive_search import run_research
+
+    run_research(ctx.query, ctx.max_searches)
+    return 1
+
+
+def get_export_benchmark(exporter_name: str, suffix: str, tabular: bool = False) -> Callable[[BenchmarkContext], int]:
+    def bench_export(ctx: BenchmarkContext) -> int:
+        import extensive_search
+
+        content = [{"result": ctx.report}] if tabular else ctx.report
+        getattr(extensive_search, exporter_name)(content, str(ctx.workdir / f"report{suffix}"))
+        return 1
+
+    bench_export.__doc__ = f"{exporter_name} of the recorded report."
+    return bench_export
+
+
+STAGES: dict[str, Callable[[BenchmarkContext], int]] = {
+    "task_manager": bench_task_manager,
+    "citations": bench_citations,
+    "search_result_text": bench_search_result_text,
+    "crawl": bench_crawl,
+    "run_research": bench_run_research,
+    "export_markdown": get_export_benchmark("save_in_markdown", ".md"),
+    "export_csv": get_export_benchmark("save_in_csv", ".csv", tabular=True),
+    "export_excel": get_export_benchmark("save_in_excel", ".xlsx", tabular=True),
+    "export_pdf": get_export_benchmark("save_in_pdf", ".pdf"),
+    "export_html": get_export_benchmark("save_in_html", ".html"),
+}
+
+
+def run_stage(name: str, ctx: BenchmarkContext, repeat: int, warmup: int, verbose: bool) -> StageResult:
+    bench = STAGES[name]
+    result = StageResult(name=name, runs=repeat, items=0)
+    output = nullcontext() if verbose else redirect_stdout(io.StringIO())
+
+    with output:
+        try:
+            for _ in range(warmup):
+                bench(ctx)
+            calls_before = ctx.services.calls.snapshot()
+            reset_peak_rss()
+            for _ in range(repeat):
+                start = time.perf_counter()
+                result.items = bench(ctx)
+                result.wall_times.append(time.perf_counter() - start)
+            result.calls = dict(ctx.services.calls.snapshot() - calls_before)
+        except Exception as e:
+            result.error = f"{type(e).__name__}: {e}"
+
+    result.peak_rss_mb = get_peak_rss_mb()
+    return result
+
+
+def get_git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_calls(calls: dict[str, int]) -> str:
+    return ", ".join(f"{kind}={count}" for kind, count in sorted(calls.items())) or "-"
+
+
+def print_results(results: list[StageResult], previous: Optional[dict] = None):
+    previous_stages = {stage["name"]: stage for stage in (previous or {}).get("stages", [])}
+    print(f"\n{'stage':<20} {'runs':>4} {'items':>5} {'mean s':>9} {'items/s':>9} {'peak MB':>8}  calls")
+    for result in results:
+        if result.error:
+            print(f"{result.name:<20} failed: {result.error}")
+            continue
+        stage = result.to_dict()
+        line = (f"{result.name:<20} {result.runs:>4} {result.items:>5} {stage['wall_time_mean']:>9.3f} "
+                f"{result.throughput:>9.1f} {result.peak_rss_mb:>8.1f}  {format_calls(result.calls)}")
+        if (before := previous_stages.get(result.name)) and before.get("wall_time_mean"):
+            line += f"  ({stage['wall_time_mean'] / before['wall_time_mean'] - 1:+.1%} vs. previous)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmarks of the research pipeline.")
+    parser.add_argument("-s", "--stages", nargs="+", choices=list(STAGES), default=list(STAGES), help="Stages to run (default: all).")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Measured runs per stage.")
+    parser.add_argument("-w", "--warmup", type=int, default=1, help="Unmeasured runs per stage before the measured runs.")
+    parser.add_argument("-l", "--latency-scale", type=float, default=0.01, help="Factor on the recorded API latencies (0 = no latency).")
+    parser.add_argument("-j", "--jitter", type=float, default=0.2, help="Relative random jitter of the latencies.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the latency jitter.")
+    parser.add_argument("-m", "--max-searches", type=int, default=5, help="max_searches of the run_research stage.")
+    parser.add_argument("-t", "--tasks", type=int, default=50, help="Tasks of the task_manager stage.")
+    parser.add_argument("-o", "--output", type=Path, help="Result file (default: benchmarks/results/benchmark_<time>.json).")
+    parser.add_argument("-c", "--compare", type=Path, help="Previous result file to compare the wall times with.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show the output of the pipeline.")
+    args = parser.parse_args()
+
+    started_at = datetime.now()
+    output = (args.output or RESULTS_DIR / f"benchmark_{started_at:%Y%m%d-%H%M%S}.json").resolve()
+    previous = json.loads(args.compare.read_text(encoding="utf-8")) if args.compare else None
+
+    # The pipeline modules create their databases in the working directory on import, so they are
+    # imported inside a temporary directory. No API keys are needed, all clients are replaced.
+    os.environ.setdefault("GEMINI_API_KEY", "offline-benchmark")
+    os.environ.setdefault("TELEMETRY_SPAN_FILE", "")
+    with tempfile.TemporaryDirectory(prefix="research_benchmark_") as workdir:
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            services = OfflineServices(load_fixtures(), SyntheticLatency(args.latency_scale, args.jitter, args.seed))
+            ctx = BenchmarkContext(services, Path(workdir), args.max_searches, args.tasks)
+            with services.patched():
+                results = []
+                for name in args.stages:
+                    print(f"Running {name} ...")
+                    results.append(run_stage(name, ctx, args.repeat, args.warmup, args.verbose))
+        finally:
+            os.chdir(cwd)
+
+    print_results(results, previous)
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    report = {
+        "started_at": started_at.isoformat(timespec="seconds"),
+        "git_commit": get_git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()},
+        "stages": [result.to_dict() for result in results],
+    }
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"\nResults saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
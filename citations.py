@@ -0,0 +1,241 @@
+import re
+import json
+from dataclasses import dataclass, field, asdict
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+CITATION_PATTERN = re.compile(r"\s?\[(\d+)\]")
+# Query keys that are dropped for deduplication (exact keys, only utm_ is matched as prefix)
+TRACKING_PARAMETERS = {"fbclid", "gclid", "ref", "source"}
+TRACKING_PREFIX = "utm_"
+
+
+def canonical_url(url: str) -> str:
+    """Normalizes a URL for deduplication (scheme/host case, fragment, tracking parameters, trailing slash)."""
+    parts = urlsplit(url.strip())
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                if key.lower() not in TRACKING_PARAMETERS and not key.lower().startswith(TRACKING_PREFIX)]
+    path = parts.path.rstrip("/") or "/"
+    host = parts.netloc.lower().removeprefix("www.")
+    return urlunsplit((parts.scheme.lower(), host, path, urlencode(query), ""))
+
+
+class ReferenceTable:
+    """
+    Global reference list: every URL gets one citation number, no matter how many results cite it.
+    """
+
+    def __init__(self):
+        self.ids: dict[str, int] = {}
+        self.titles: dict[int, str] = {}
+        self.urls: dict[int, str] = {}
+
+    def add(self, url: str, title: str = "") -> int:
+        key = canonical_url(url)
+        if key not in self.ids:
+            ref_id = len(self.ids) + 1
+            self.ids[key] = ref_id
+            self.urls[ref_id] = url
+            self.titles[ref_id] = title
+        elif title and not self.titles[self.ids[key]]:
+            self.titles[self.ids[key]] = title
+
+        return self.ids[key]
+
+    def format(self, ref_ids: Optional[set[int]] = None) -> str:
+        lines = []
+        for ref_id, url in self.urls.items():
+            if ref_ids is None or ref_id in ref_ids:
+                title = self.titles[ref_id]
+                lines.append(f"[{ref_id}] {title} {url}" if title else f"[{ref_id}] {url}")
+        return "\n".join(lines)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+@dataclass
+class CitationSource:
+    ref_id: int  # Citation number (local to the CitedText)
+    url: str
+    title: str = ""
+
+
+@dataclass
+class CitationSpan:
+    start: int  # Character offsets in CitedText.text
+    end: int
+    ref_ids: list[int] = field(default_factory=list)
+
+
+@dataclass
+class CitedText:
+    """
+    An answer with its citations as data: plain text, cited spans (character offsets) and sources.
+    The citation markers are only added when the text is rendered.
+    """
+    text: str
+    spans: list[CitationSpan] = field(default_factory=list)
+    sources: list[CitationSource] = field(default_factory=list)
+    provider: str = "google"
+
+    def render(self, id_map: Optional[dict[int, int]] = None) -> str:
+        """Text with citation markers after every cited span (optionally with renumbered citations)."""
+        id_map = id_map or {}
+        markers: dict[int, list[int]] = {}
+        for span in self.spans:
+            ids = markers.setdefault(span.end, [])
+            for ref_id in span.ref_ids:
+                ref_id = id_map.get(ref_id, ref_id)
+                if ref_id not in ids:
+                    ids.append(ref_id)
+
+        pieces, previous = [], 0
+        for end in sorted(markers):
+            pieces.append(self.text[previous:end])
+            pieces.append(" " + "".join(f"[{ref_id}]" for ref_id in markers[end]))
+            previous = end
+        pieces.append(self.text[previous:])
+        return "".join(pieces)
+
+    def render_references(self, id_map: Optional[dict[int, int]] = None) -> str:
+        id_map = id_map or {}
+        lines = []
+        for source in self.sources:
+            title = f"{source.title} " if source.title else ""
+            lines.append(f"[{id_map.get(source.ref_id, source.ref_id)}] {title}{source.url}")
+        return "\n".join(lines)
+
+    def register(self, references: ReferenceTable) -> dict[int, int]:
+        """Adds the sources to the global reference table and returns the local -> global id map."""
+        return {source.ref_id: references.add(source.url, source.title) for source in self.sources}
+
+
+def byte_to_char_offsets(text: str, byte_offsets: set[int]) -> dict[int, int]:
+    """Converts UTF-8 byte offsets to character offsets in one pass over the text."""
+    result = {}
+    remaining = sorted(byte_offsets)
+    position = 0
+    k = 0
+    for char_index, char in enumerate(text):
+        while k < len(remaining) and remaining[k] <= position:
+            result[remaining[k]] = char_index
+            k += 1
+        if k == len(remaining):
+            return result
+        position += len(char.encode("utf-8"))
+
+    for offset in remaining[k:]:
+        result[offset] = len(text)
+    return result
+
+
+def splice_grounding_citations(text: str, grounding_supports, grounding_chunks) -> CitedText:
+    """
+    Builds the cited text of a google grounding response from the segment offsets
+    (segment.start_index/end_index are UTF-8 byte offsets), linear in the text length.
+    """
+    grounding_supports = grounding_supports or []
+    offsets = set()
+    for support in grounding_supports:
+        offsets.add(support.segment.start_index or 0)
+        offsets.add(support.segment.end_index or 0)
+    char_offsets = byte_to_char_offsets(text, offsets)
+
+    spans = [
+        CitationSpan(
+            start=char_offsets[support.segment.start_index or 0],
+            end=char_offsets[support.segment.end_index or 0],
+            ref_ids=[k + 1 for k in support.grounding_chunk_indices])
+        for support in grounding_supports
+    ]
+    sources = [
+        CitationSource(ref_id=k + 1, url=chunk.web.uri, title=chunk.web.title or "")
+        for k, chunk in enumerate(grounding_chunks or [])
+    ]
+    return CitedText(text=text, spans=spans, sources=sources, provider="google")
+
+
+def splice_grounding_parts(part_texts: list[str], grounding_supports, grounding_chunks) -> CitedText:
+    """
+    Builds the cited text of a google grounding response with several content parts: the segment offsets
+    are relative to their part (segment.part_index), so every part is spliced on its own before joining.
+    """
+    grounding_supports = grounding_supports or []
+    text, spans = "", []
+    for part_index, part_text in enumerate(part_texts):
+        supports = [support for support in grounding_supports if (support.segment.part_index or 0) == part_index]
+        cited = splice_grounding_citations(part_text, supports, grounding_chunks)
+        spans.extend(CitationSpan(start=len(text) + span.start, end=len(text) + span.end, ref_ids=span.ref_ids)
+                        for span in cited.spans)
+        text += part_text
+
+    sources = splice_grounding_citations("", [], grounding_chunks).sources
+    return CitedText(text=text, spans=spans, sources=sources, provider="google")
+
+
+def parse_marked_citations(text: str, urls: list[str], provider: str = "perplexity") -> CitedText:
+    """
+    Builds the cited text of an answer that already contains [n] markers (e.g., Perplexity),
+    where [n] refers to urls[n-1]. Markers without a url are removed (after the global renumbering
+    they would point at an unrelated source).
+    """
+    pieces, spans, previous, length = [], [], 0, 0
+    for match in CITATION_PATTERN.finditer(text):
+        ref_id = int(match.group(1))
+        pieces.append(text[previous:match.start()])
+        length += match.start() - previous
+        previous = match.end()
+        if not 1 <= ref_id <= len(urls):
+            continue
+
+        if spans and spans[-1].end == length:
+            spans[-1].ref_ids.append(ref_id)
+        else:
+            spans.append(CitationSpan(start=length, end=length, ref_ids=[ref_id]))
+    pieces.append(text[previous:])
+
+    sources = [CitationSource(ref_id=k + 1, url=url) for k, url in enumerate(urls)]
+    return CitedText(text="".join(pieces), spans=spans, sources=sources, provider=provider)
+
+
+@dataclass
+class SearchResult:
+    """
+    Structured result of one search query (google grounding answer and optional Perplexity answer).
+    """
+    query: str
+    answers: list[CitedText] = field(default_factory=list)
+
+    def render(self) -> str:
+        """Text with the local citation numbers of every answer and its reference list."""
+        parts = []
+        for answer in self.answers:
+            parts.append(f"{answer.provider.title()} Search Results:\n\n{answer.render()}")
+            if answer.sources:
+                parts.append(f"References:\n\n{answer.render_references()}")
+        return "\n\n".join(parts)
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def from_json(cls, data: str) -> "SearchResult":
+        result = json.loads(data)
+        return cls(query=result["query"], answers=[
+            CitedText(
+                text=answer["text"],
+                spans=[CitationSpan(**span) for span in answer["spans"]],
+                sources=[CitationSource(**source) for source in answer["sources"]],
+                provider=answer["provider"])
+            for answer in result["answers"]
+        ])
+
+    def render_with_references(self, references: ReferenceTable) -> tuple[str, set[int]]:
+        """Text with global citation numbers (without reference list) and the global ids it cites."""
+        parts, used = [], set()
+        for answer in self.answers:
+            id_map = answer.register(references)
+            parts.append(answer.render(id_map))
+            used |= {id_map[ref_id] for span in answer.spans for ref_id in span.ref_ids if ref_id in id_map}
+        return "\n\n".join(parts), used
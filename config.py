@@ -7,11 +7,14 @@ class Config(BaseSettings):
     MAX_RETRIES: int = Field(default=3)
     REQUEST_TIMEOUT: int = Field(default=10)
     CRAWL_CONCURRENCY: int = Field(default=5)
+    SEARCH_CONCURRENCY: int = Field(default=5)
     PAPERS_PER_PAGE: int = Field(default=200)
     
     # API endpoints
     PERPLEXITY_BASE_URL: str = Field(default="https://api.perplexity.ai")
     SERPER_BASE_URL: str = Field(default="https://google.serper.dev/search")
+    SERPER_SCHOLAR_URL: str = Field(default="https://google.serper.dev/scholar")
+    SERPER_NEWS_URL: str = Field(default="https://google.serper.dev/news")
     OPENROUTER_BASE_URL: str = Field(default="https://openrouter.ai/api/v1")
     DEEPSEEK_BASE_URL: str = Field(default="https://api.deepseek.com")
 
@@ -48,6 +51,113 @@ class Config(BaseSettings):
 
     BASEAGENT_MODEL:str = Field(default='gemini-2.0-flash') 
 
+    # Token budget for the search results in the report prompt (estimated locally)
+    REPORT_CONTEXT_TOKENS: int = Field(default=120000)
+
+    # Map-reduce report generation (switched on above MAP_REDUCE_TOKEN_THRESHOLD)
+    MAP_REDUCE_TOKEN_THRESHOLD: int = Field(default=30000)
+    MAP_REDUCE_GROUP_TOKENS: int = Field(default=15000)
+    MAP_REDUCE_CONCURRENCY: int = Field(default=5)
+
+    # Model router: JSONL log of the routing decisions, e.g. "router_decisions.jsonl" (None = keep the last ones in memory only)
+    ROUTER_DECISION_LOG: Optional[str] = Field(default=None)
+
+    # Micro-batching of small LLM calls (URL rating, relevance checks)
+    BATCH_WINDOW: float = Field(default=0.2)
+    BATCH_MAX_SIZE: int = Field(default=20)
+
+    # Gemini context caching of the research corpus (multi-call runs)
+    CORPUS_CACHE_MODEL: str = Field(default="gemini-2.0-flash-001")
+    CORPUS_CACHE_MIN_TOKENS: int = Field(default=4096)  # minimum cached content size of the gemini 2.0 flash models
+    CORPUS_CACHE_TTL: int = Field(default=1800)
+
+    # Per-provider deadlines (seconds) of the concurrent google grounding + Perplexity search
+    GOOGLE_SEARCH_DEADLINE: float = Field(default=60)
+    PERPLEXITY_SEARCH_DEADLINE: float = Field(default=45)
+
+    # Pooled gateway for the OpenAI-compatible providers (Perplexity, OpenRouter, DeepSeek)
+    LLM_REQUEST_TIMEOUT: float = Field(default=600)
+    LLM_MAX_CONNECTIONS: int = Field(default=20)
+    PERPLEXITY_RPM: int = Field(default=50)
+    OPENROUTER_RPM: int = Field(default=20)
+    DEEPSEEK_RPM: int = Field(default=60)
+
+    # Task manager: running tasks are kept alive by a heartbeat of their process (seconds),
+    # only tasks without a heartbeat for TASK_HEARTBEAT_TIMEOUT are recovered by another process
+    TASK_HEARTBEAT_INTERVAL: float = Field(default=30)
+    TASK_HEARTBEAT_TIMEOUT: float = Field(default=120)
+
+    # Perplexity deep research as async job (seconds between status polls, max. job duration)
+    DEEP_RESEARCH_POLL_INTERVAL: float = Field(default=15)
+    DEEP_RESEARCH_TIMEOUT: float = Field(default=3600)
+
+    # Research graph (iterative multi-branch research, see research_dag.py)
+    DAG_CONCURRENCY: int = Field(default=8)
+    DAG_SEARCH_RPM: int = Field(default=30)
+    DAG_LLM_RPM: int = Field(default=15)
+    DAG_MAX_DEPTH: int = Field(default=2)
+    DAG_MAX_NODES: int = Field(default=80)
+    DAG_MAX_SECONDS: float = Field(default=900)
+    DAG_MIN_NOVELTY: float = Field(default=0.2)
+    DAG_QUERIES_PER_ROUND: int = Field(default=6)
+    DAG_QUERIES_PER_FOLLOW_UP: int = Field(default=3)
+    DAG_FOLLOW_UPS_PER_ROUND: int = Field(default=3)
+    DAG_CRAWLS_PER_SEARCH: int = Field(default=2)
+    DAG_CRAWL_TOKENS: int = Field(default=4000)
+
+    # Artifact store for research intermediates (replaces the pickle files of save_data/load_data)
+    ARTIFACT_DIR: str = Field(default="temp_data")
+    ARTIFACT_MMAP_THRESHOLD: int = Field(default=65536)
+    ARTIFACT_COMPRESSION_LEVEL: int = Field(default=6)
+
+    # Document store of crawled pages (shared by all tasks, SQLite FTS5)
+    DOCUMENT_DB_PATH: str = Field(default="documents.db")
+    DOCUMENT_STORE_SEED_RESULTS: int = Field(default=5)  # stored documents a new research run starts with
+
+    # Passage retrieval before the report (BM25 + local embeddings, best passages within the token budget)
+    PASSAGE_TOKENS: int = Field(default=250)
+    RETRIEVAL_CONTEXT_TOKENS: int = Field(default=24000)
+    RETRIEVAL_EMBEDDINGS: bool = Field(default=True)
+    RETRIEVAL_EMBEDDING_DIM: int = Field(default=512)
+    RETRIEVAL_EMBEDDING_WEIGHT: float = Field(default=0.3)
+    RETRIEVAL_QUERY_WEIGHT: float = Field(default=0.5)  # user query vs. best matching planned query
+    RETRIEVAL_MIN_SCORE: float = Field(default=0.1)  # relative to the best passage
+
+    # Local ranking of search hits before crawling (no LLM calls unless RANKER_LLM_JUDGE is switched on)
+    RANKER_RELEVANCE_WEIGHT: float = Field(default=0.5)  # BM25 of title + snippet
+    RANKER_DOMAIN_WEIGHT: float = Field(default=0.25)
+    RANKER_FRESHNESS_WEIGHT: float = Field(default=0.15)
+    RANKER_POSITION_WEIGHT: float = Field(default=0.1)
+    RANKER_HALF_LIFE_DAYS: float = Field(default=365)
+    CRAWL_TOP_N: int = Field(default=4)  # crawled hits per search
+    RANKER_LLM_JUDGE: bool = Field(default=False)  # (batched) LLM rating of the hits the local score can't separate
+    RANKER_LLM_MARGIN: float = Field(default=0.05)  # hits this close to the cutoff score are rated
+    RANKER_LLM_MAX_HITS: int = Field(default=4)
+    RANKER_LLM_WEIGHT: float = Field(default=0.5)  # LLM rating vs. local score of a judged hit
+
+    # Adaptive search depth: searches run in batches until a batch brings (almost) nothing new
+    ADAPTIVE_SEARCH: bool = Field(default=True)
+    ADAPTIVE_BATCH_SIZE: int = Field(default=3)
+    ADAPTIVE_MIN_NOVELTY: float = Field(default=0.25)
+    ADAPTIVE_MAX_FACTOR: float = Field(default=2.0)  # up to max_searches * factor searches while novelty stays high
+    MINHASH_PERMUTATIONS: int = Field(default=64)
+    MINHASH_BANDS: int = Field(default=16)
+    NOVELTY_DUPLICATE_JACCARD: float = Field(default=0.5)  # passages above this similarity are not new
+
+    # Query set optimization: the planner proposes more queries, paraphrases are clustered and pruned
+    QUERY_OVERPLAN_FACTOR: float = Field(default=1.5)
+    QUERY_CLUSTER_SIMILARITY: float = Field(default=0.65)  # cosine similarity of the local query embeddings
+
+    # Telemetry: spans through logfire/OpenTelemetry (head sampling, local JSONL export), Prometheus text metrics
+    TELEMETRY_ENABLED: bool = Field(default=True)
+    TELEMETRY_SAMPLE_RATE: float = Field(default=0.25)  # share of traces that are recorded (metrics count everything)
+    TELEMETRY_SPAN_FILE: Optional[str] = Field(default="telemetry_spans.jsonl")  # offline exporter (None = off)
+    METRICS_PORT: Optional[int] = Field(default=None)  # serves /metrics (None = off)
+
+    # Reasoning chat sessions (None = keep the full history of a session)
+    REASONING_MAX_HISTORY_TURNS: Optional[int] = Field(default=None)
+    REASONING_SUMMARIZE_HISTORY: bool = Field(default=False)
+
     model_config = ConfigDict(env_file = ".env", extra = "ignore")
     # class Config:
     #     env_file = ".env"
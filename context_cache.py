@@ -0,0 +1,93 @@
+import time
+from typing import Optional
+
+from google import genai
+from google.genai import types
+
+from config import Config
+from context_packer import estimate_tokens
+from model_router import model_router
+
+config = Config()
+
+
+class CorpusCache:
+    """
+    Uploads the source corpus of a research run once as Gemini cached content,
+    so later calls (follow-up questions, per-section writing, ...) only send their own prompt.
+
+    Use it as async context manager, the cache is deleted when the run is done (the TTL covers crashes).
+    Corpora below config.CORPUS_CACHE_MIN_TOKENS (or a failed cache creation) fall back to sending the corpus inline.
+    """
+
+    def __init__(self, corpus: str, system_instruction: Optional[str] = None,
+                    model_name: str = config.CORPUS_CACHE_MODEL, ttl: int = config.CORPUS_CACHE_TTL,
+                    client: Optional[genai.Client] = None):
+        """
+        Args:
+            corpus (str): The source corpus (e.g., the packed search results).
+            system_instruction (Optional[str]): System instruction stored with the cache.
+            model_name (str): Model of the cache (caching needs a stable model version).
+            ttl (int): Time to live of the cache in seconds.
+            client (Optional[genai.Client]): Gemini client (a new one is created if not given).
+        """
+        self.corpus = corpus
+        self.system_instruction = system_instruction
+        self.model_name = model_name
+        self.ttl = ttl
+        self.client = client or genai.Client(api_key=config.GEMINI_API_KEY)
+        self.cache = None
+
+    async def __aenter__(self):
+        await self.create()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.delete()
+
+    async def create(self):
+        if self.cache or estimate_tokens(self.corpus) < config.CORPUS_CACHE_MIN_TOKENS:
+            return
+
+        try:
+            self.cache = await self.client.aio.caches.create(
+                model=self.model_name,
+                config=types.CreateCachedContentConfig(
+                    contents=[types.Content(role="user", parts=[types.Part(text=self.corpus)])],
+                    system_instruction=self.system_instruction,
+                    display_name="research-corpus",
+                    ttl=f"{self.ttl}s",
+                )
+            )
+        except Exception as e:
+            print(f"Context caching failed (corpus is sent inline): {e}")
+            self.cache = None
+
+    async def delete(self):
+        if not self.cache:
+            return
+
+        try:
+            await self.client.aio.caches.delete(name=self.cache.name)
+        except Exception as e:
+            print(f"Deleting the context cache failed: {e}")
+        self.cache = None
+
+    async def generate(self, prompt: str) -> str:
+        """Answers a prompt with the corpus as context (cached if possible)."""
+        start = time.time()
+        if self.cache:
+            response = await self.client.aio.models.generate_content(
+                model=self.model_name,
+                contents=prompt,
+                config=types.GenerateContentConfig(cached_content=self.cache.name)
+            )
+        else:
+            response = await self.client.aio.models.generate_content(
+                model=self.model_name,
+                contents=f"{self.corpus}\n\n{prompt}",
+                config=types.GenerateContentConfig(system_instruction=self.system_instruction)
+            )
+        model_router.record(self.model_name, time.time() - start, response.usage_metadata)
+
+        return response.text
@@ -0,0 +1,246 @@
+import re
+import math
+from dataclasses import dataclass, field
+from typing import Optional
+
+from config import Config
+from citations import ReferenceTable, SearchResult
+
+config = Config()
+
+# Rough average for English text with Gemini/GPT style tokenizers
+CHARS_PER_TOKEN = 4
+
+REFERENCE_HEADER_PATTERN = re.compile(r"^(#+\s*)?references:?$", re.IGNORECASE)
+REFERENCE_LINE_PATTERN = re.compile(r"^\[(\d+)\]\s*(.*?)\s*(https?://\S+)\s*$")
+CITATION_PATTERN = re.compile(r"\[(\d+)\]")
+TERM_PATTERN = re.compile(r"\w{3,}", re.UNICODE)
+
+HEADER_TOKENS = 10  # "# Result query n:" header of a packed source
+MIN_SOURCE_TOKENS = 20  # text budget a packed source gets at least (besides its header and references)
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimates the token count locally (no count_tokens API call)."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def strip_indentation(text: str) -> str:
+    """Removes indentation and trailing whitespace and collapses runs of blank lines."""
+    lines = []
+    blank = False
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            if lines and not blank:
+                lines.append("")
+            blank = True
+            continue
+        lines.append(line)
+        blank = False
+
+    return "\n".join(lines).strip()
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Truncates text to roughly max_tokens, cutting at a paragraph or sentence boundary if possible.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+
+    cut = text[:max_tokens * CHARS_PER_TOKEN]
+
+    # Prefer a clean cut, but don't throw away more than half of the budget for it
+    for boundary in ("\n\n", "\n", ". "):
+        position = cut.rfind(boundary)
+        if position > len(cut) // 2:
+            cut = cut[:position + (1 if boundary == ". " else 0)]
+            break
+
+    return cut.rstrip() + " [...]"
+
+
+@dataclass
+class PackedSource:
+    index: int  # Position of the search result (planner order)
+    text: str
+    references: set[int] = field(default_factory=set)
+    relevance: float = 0.0
+    tokens: int = 0
+
+
+@dataclass
+class PackedContext:
+    sources: list[PackedSource]
+    references: ReferenceTable
+    text: str
+    tokens: int
+
+
+def renumber_citations(text: str, local_to_global: dict[int, int]) -> tuple[str, set[int]]:
+    used = set()
+
+    def replace(match):
+        local_id = int(match.group(1))
+        if local_id not in local_to_global:
+            return match.group(0)
+        used.add(local_to_global[local_id])
+        return f"[{local_to_global[local_id]}]"
+
+    return CITATION_PATTERN.sub(replace, text), used
+
+
+def merge_references(result: str, references: ReferenceTable) -> tuple[str, set[int]]:
+    """
+    Splits a search result into its text sections and reference lists,
+    registers all references in the global table and rewrites the citations to the global numbers.
+
+    A result can contain several sections with their own numbering (e.g., Google and Perplexity results).
+    """
+    sections = []  # (body lines, local reference map)
+    body, local_refs, in_references = [], {}, False
+
+    for line in strip_indentation(result).splitlines():
+        if REFERENCE_HEADER_PATTERN.match(line):
+            in_references = True
+            continue
+
+        if in_references:
+            if match := REFERENCE_LINE_PATTERN.match(line):
+                local_id, title, url = match.groups()
+                local_refs[int(local_id)] = references.add(url, title)
+                continue
+            if not line:
+                continue
+            # Text after a reference list starts a new section
+            sections.append((body, local_refs))
+            body, local_refs, in_references = [], {}, False
+
+        body.append(line)
+
+    sections.append((body, local_refs))
+
+    texts, used = [], set()
+    for body, local_refs in sections:
+        text, section_used = renumber_citations("\n".join(body).strip(), local_refs)
+        if text:
+            texts.append(text)
+        used |= section_used
+
+    return "\n\n".join(texts), used
+
+
+def score_relevance(query: Optional[str], text: str, index: int) -> float:
+    """
+    Relevance of a source: planner rank prior plus the share of query terms found in the text.
+    """
+    rank_prior = 1 / (1 + index)
+    if not query:
+        return rank_prior
+
+    query_terms = set(TERM_PATTERN.findall(query.lower()))
+    if not query_terms:
+        return rank_prior
+
+    text_terms = set(TERM_PATTERN.findall(text.lower()))
+    overlap = len(query_terms & text_terms) / len(query_terms)
+    return 0.5 * rank_prior + overlap
+
+
+def allocate_budget(sources: list[PackedSource], budget: int) -> list[int]:
+    """
+    Splits the token budget between sources (proportional to relevance).
+    Budget that a short source doesn't need is handed on to the remaining sources.
+    """
+    allocation = [0] * len(sources)
+    remaining = sorted(range(len(sources)), key=lambda k: sources[k].tokens)
+
+    while remaining and budget > 0:
+        total_relevance = sum(sources[k].relevance for k in remaining) or 1.0
+        shares = {k: budget * sources[k].relevance / total_relevance for k in remaining}
+
+        fitting = [k for k in remaining if sources[k].tokens <= shares[k]]
+        if not fitting:
+            for k in remaining:
+                allocation[k] = int(shares[k])
+            break
+
+        for k in fitting:
+            allocation[k] = sources[k].tokens
+            budget -= sources[k].tokens
+        remaining = [k for k in remaining if k not in fitting]
+
+    return allocation
+
+
+def get_overhead(sources: list[PackedSource], references: ReferenceTable) -> int:
+    """Tokens of the source headers and the reference lines of the sources."""
+    used_references = set().union(*(source.references for source in sources))
+    return estimate_tokens(references.format(used_references)) + HEADER_TOKENS * len(sources)
+
+
+def pack_search_results(results: list[str | SearchResult], query: Optional[str] = None,
+                            max_tokens: int = config.REPORT_CONTEXT_TOKENS) -> PackedContext:
+    """
+    Builds the report context from the search results within a token budget.
+
+    Args:
+        results (list[str | SearchResult]): Search results (in planner order, most relevant first).
+            Structured results are renumbered directly, text results are parsed for their reference lists.
+        query (Optional[str]): The user search query (used for the relevance score).
+        max_tokens (int): Token budget for the packed context.
+
+    Returns:
+        PackedContext: The packed text, the packed sources and the global reference table.
+
+    Raises:
+        ValueError: If max_tokens can't hold a single source with its header and references.
+    """
+    references = ReferenceTable()
+    sources = []
+
+    for k, result in enumerate(results):
+        if isinstance(result, SearchResult):
+            text, used = result.render_with_references(references)
+            text = strip_indentation(text)
+        else:
+            text, used = merge_references(result, references)
+        sources.append(PackedSource(
+            index=k,
+            text=text,
+            references=used,
+            relevance=score_relevance(query, text, k),
+            tokens=estimate_tokens(text)))
+
+    # Drop the least relevant sources (with their reference lines) until the headers and references leave room for text
+    kept = sorted(sources, key=lambda source: source.relevance, reverse=True)
+    while kept and get_overhead(kept, references) + MIN_SOURCE_TOKENS * len(kept) > max_tokens:
+        kept.pop()
+    if sources and not kept:
+        raise ValueError(f"A context of {max_tokens} tokens can't hold a search result with its header and references")
+    if len(kept) < len(sources):
+        print(f"Context budget: {len(sources) - len(kept)} of {len(sources)} search results dropped (headers and references don't fit)")
+    sources = [source for source in sources if any(source is other for other in kept)]
+
+    # Reserve room for the headers and the reference list
+    overhead = get_overhead(sources, references)
+    allocation = allocate_budget(sources, max_tokens - overhead)
+
+    for source, source_budget in zip(sources, allocation):
+        if source.tokens > source_budget:
+            source.text = truncate_to_tokens(source.text, source_budget)
+            source.references = {int(ref_id) for ref_id in CITATION_PATTERN.findall(source.text)} & source.references
+            source.tokens = estimate_tokens(source.text)
+
+    sources = [source for source in sources if source.text]
+    parts = [f"# Result query {source.index + 1}:\n{source.text}" for source in sources]
+
+    used_references = set().union(*(source.references for source in sources))
+    if used_references:
+        parts.append(f"# References\n{references.format(used_references)}")
+
+    text = "\n\n".join(parts)
+    return PackedContext(sources=sources, references=references, text=text, tokens=estimate_tokens(text))
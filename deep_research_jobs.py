@@ -0,0 +1,144 @@
+import re
+import time
+import asyncio
+from enum import StrEnum
+from typing import Optional
+
+from config import Config
+from llm_gateway import llm_gateway, Provider
+from citations import SearchResult, parse_marked_citations
+from agent_tools import get_deep_research_messages
+from task_manager import task_manager, TaskManager, TaskStatus
+
+config = Config()
+
+DEEP_RESEARCH_TASK_TYPE = "DeepResearch (Perplexity)"
+
+THINK_PATTERN = re.compile(r"<think>.*?</think>", re.DOTALL)
+
+
+class DeepResearchJobStatus(StrEnum):
+    # Status of the job at Perplexity (stored as external_status of the task)
+    CREATED = "CREATED"
+    IN_PROGRESS = "IN_PROGRESS"
+    COMPLETED = "COMPLETED"
+    FAILED = "FAILED"
+
+
+async def submit_deep_research_async(search_query: str) -> dict:
+    """Submits a deep research request to the Perplexity async API and returns the job (id, status)."""
+    return await llm_gateway.request(Provider.PERPLEXITY, "post", "/async/chat/completions", body={
+        "request": {
+            "model": config.PERPLEXITY_DEEP_RESEARCH,
+            "messages": get_deep_research_messages(search_query),
+        }
+    })
+
+
+async def get_deep_research_job_async(request_id: str) -> dict:
+    """Gets the current state of a Perplexity async job (the result is included once it is COMPLETED)."""
+    return await llm_gateway.request(Provider.PERPLEXITY, "get", f"/async/chat/completions/{request_id}")
+
+
+def format_deep_research_result(search_query: str, job: dict) -> str:
+    """Report text with references from a completed job (the thinking part of the answer is removed)."""
+    response = job.get("response") or {}
+    text = response["choices"][0]["message"]["content"]
+    text = THINK_PATTERN.sub("", text).strip()
+
+    answer = parse_marked_citations(text, response.get("citations") or [])
+    return SearchResult(query=search_query, answers=[answer]).render()
+
+
+async def run_deep_research_job(task_id: str, search_query: str,
+                                    poll_interval: float = config.DEEP_RESEARCH_POLL_INTERVAL,
+                                    timeout: float = config.DEEP_RESEARCH_TIMEOUT,
+                                    manager: TaskManager = task_manager) -> str:
+    """
+    Runs a deep research task: submits the Perplexity job (unless the task already has one)
+    and waits for it with non-blocking polls, the job id and status are stored in the task database.
+
+    A task that is resumed after a restart continues to wait for its existing job.
+
+    Args:
+        task_id (str): The task id in the task database.
+        search_query (str): The user search query.
+        poll_interval (float): Seconds between two status polls.
+        timeout (float): Max. duration of the job in seconds (counted from the start of the task).
+        manager (TaskManager): The task manager of the task.
+
+    Returns:
+        str: The report text with references.
+    """
+    task = await asyncio.to_thread(manager.get_task, task_id)
+    request_id = task.get("external_id")
+    # A retried task submits a new job if the old one failed at Perplexity
+    if not request_id or task.get("external_status") == DeepResearchJobStatus.FAILED:
+        job = await submit_deep_research_async(search_query)
+        request_id = job["id"]
+        await asyncio.to_thread(manager.update_external_job, task_id, request_id, job.get("status"))
+        print(f"Deep research job submitted: {request_id}")
+
+    deadline = (task.get("started_at") or time.time()) + timeout
+    status = None
+    while True:
+        job = await get_deep_research_job_async(request_id)
+        if job.get("status") != status:
+            status = job.get("status")
+            await asyncio.to_thread(manager.update_external_job, task_id, None, status)
+
+        if status == DeepResearchJobStatus.COMPLETED:
+            return format_deep_research_result(search_query, job)
+        if status == DeepResearchJobStatus.FAILED:
+            raise RuntimeError(f"Deep research job {request_id} failed: {job.get('error_message')}")
+        if time.time() > deadline:
+            raise TimeoutError(f"Deep research job {request_id} did not finish within {timeout}s")
+
+        await asyncio.sleep(poll_interval)
+
+
+def start_deep_research_job(search_query: str, manager: TaskManager = task_manager) -> str:
+    """Adds a deep research task and starts it on the task manager's event loop. Returns the task id."""
+    task_id = manager.add_task(search_query, DEEP_RESEARCH_TASK_TYPE)
+    # The arguments are stored with the task, a custom manager is only passed if it isn't the default one
+    kwargs = {} if manager is task_manager else {"manager": manager}
+    manager.start_task(task_id, run_deep_research_job, task_id, search_query, **kwargs)
+    return task_id
+
+
+def resume_deep_research_jobs(manager: TaskManager = task_manager) -> list[str]:
+    """
+    Continues the deep research tasks of a previous process (call it on startup, repeated calls are no-ops).
+    They wait for their stored Perplexity job instead of submitting a new one. Returns the ids of the resumed tasks.
+    """
+    return manager.recover_tasks(DEEP_RESEARCH_TASK_TYPE)
+
+
+task_manager.register_task_type(DEEP_RESEARCH_TASK_TYPE, run_deep_research_job)
+
+
+def get_deep_research_status(task_id: str, manager: TaskManager = task_manager) -> Optional[dict]:
+    """Polls a deep research task: task status, Perplexity job status and the result (if completed)."""
+    task = manager.get_task(task_id)
+    if not task:
+        return None
+    return {
+        "status": task["status"],
+        "job_status": task.get("external_status"),
+        "result": task.get("result"),
+        "error": task.get("error"),
+    }
+
+
+async def wait_for_deep_research(task_id: str, poll_interval: float = 2.0, manager: TaskManager = task_manager) -> str:
+    """Awaits a deep research task (from any event loop) and returns its report text."""
+    while True:
+        task = await asyncio.to_thread(manager.get_task, task_id)
+        if not task:
+            raise ValueError(f"Task {task_id} not found")
+        if task["status"] == TaskStatus.COMPLETED:
+            return task["result"]
+        if task["status"] in (TaskStatus.FAILED, TaskStatus.CANCELLED):
+            raise RuntimeError(f"Deep research task {task_id} {task['status'].lower()}: {task.get('error')}")
+
+        await asyncio.sleep(poll_interval)
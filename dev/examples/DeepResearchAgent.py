@@ -6,7 +6,6 @@ from os.path import join, exists
 from os import makedirs
 from pathvalidate import sanitize_filename
 from pydantic import BaseModel, Field, HttpUrl
-from openai import OpenAI
 from google import genai
 import requests
 from requests.exceptions import RequestException
@@ -16,6 +15,9 @@ from dataclasses import dataclass
 from pydantic_ai.models.gemini import GeminiModel
 from markitdown import MarkItDown
 from config import Config
+from llm_gateway import llm_gateway, Provider
+from document_store import document_store
+from search_ranker import rank_search_hits
 
 config = Config()
 
@@ -48,13 +50,9 @@ def get_perplexity_search_results(query: str) -> Tuple[str, List[str]]:
     ]
 
     try:
-        # Create an OpenAI client using the provided API key and base URL
-        client = OpenAI(
-            api_key=config.PERPLEXITY_API_KEY, 
-            base_url=config.PERPLEXITY_BASE_URL
-        )
-
-        response = client.chat.completions.create(
+        # Pooled Perplexity client of the gateway (no new client per call)
+        response = llm_gateway.complete_sync(
+            Provider.PERPLEXITY,
             model="sonar-pro",
             messages=messages,
         )
@@ -174,13 +172,15 @@ def perplexity_search(search_query: str) -> dict:
     return search_result
 
 @table_of_content_agent.tool_plain  
-def google_search(search_query: str, topic_folder_name: str) -> dict:
+def google_search(search_query: str) -> dict:
     """Uses the Serper API to retrieve google results based on a string query.
     Certain search results could be faulty or irrelevant, please ignore these results.
+    The results are ranked locally (relevance, domain quality, freshness), only the best
+    config.CRAWL_TOP_N pages are crawled. Pages are saved in the shared document store,
+    pages crawled before are taken from the store.
 
     Args:
         search_query (str): The google query string. It needs to be suited for the given research topic.
-        topic_folder_name (str): A suitable name for a folder (all search results are saved in this folder). It needs to be a valid folder name.
     
     Returns:
         document_data: A dictionary with the following fields:
@@ -189,8 +189,9 @@ def google_search(search_query: str, topic_folder_name: str) -> dict:
             - 'snippet': A short snippet of the webpage
             - 'date': The date of the webpage
             - 'position': Element position
-            - 'markdown': The markdown text (webpage content)
-            - 'filename': filename (saved in folder with name=topic_folder_name)
+            - 'score': The local ranking score (between 0 and 1)
+            - 'markdown': The markdown text (webpage content, empty if the page wasn't crawled)
+            - 'document_id': id of the page in the document store
     """
     num_results = 10
     api_key = os.environ.get("SERPER_API_KEY")
@@ -212,31 +213,34 @@ def google_search(search_query: str, topic_folder_name: str) -> dict:
     response = requests.request("POST", url, headers=headers, data=payload)
     json_response = response.json()
 
-    # Create folder if not exists
-    if not exists(topic_folder_name):
-        makedirs(topic_folder_name)
-
     document_data = {}
 
-    for result in json_response['organic']:
+    ranked_results = rank_search_hits(search_query, json_response['organic'])
+
+    for k, result in enumerate(ranked_results):
         title = result.get('title', '').replace("/", " - ")
         link = result.get('link', '')
-        markdown = crawl_website(link) if link else ''
-        filename = title + ".md"
+        date = result.get('date', '')
+        crawl = bool(link) and k < config.CRAWL_TOP_N
+        stored = document_store.get_by_url(link) if crawl else None
+        if stored:
+            markdown, document_id = stored.content, stored.id
+        else:
+            markdown, document_id = (crawl_website(link) if crawl else ''), None
+            if markdown:
+                document_id, _ = document_store.add_document(link, markdown, title=title, date=date, query=search_query)
 
         document_data[title] = {
             'topic': search_query,
             'link': link,
             'snippet': result.get('snippet', ''),
-            'date': result.get('date', ''),
+            'date': date,
             'position': result.get('position', 0),
+            'score': result['score'],
             'markdown': markdown,
-            'filename': filename
+            'document_id': document_id
         }
 
-        with open(join(topic_folder_name, filename), "w") as f:
-            f.write(markdown)
-
     return document_data
 
 def write_document(result):
@@ -1,48 +1,26 @@
 class ReferenceManager():
-    def __init__(self, save_directory: str):
-        self.refs: dict[str, str] = {}
-        self.save_directory: str = save_directory
-        os.makedirs(save_directory, exist_ok=True)
+    """References (crawled pages) of the notes, kept in the shared document store."""
+    def __init__(self, store: DocumentStore = document_store):
+        self.store: DocumentStore = store
 
-    def add_reference(self, link: str, markdown_text: str, filename: str) -> None:
-        """Adds a reference with validation of inputs and error handling."""
+    def add_reference(self, link: str, markdown_text: str, title: str = "", query: str = "") -> None:
+        """Adds a reference with validation of inputs (pages with the same content are only stored once)."""
         if not link.startswith(('http://', 'https://')):
             raise ValueError(f"Invalid link format: {link}")
 
-        if not filename.endswith('.md'):
-            filename += '.md'
-
         if not self.check_ref(link):
-            try:
-                self.save_markdown(filename, markdown_text)
-                self.refs[link] = filename
-            except IOError as e:
-                print(f"Failed to save {filename}: {str(e)}")
+            self.store.add_document(link, markdown_text, title=title, query=query)
 
     def check_ref(self, link: str) -> bool:
-        return link in self.refs
+        return self.store.get_by_url(link) is not None
 
     def get_markdown_text(self, link: str) -> Optional[str]:
+        document = self.store.get_by_url(link)
+        return document.content if document else None
 
-        if filename := self.refs.get(link):
-            try:
-                return self.read_markdown_file(filename)
-            except FileNotFoundError:
-                return None
-        return None
-
-    def save_markdown(self, filename: str, markdown_text: str) -> None:
-        full_path = join(self.save_directory, filename)
-        with open(full_path, 'w', encoding='utf-8') as f:
-            f.write(markdown_text)
-
-    def read_markdown_file(self, filename: str) -> str:
-        full_path = join(self.save_directory, filename)
-        try:
-            with open(full_path, 'r', encoding='utf-8') as f:
-                return f.read()
-        except FileNotFoundError:
-            raise
+    def search_references(self, query: str, limit: int = 10) -> List[StoredDocument]:
+        """Full-text search (BM25) over all stored references."""
+        return self.store.search(query, limit)
 
 @dataclass
 class DocumentInfo:
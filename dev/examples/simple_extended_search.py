@@ -1,6 +1,8 @@
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from agent_utils import *
 from agent_tools import *
+from query_planner import plan_search_queries_async
+from search_ranker import score_search_hits
 import argparse
 
 config = Config()
@@ -27,12 +29,6 @@ class URLRating(BaseModel):
 class URLRatingAgentResponse(BaseModel):
     url_info: list[URLRating] = Field(description="A list with URLs with corresponding ratings.")
 
-urlRatingAgent = BasicAgent(URLRatingAgentResponse, 
-        system_prompt="""Your goal is to extract URL number and the corresponding rating. 
-        The input text has the following format: {1, 60}, {2,75}, {3, 35} .... 
-        with  
-        {URL number, Rating}""")
-
 
 def get_search_queries_for_document(doc: str):
     query = get_system_prompt("search_query_recommendation")
@@ -47,52 +43,35 @@ def get_search_queries_for_document(doc: str):
 
     return queries.data
 
-def get_search_query_help(query: str):
-
-    query += f"""
-    We have to improve the search results given a user search query. 
-    Please think of multiple google search queries (plain text) that would increase the quality of the search results, when we combine all the search results.
-
-    # Desired output format:
-
-    Google Search Queries:
-    - Search query 1
-    - Search query 2
-    - etc.
+def get_search_query_help(query: str, max_queries: int = 10) -> list[str]:
+    # One structured-output call (no extraction agent round trip)
+    plan = asyncio.run(plan_search_queries_async(query, max_queries))
+    return [planned_query.query for planned_query in plan.queries]
 
-    # User Search Query:
-    {query}
+URL_PATTERN = re.compile(r"Link \[(\d+)\]:")
+LINK_PATTERN = re.compile(r"https?://\S+")
 
+def rate_search_results(content_text: str, search_query: str = ""):
     """
-    
-    text_response = reasoningAgentChat(query)
-    queries = searchQueryAgent(f"Please extract all search queries from this text: {text_response}")
-
-    return queries.data
-
-def rate_search_results(content_text: str):
-    query = f"""
-    Please rate each search result based on relevance (value between 0 and 100).
+    Rates each search result (value between 0 and 100).
     Each search result has an URL with an URL number, 
     for example: "Link [143]: https...", where 143 is the URL number.
 
-    Your generated output format should look like this:
-
-    (1, 60), (2,75), (3, 35) ....
-    
-    with 
-    
-    (URL number, Rating)  
-    
-    Here are the search results based on your search query suggestions:
-    
-    {content_text}
+    The ratings are computed locally in one batch (see search_ranker.score_search_hits), no LLM calls.
     """
-    text_response = reasoningAgent(query)
+    parts = URL_PATTERN.split(content_text)
+    numbered_results = [(int(parts[k]), parts[k+1]) for k in range(1, len(parts) - 1, 2)]
+
+    hits = []
+    for url_number, text in numbered_results:
+        link = LINK_PATTERN.search(text)
+        hits.append({'link': link.group(0) if link else '', 'snippet': text, 'position': len(hits) + 1})
 
-    url_info = urlRatingAgent(f"Please extract the url info in this text: {text_response}")
+    scores = score_search_hits(search_query, hits)
+    url_info = [URLRating(url_number=url_number, rating=round(100 * score))
+                    for (url_number, _), score in zip(numbered_results, scores)]
 
-    return url_info.data
+    return URLRatingAgentResponse(url_info=url_info)
 
 async def search_queries(search_queries: list[str]) -> list[str]:
     results = []
@@ -129,8 +108,8 @@ def run_search(user_search_query: str, max_searches:int = 5, use_perplexity: boo
     global basicSearchAgent
     basicSearchAgent = BasicSearchModel(perplexity_search=use_perplexity)
 
-    queries = get_search_query_help(user_search_query)
-    results = search_queries(queries.google_search_queries[:max_searches])
+    queries = get_search_query_help(user_search_query, max_searches)
+    results = search_queries(queries)
 
     result_text = ""
 
@@ -16,7 +16,11 @@ CLAUDE_MODEL = "claude-3-5-sonnet-20241022"
 load_dotenv()
 
 class ModelChain:
-    def __init__(self):
+    def __init__(self, max_history_turns=None):
+        """
+        max_history_turns: Maximum number of user/assistant turns kept in the 
+        chat history of each model (None = unlimited).
+        """
         # Initialize DeepSeek client
         self.deepseek_client = OpenAI(
             api_key=os.getenv("DEEPSEEK_API_KEY"),
@@ -30,9 +34,24 @@ class ModelChain:
 
         self.deepseek_messages = []
         self.claude_messages = []
+        self.max_history_turns = max_history_turns
         self.current_model = CLAUDE_MODEL
         self.show_reasoning = True
 
+    def reset(self):
+        self.deepseek_messages = []
+        self.claude_messages = []
+
+    def window_messages(self, messages):
+        if self.max_history_turns is None:
+            return messages
+
+        messages = messages[-2 * self.max_history_turns:]
+        # The history always has to start with a user message
+        while messages and messages[0]["role"] != "user":
+            messages = messages[1:]
+        return messages
+
     def set_model(self, model_name):
         self.current_model = model_name
 
@@ -42,6 +61,7 @@ class ModelChain:
     def get_deepseek_reasoning(self, user_input):
         start_time = time.time()
         self.deepseek_messages.append({"role": "user", "content": user_input})
+        self.deepseek_messages = self.window_messages(self.deepseek_messages)
 
         if self.show_reasoning:
             rprint("\n[blue]Reasoning Process[/]")
@@ -121,6 +141,8 @@ class ModelChain:
                 }
             ])
             self.deepseek_messages.append({"role": "assistant", "content": full_response})
+            self.claude_messages = self.window_messages(self.claude_messages)
+            self.deepseek_messages = self.window_messages(self.deepseek_messages)
 
             print("\n")
             return full_response
@@ -157,8 +179,7 @@ def main():
                 break
 
             if user_input.lower() == 'clear':
-                chain.deepseek_messages = []
-                chain.claude_messages = []
+                chain.reset()
                 rprint("\n[magenta]Chat history cleared![/]\n")
                 continue
 
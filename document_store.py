@@ -0,0 +1,225 @@
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from config import Config
+from citations import canonical_url
+from passage_retrieval import hash_embeddings
+
+config = Config()
+
+TERM_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Reciprocal rank fusion constant (hybrid search)
+RRF_K = 60
+
+
+@dataclass
+class StoredDocument:
+    id: int
+    url: str
+    title: str
+    date: str
+    query: str
+    crawled_at: float
+    content: str
+    score: float = 0.0  # Search score (higher = better)
+
+
+def content_hash(content: str) -> str:
+    """Hash of the normalized content (whitespace and case don't matter), used for deduplication."""
+    normalized = " ".join(content.split()).lower()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def get_embedding(text: str) -> Optional[np.ndarray]:
+    """Local embedding of a document or query for the hybrid search (None if embeddings are switched off)."""
+    return hash_embeddings([text])[0] if config.RETRIEVAL_EMBEDDINGS else None
+
+
+def get_match_query(text: str) -> Optional[str]:
+    """FTS5 query that matches any term of the text (terms are quoted, so no FTS5 syntax gets through)."""
+    terms = dict.fromkeys(term.lower() for term in TERM_PATTERN.findall(text))
+    return " OR ".join(f'"{term}"' for term in terms) or None
+
+
+class DocumentStore:
+    """
+    Persistent store of crawled documents, shared by all tasks and runs.
+
+    Documents are deduplicated by the hash of their content and indexed with SQLite FTS5 (BM25 ranking).
+    Every document keeps its source metadata (URL, title, date, search query, crawl time) and can have
+    a local embedding (see passage_retrieval.hash_embeddings) for hybrid search. Every crawled URL points to its document (also URLs
+    whose content was already stored under another URL), so a URL is only crawled once.
+    """
+
+    def __init__(self, db_path: str = config.DOCUMENT_DB_PATH):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self._init_db()
+
+    def _init_db(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executescript('''
+            CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY,
+                content_hash TEXT NOT NULL UNIQUE,
+                url TEXT NOT NULL,
+                canonical_url TEXT NOT NULL,
+                title TEXT,
+                date TEXT,
+                query TEXT,
+                crawled_at REAL NOT NULL,
+                content TEXT NOT NULL,
+                embedding BLOB
+            );
+            CREATE INDEX IF NOT EXISTS documents_canonical_url ON documents (canonical_url);
+
+            CREATE TABLE IF NOT EXISTS document_urls (
+                canonical_url TEXT PRIMARY KEY,
+                document_id INTEGER NOT NULL REFERENCES documents (id),
+                crawled_at REAL NOT NULL
+            );
+
+            CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+                title, content, content='documents', content_rowid='id'
+            );
+            CREATE TRIGGER IF NOT EXISTS documents_insert AFTER INSERT ON documents BEGIN
+                INSERT INTO documents_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS documents_delete AFTER DELETE ON documents BEGIN
+                INSERT INTO documents_fts (documents_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+                DELETE FROM document_urls WHERE document_id = old.id;
+            END;
+            ''')
+            conn.commit()
+
+    def _to_document(self, row: sqlite3.Row, score: float = 0.0) -> StoredDocument:
+        return StoredDocument(id=row["id"], url=row["url"], title=row["title"] or "", date=row["date"] or "",
+                                query=row["query"] or "", crawled_at=row["crawled_at"], content=row["content"], score=score)
+
+    def add_document(self, url: str, content: str, title: str = "", date: str = "", query: str = "",
+                        embedding: Optional[np.ndarray] = None) -> tuple[int, bool]:
+        """
+        Adds a crawled document (documents with the same content are only stored once,
+        the URL then points to the stored document).
+
+        Args:
+            url (str): Source URL.
+            content (str): Document text (markdown).
+            title (str): Title of the source.
+            date (str): Publication date of the source (as given by the search engine).
+            query (str): The search query that found the source.
+            embedding (Optional[np.ndarray]): Embedding of the document (stored as float32, computed locally if not given).
+
+        Returns:
+            tuple[int, bool]: The document id and whether the document is new.
+        """
+        digest = content_hash(content)
+        crawled_at = time.time()
+        if embedding is None:
+            embedding = get_embedding(content)
+        with self.lock, sqlite3.connect(self.db_path) as conn:
+            existing = conn.execute('SELECT id FROM documents WHERE content_hash = ?', (digest,)).fetchone()
+            if existing:
+                document_id, is_new = existing[0], False
+            else:
+                cursor = conn.execute('''
+                INSERT INTO documents (content_hash, url, canonical_url, title, date, query, crawled_at, content, embedding)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (digest, url, canonical_url(url), title, date, query, crawled_at, content,
+                        None if embedding is None else np.asarray(embedding, dtype=np.float32).tobytes()))
+                document_id, is_new = cursor.lastrowid, True
+
+            conn.execute('''
+            INSERT OR REPLACE INTO document_urls (canonical_url, document_id, crawled_at) VALUES (?, ?, ?)
+            ''', (canonical_url(url), document_id, crawled_at))
+            conn.commit()
+            return document_id, is_new
+
+    def get_by_url(self, url: str) -> Optional[StoredDocument]:
+        """
+        The most recently crawled document of a URL (None if the URL wasn't crawled yet).
+        The document can be stored under another URL with the same content.
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute('''
+            SELECT documents.* FROM document_urls JOIN documents ON documents.id = document_urls.document_id
+            WHERE document_urls.canonical_url = ?
+            ''', (canonical_url(url),)).fetchone()
+            return self._to_document(row) if row else None
+
+    def search(self, query: str, limit: int = 10) -> list[StoredDocument]:
+        """Full-text search (BM25, best first)."""
+        match_query = get_match_query(query)
+        if not match_query:
+            return []
+
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute('''
+            SELECT documents.*, bm25(documents_fts) AS rank FROM documents_fts
+            JOIN documents ON documents.id = documents_fts.rowid
+            WHERE documents_fts MATCH ?
+            ORDER BY rank LIMIT ?
+            ''', (match_query, limit)).fetchall()
+            # FTS5 bm25() is lower for better matches
+            return [self._to_document(row, -row["rank"]) for row in rows]
+
+    def vector_search(self, query_embedding: np.ndarray, limit: int = 10) -> list[StoredDocument]:
+        """Cosine similarity search over the documents with embeddings of the same size (best first)."""
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute('SELECT id, embedding FROM documents WHERE length(embedding) = ?',
+                                (query_vector.nbytes,)).fetchall()
+            if not rows:
+                return []
+
+            matrix = np.stack([np.frombuffer(row["embedding"], dtype=np.float32) for row in rows])
+            norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query_vector) or 1.0)
+            scores = matrix @ query_vector / np.where(norms == 0, 1.0, norms)
+
+            best = np.argsort(-scores)[:limit]
+            ids = [rows[k]["id"] for k in best]
+            documents = {row["id"]: row for row in conn.execute(
+                f'SELECT * FROM documents WHERE id IN ({",".join("?" * len(ids))})', ids)}
+            return [self._to_document(documents[rows[k]["id"]], float(scores[k])) for k in best]
+
+    def hybrid_search(self, query: str, query_embedding: Optional[np.ndarray] = None, limit: int = 10) -> list[StoredDocument]:
+        """
+        BM25 and vector search combined with reciprocal rank fusion, the query embedding is computed
+        locally if not given (plain BM25 search if embeddings are switched off).
+        """
+        text_results = self.search(query, limit * 3)
+        if query_embedding is None:
+            query_embedding = get_embedding(query)
+        if query_embedding is None:
+            return text_results[:limit]
+
+        vector_results = self.vector_search(query_embedding, limit * 3)
+        documents, scores = {}, {}
+        for results in (text_results, vector_results):
+            for rank, document in enumerate(results):
+                documents[document.id] = document
+                scores[document.id] = scores.get(document.id, 0.0) + 1 / (RRF_K + rank + 1)
+
+        best = sorted(scores, key=scores.get, reverse=True)[:limit]
+        for document_id in best:
+            documents[document_id].score = scores[document_id]
+        return [documents[document_id] for document_id in best]
+
+    def count(self) -> int:
+        with sqlite3.connect(self.db_path) as conn:
+            return conn.execute('SELECT COUNT(*) FROM documents').fetchone()[0]
+
+
+# Shared by all tasks
+document_store = DocumentStore()
@@ -1,10 +1,18 @@
 import os
 import sys
+import math
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-import controlflow as cf
 
 from agent_utils import *
 from agent_tools import *
+from context_packer import PackedContext, pack_search_results, estimate_tokens
+from passage_retrieval import retrieve_passages
+from novelty import NoveltyTracker
+from telemetry import span, record_span
+from query_planner import PlannedQuery, QueryPlan, QuerySource, plan_search_queries_async
+from task_manager import task_manager
+from context_cache import CorpusCache
+from citations import CitationSource, CitationSpan, CitedText, SearchResult
 import argparse
 
 import argparse
@@ -22,13 +30,29 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
 from reportlab.lib.units import inch
 
-reasoningAgentChat = ReasoningModel()
 basicSearchAgent = BasicSearchModel()
-
-def ask_reasoning_model(content: str) -> str:
-    global reasoningAgentChat
-
-    response = reasoningAgentChat(content)
+geminiClient = genai.Client(api_key=config.GEMINI_API_KEY)
+
+def get_reasoning_chat() -> ReasoningModel:
+    """Creates a new reasoning chat session (one per research run)."""
+    return ReasoningModel(
+        api_key=config.GEMINI_API_KEY,
+        model=GeminiModel(model_router.choose(TaskClass.REASONING)),
+        max_history_turns=config.REASONING_MAX_HISTORY_TURNS,
+        summarize_history=config.REASONING_SUMMARIZE_HISTORY)
+
+def get_reasoning_chat_async() -> ReasoningModelAsync:
+    """Creates a new async reasoning chat session (one per research run)."""
+    return ReasoningModelAsync(
+        api_key=config.GEMINI_API_KEY,
+        model=GeminiModel(model_router.choose(TaskClass.REASONING)),
+        max_history_turns=config.REASONING_MAX_HISTORY_TURNS,
+        summarize_history=config.REASONING_SUMMARIZE_HISTORY)
+
+def ask_reasoning_model(content: str, reasoning_chat: Optional[ReasoningModel] = None) -> str:
+    reasoning_chat = reasoning_chat or get_reasoning_chat()
+
+    response = reasoning_chat(content)
     return response
 
 def google_single_search(search_query: str) -> str:
@@ -44,8 +68,91 @@ def google_search(search_queries: list[str]) -> list[str]:
         results.append(response)
     return results
 
-def search_query_help(search_query: str) -> str:
-    query = f"""
+def format_serper_results(search_query: str, items: list[dict], source_name: str) -> SearchResult:
+    """Builds the structured search result of Serper scholar/news results (one cited line per item)."""
+    text, spans, sources = f"{source_name} results for: {search_query}\n", [], []
+    for k, item in enumerate(items):
+        date = item.get('year') or item.get('date') or ""
+        date = f" ({date})" if date else ""
+        start = len(text) + 1
+        text += f"\n- {item.get('title', '')}{date}: {item.get('snippet', '')}"
+        spans.append(CitationSpan(start=start, end=len(text), ref_ids=[k+1]))
+        sources.append(CitationSource(ref_id=k+1, url=item.get('link', ''), title=item.get('title', '')))
+
+    return SearchResult(query=search_query, answers=[CitedText(text=text, spans=spans, sources=sources, provider=source_name)])
+
+async def search_planned_query_async(planned_query: PlannedQuery) -> SearchResult:
+    """Searches a planned query with the source the planner chose for it."""
+    with span("search", source=str(planned_query.source), query=planned_query.query) as search_span:
+        if planned_query.source == QuerySource.SCHOLAR:
+            papers = await google_scholar_search_async(planned_query.query)
+            result = format_serper_results(planned_query.query, papers, "Google Scholar")
+        elif planned_query.source == QuerySource.NEWS:
+            articles = await google_news_search_async(planned_query.query)
+            result = format_serper_results(planned_query.query, articles, "Google News")
+        else:
+            result = await basicSearchAgent.search_async(planned_query.query)
+
+        search_span.set(sources=sum(len(answer.sources) for answer in result.answers))
+        return result
+
+async def load_checkpoints_async(task_id: Optional[str], stage: str) -> dict[str, str]:
+    """Stored outputs of a stage of a task (empty without task id)."""
+    if not task_id:
+        return {}
+    return await asyncio.to_thread(task_manager.load_checkpoints, task_id, stage)
+
+async def save_checkpoint_async(task_id: Optional[str], stage: str, key: str, data: str):
+    """Stores the output of a stage of a task, so a retried or recovered task can skip it (no-op without task id)."""
+    if task_id:
+        await asyncio.to_thread(task_manager.save_checkpoint, task_id, stage, key, data)
+
+async def search_planned_queries_async(planned_queries: list[PlannedQuery], task_id: Optional[str] = None,
+                                            start: int = 0) -> list[SearchResult]:
+    """
+    Runs all planned queries concurrently (at most config.SEARCH_CONCURRENCY at a time).
+    With a task id every result is checkpointed and queries with a stored result are not searched again
+    (start = position of the first query in the plan, the checkpoints are keyed by plan position).
+    """
+    semaphore = asyncio.Semaphore(config.SEARCH_CONCURRENCY)
+    stored = await load_checkpoints_async(task_id, "search")
+
+    async def single_search(k: int, planned_query: PlannedQuery) -> SearchResult:
+        k += start
+        if str(k) in stored:
+            return SearchResult.from_json(stored[str(k)])
+        async with semaphore:
+            print(f"Search query ({planned_query.source}): {planned_query.query}")
+            result = await search_planned_query_async(planned_query)
+        await save_checkpoint_async(task_id, "search", str(k), result.to_json())
+        return result
+
+    return list(await asyncio.gather(*(single_search(k, planned_query) for k, planned_query in enumerate(planned_queries))))
+
+async def search_adaptive_async(planned_queries: list[PlannedQuery], task_id: Optional[str] = None) -> list[SearchResult]:
+    """
+    Runs the planned queries in batches of config.ADAPTIVE_BATCH_SIZE and stops once the marginal novelty
+    of a batch (new sources and new passages, see novelty.NoveltyTracker) drops below config.ADAPTIVE_MIN_NOVELTY.
+    With a task id the novelty of every batch is stored (stage "novelty", see novelty.get_novelty_curve).
+    """
+    tracker = NoveltyTracker()
+    results = []
+    for start in range(0, len(planned_queries), config.ADAPTIVE_BATCH_SIZE):
+        batch = await search_planned_queries_async(planned_queries[start:start + config.ADAPTIVE_BATCH_SIZE], task_id, start)
+        results.extend(batch)
+
+        point = tracker.add_batch(batch)
+        await save_checkpoint_async(task_id, "novelty", str(point.batch), point.to_json())
+        print(f"Search batch {point.batch + 1}: novelty {point.novelty:.2f} "
+                f"({point.new_urls}/{point.urls} new sources, {point.new_passages}/{point.passages} new passages)")
+        if point.novelty < config.ADAPTIVE_MIN_NOVELTY:
+            print(f"Stopping after {len(results)} of {len(planned_queries)} planned searches")
+            break
+
+    return results
+
+def get_search_query_prompt(search_query: str) -> str:
+    return f"""
     We have to improve the search results given a user search query. 
     Please think of multiple google search queries (plain text) that would increase the quality of the search results, when we combine all the search results.
 
@@ -62,27 +169,14 @@ def search_query_help(search_query: str) -> str:
     {search_query}
 
     """
-    
-    text_response = reasoningAgentChat(query)
-    return text_response
-
-class SearchQueryAgentResponse(BaseModel):
-    google_search_queries: list[str] = Field(description="The extracted google search queries (if available).")
-    # google_scholar_queries: list[str] | None = Field(description="The extracted google scholar queries (if available).")
-    # text_summary: str  | None = Field(description="Extract the text summary here (if available).")
-
-searchQueryAgent = cf.Agent(
-    name="Query",
-    model = "google/gemini-2.0-flash",
-    instructions=f"""
-    Your goal is to extract search queries (e.g., google search, google scholar, etc.) that are mention in a text.
-    """
-)
 
-def generate_research_report(user_search_query, result_text) -> str:
-    global reasoningAgentChat
+def search_query_help(search_query: str, reasoning_chat: Optional[ReasoningModel] = None) -> str:
+    reasoning_chat = reasoning_chat or get_reasoning_chat()
+    text_response = reasoning_chat(get_search_query_prompt(search_query))
+    return text_response
 
-    response = reasoningAgentChat(f"""
+def get_research_report_prompt(user_search_query: str, result_text: str) -> str:
+    return f"""
         Please generate a high quality report text based on the search results.
         
         The output should be in Markdown format, but please don't wrap the text like this:
@@ -117,42 +211,246 @@ def generate_research_report(user_search_query, result_text) -> str:
         {result_text}
 
 
-        """)    
+        """
+
+def generate_research_report(user_search_query, result_text, reasoning_chat: Optional[ReasoningModel] = None) -> str:
+    reasoning_chat = reasoning_chat or get_reasoning_chat()
+
+    response = reasoning_chat(get_research_report_prompt(user_search_query, result_text))
 
     return response
 
-def get_search_result_text(results: list[str]) -> str:
-    result_text = ""
-    for k, result in enumerate(results):
-        #cprint(result)
-        result_text += f"""
-        # Result query {k+1}:
+async def generate_research_report_async(user_search_query: str, result_text: str, reasoning_chat: ReasoningModelAsync) -> str:
+    response = await reasoning_chat(get_research_report_prompt(user_search_query, result_text))
+    return response
+
+def get_search_result_text(results: list[str | SearchResult], search_query: Optional[str] = None,
+                            max_tokens: int = config.REPORT_CONTEXT_TOKENS) -> str:
+    """Packs the search results (merged references, token budget) into the report prompt text."""
+    return pack_search_results(results, search_query, max_tokens).text
+
+def get_source_summary_prompt(user_search_query: str, sources_text: str) -> str:
+    return f"""
+        Please summarize the following search results with respect to the user search query.
+        Keep all facts, numbers and dates that are relevant to the user search query.
 
-        {result}
+        Keep the citations exactly as they are in the input text (e.g. "... affected the stock market [12]."). 
+        Don't renumber the citations, don't invent new citations and don't add a reference section.
 
+        # User Search Query:
+        {user_search_query}
+
+        # Search Results (text):
+        {sources_text}
         """
+
+def group_texts(texts: list[str], max_tokens: int) -> list[str]:
+    """Greedily combines texts into groups of at most max_tokens (a larger text forms its own group)."""
+    groups, group, group_tokens = [], [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if group and group_tokens + tokens > max_tokens:
+            groups.append("\n\n".join(group))
+            group, group_tokens = [], 0
+        group.append(text)
+        group_tokens += tokens
+
+    if group:
+        groups.append("\n\n".join(group))
+    return groups
+
+async def summarize_sources_async(user_search_query: str, texts: list[str]) -> list[str]:
+    """Map step: summarizes groups of sources in parallel with the fast model (citations are kept)."""
+    semaphore = asyncio.Semaphore(config.MAP_REDUCE_CONCURRENCY)
+
+    async def summarize(sources_text: str) -> str:
+        async with semaphore:
+            prompt = get_source_summary_prompt(user_search_query, sources_text)
+            model_name = model_router.choose(TaskClass.SUMMARIZATION, prompt_tokens=estimate_tokens(prompt))
+            start = time.time()
+            response = await geminiClient.aio.models.generate_content(
+                model=model_name,
+                contents=prompt
+            )
+            model_router.record(model_name, time.time() - start, response.usage_metadata)
+            return response.text
+
+    groups = group_texts(texts, config.MAP_REDUCE_GROUP_TOKENS)
+    return list(await asyncio.gather(*(summarize(group) for group in groups)))
+
+async def reduce_sources_async(user_search_query: str, packed: PackedContext) -> str:
+    """
+    Map-reduce step for large source sets.
+
+    Source groups are summarized in parallel and the summaries are reduced further (tree reduction) until
+    they fit below config.MAP_REDUCE_TOKEN_THRESHOLD. All steps use the global citation numbers of the 
+    packed context, so the result text ends with the global reference list.
+    """
+    texts = [f"# Result query {source.index + 1}:\n{source.text}" for source in packed.sources]
+
+    while True:
+        print(f"Summarizing {len(texts)} source texts ...")
+        texts = await summarize_sources_async(user_search_query, texts)
+        if len(texts) <= 1 or sum(estimate_tokens(text) for text in texts) <= config.MAP_REDUCE_TOKEN_THRESHOLD:
+            break
+
+    used_references = set().union(*(source.references for source in packed.sources))
+    result_text = "\n\n".join(f"# Summary {k+1}:\n{text}" for k, text in enumerate(texts))
+    result_text += f"\n\n# References\n{packed.references.format(used_references)}"
     return result_text
 
-def run_research(search_query: str, max_searches: int = 10) -> str:
-    search_queries_text = search_query_help(search_query)
-    cprint(search_queries_text)
+def get_retrieval_budget(results: list[str | SearchResult]) -> int:
+    """
+    Token budget of the passage retrieval, decided on the corpus size before retrieval.
 
-    task_extract_search_queries = cf.Task(
-        objective=f"Extract all search queries from the input text",
-        instructions=f"Extract the google search and google scholar search queries from the text. Here is the input text:  {search_queries_text}",
-        result_type=SearchQueryAgentResponse,
-        agents=[searchQueryAgent]
-    )
+    Corpora up to config.MAP_REDUCE_TOKEN_THRESHOLD are cut to the best passages (config.RETRIEVAL_CONTEXT_TOKENS).
+    Larger corpora keep all relevant passages up to config.REPORT_CONTEXT_TOKENS, which are then map-reduced
+    (see get_report_context_async): for large corpora retrieval only filters and map-reduce condenses.
+    """
+    corpus_tokens = sum(estimate_tokens(result if isinstance(result, str) else result.render()) for result in results)
+    if corpus_tokens > config.MAP_REDUCE_TOKEN_THRESHOLD:
+        return config.REPORT_CONTEXT_TOKENS
+    return config.RETRIEVAL_CONTEXT_TOKENS
 
-    result = task_extract_search_queries.run()
-    results = google_search(result.google_search_queries[:max_searches])
-    result_text = get_search_result_text(results)
+async def get_report_context_async(user_search_query: str, packed: PackedContext) -> str:
+    """Returns the search result text for the report prompt (map-reduced if above the threshold)."""
+    if packed.tokens > config.MAP_REDUCE_TOKEN_THRESHOLD:
+        return await reduce_sources_async(user_search_query, packed)
+
+    return packed.text
+
+async def collect_research_context_async(search_query: str, max_searches: int, task_id: Optional[str] = None,
+                                            adaptive: bool = config.ADAPTIVE_SEARCH) -> str:
+    """
+    Query planning, searches and passage retrieval (everything before the report is written).
+    With a task id every stage is checkpointed, a resumed task continues after the last stored stage.
+
+    In adaptive mode max_searches is no fixed count: up to max_searches * config.ADAPTIVE_MAX_FACTOR
+    queries are planned and the searches stop as soon as they stop finding new information.
+    """
+    if context := (await load_checkpoints_async(task_id, "context")).get("text"):
+        print("Resuming from checkpoint: search result context")
+        return context
+
+    with span("stage.plan", task_id=task_id) as stage_span:
+        if stored_plan := (await load_checkpoints_async(task_id, "plan")).get("queries"):
+            print("Resuming from checkpoint: query plan")
+            plan = QueryPlan.model_validate_json(stored_plan)
+            stage_span.set(cache_hit=True)
+        else:
+            max_queries = math.ceil(max_searches * config.ADAPTIVE_MAX_FACTOR) if adaptive else max_searches
+            plan = await plan_search_queries_async(search_query, max_queries, geminiClient)
+            await save_checkpoint_async(task_id, "plan", "queries", plan.model_dump_json())
+        stage_span.set(queries=len(plan.queries))
+    cprint("\n".join(f"- {planned_query.query} ({planned_query.source})" for planned_query in plan.queries))
+
+    with span("stage.search", task_id=task_id, adaptive=adaptive) as stage_span:
+        if adaptive:
+            results = await search_adaptive_async(plan.queries, task_id)
+        else:
+            results = await search_planned_queries_async(plan.queries, task_id)
+        stage_span.set(searches=len(results))
+
+    with span("stage.retrieve", task_id=task_id) as stage_span:
+        packed = retrieve_passages(results, search_query, [planned_query.query for planned_query in plan.queries],
+                                    get_retrieval_budget(results))
+        stage_span.set(context_tokens=packed.tokens)
+
+    with span("stage.context", task_id=task_id, map_reduce=packed.tokens > config.MAP_REDUCE_TOKEN_THRESHOLD):
+        result_text = await get_report_context_async(search_query, packed)
+    await save_checkpoint_async(task_id, "context", "text", result_text)
+    return result_text
+
+def get_follow_up_prompt(question: str) -> str:
+    return f"""
+        Please answer the following follow-up question based on the search results above (Markdown format).
+        Add the citations of the search results in the same style as in the search results, e.g. "... [3]".
+
+        # Follow-up Question:
+        {question}
+        """
+
+async def answer_follow_up_questions_async(search_query: str, result_text: str, questions: list[str]) -> str:
+    """
+    Answers follow-up questions about the search results of a run.
+
+    The search results are uploaded once as cached context (see CorpusCache),
+    so every question only sends its own prompt.
+    """
+    system_instruction = f"You answer questions about the following search results for the user search query: {search_query}"
+
+    async with CorpusCache(f"# Search Results (text):\n{result_text}", system_instruction, client=geminiClient) as corpus:
+        answers = await asyncio.gather(*(corpus.generate(get_follow_up_prompt(question)) for question in questions))
+
+    return "\n\n".join(f"## {question}\n\n{answer}" for question, answer in zip(questions, answers))
+
+async def run_research_async(search_query: str, max_searches: int = 10, 
+                                follow_up_questions: Optional[list[str]] = None, task_id: Optional[str] = None) -> str:
+    """
+    Async version of the research pipeline (query generation, searches, report, follow-up questions).
+
+    Every run uses its own reasoning chat session, so several runs can share one event loop
+    without sending each other's prompts and reports.
+    With a task id (TaskManager task) the stages are checkpointed and a retried task resumes from them.
+    """
+    reasoning_chat = get_reasoning_chat_async()
+    result_text = await collect_research_context_async(search_query, max_searches, task_id)
+
+    if response := (await load_checkpoints_async(task_id, "report")).get("draft"):
+        print("Resuming from checkpoint: report")
+    else:
+        print("Writing report now ...")
+        with span("stage.report", task_id=task_id):
+            response = await generate_research_report_async(search_query, result_text, reasoning_chat)
+        await save_checkpoint_async(task_id, "report", "draft", response)
+
+    if follow_up_questions:
+        response += "\n\n# Follow-up Questions\n\n"
+        response += await answer_follow_up_questions_async(search_query, result_text, follow_up_questions)
 
-    print("Writing report now ...")
-    response = generate_research_report(search_query, result_text)
-    
     return response
 
+async def stream_research_async(search_query: str, max_searches: int = 10, 
+                                    follow_up_questions: Optional[list[str]] = None, task_id: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Same pipeline as run_research_async, but the report is yielded in text chunks while it is generated.
+    """
+    reasoning_chat = get_reasoning_chat_async()
+    result_text = await collect_research_context_async(search_query, max_searches, task_id)
+
+    if draft := (await load_checkpoints_async(task_id, "report")).get("draft"):
+        print("Resuming from checkpoint: report")
+        yield draft
+    else:
+        print("Writing report now ...")
+        chunks = []
+        start = time.time()
+        async for chunk in reasoning_chat.stream(get_research_report_prompt(search_query, result_text)):
+            chunks.append(chunk)
+            yield chunk
+        # Traced after streaming (an open span would leak into the consumer's context)
+        record_span("stage.report", start, time.time(), task_id=task_id, stream=True)
+        await save_checkpoint_async(task_id, "report", "draft", "".join(chunks))
+
+    if follow_up_questions:
+        yield "\n\n# Follow-up Questions\n\n"
+        yield await answer_follow_up_questions_async(search_query, result_text, follow_up_questions)
+
+def run_research(search_query: str, max_searches: int = 10, 
+                    follow_up_questions: Optional[list[str]] = None) -> str:
+    return asyncio.run(run_research_async(search_query, max_searches, follow_up_questions))
+
+async def print_research_stream_async(search_query: str, max_searches: int = 10, 
+                                        follow_up_questions: Optional[list[str]] = None) -> str:
+    """Prints the report while it is generated and returns the full text."""
+    chunks = []
+    async for chunk in stream_research_async(search_query, max_searches, follow_up_questions):
+        print(chunk, end="", flush=True)
+        chunks.append(chunk)
+    print()
+
+    return "".join(chunks)
+
 
 def save_in_markdown(content, filename="output.md"):
     with open(filename, 'w', encoding='utf-8') as f:
@@ -215,11 +513,18 @@ def main():
     parser.add_argument("query", type=str, help="The initial search query.")
     parser.add_argument("-m", "--max_searches", type=int, default=5, help="Maximum number of searches to perform.")
     parser.add_argument("-f", "--format", type=str, choices=['markdown', 'csv', 'excel', 'pdf', 'html'], default='markdown', help="Choose output format.")
+    parser.add_argument("-q", "--follow_up", type=str, action="append", help="Follow-up question about the search results (can be repeated).")
+    parser.add_argument("-d", "--dag", action="store_true", help="Iterative multi-branch research with the research graph (see research_dag.py).")
 
     args = parser.parse_args()
 
     # Get the report text from the research process
-    report_text = run_research(args.query, args.max_searches)
+    if args.dag:
+        from research_dag import run_dag_research_async
+        report_text = asyncio.run(run_dag_research_async(args.query))
+        cprint(report_text)
+    else:
+        report_text = asyncio.run(print_research_stream_async(args.query, args.max_searches, args.follow_up))
 
     # Save output in chosen format
     if args.format == 'markdown':
@@ -8,7 +8,9 @@ from PyQt6.QtWidgets import (
     QFileDialog, QWidget, QMessageBox, QSpinBox, QCheckBox
 )
 from PyQt6.QtCore import QThread, pyqtSignal
-from extensive_search import run_research, save_in_markdown, save_in_csv, save_in_excel, save_in_pdf, save_in_html
+from PyQt6.QtGui import QTextCursor
+from agent_utils import iterate_sync
+from extensive_search import stream_research_async, save_in_markdown, save_in_csv, save_in_excel, save_in_pdf, save_in_html
 
 
 class ResearchWorker(QThread):
@@ -16,6 +18,7 @@ class ResearchWorker(QThread):
     finished = pyqtSignal(str)
     error = pyqtSignal(str)
     log = pyqtSignal(str)
+    chunk = pyqtSignal(str)
     #preview = pyqtSignal(str)
 
     def __init__(self, query, output_format, save_path, num_searches):
@@ -30,9 +33,15 @@ class ResearchWorker(QThread):
             self.log.emit("Starting research...")
             self.progress.emit(10)
 
-            # Perform the research
-            results = run_research(self.query, max_searches=self.num_searches)
-            self.progress.emit(50)
+            # Perform the research (the report is emitted in chunks while it is written)
+            chunks = []
+            for chunk in iterate_sync(stream_research_async(self.query, max_searches=self.num_searches)):
+                if not chunks:
+                    self.progress.emit(50)
+                chunks.append(chunk)
+                self.chunk.emit(chunk)
+            results = "".join(chunks)
+            self.progress.emit(75)
             self.log.emit("Research completed, preparing to save results...")
 
             # Emit results for preview
@@ -123,6 +132,12 @@ class DeepResearchGUI(QMainWindow):
         self.log_output.setReadOnly(True)
         output_layout.addWidget(self.log_output)
 
+        # Output: Report (streamed while it is written)
+        output_layout.addWidget(QLabel("Report:"))
+        self.report_output = QTextEdit()
+        self.report_output.setReadOnly(True)
+        output_layout.addWidget(self.report_output)
+
         # Progress Bar
         self.progress_bar = QProgressBar()
         self.progress_bar.setValue(0)
@@ -159,6 +174,7 @@ class DeepResearchGUI(QMainWindow):
         # Disable the start button while processing
         #self.start_button.setEnabled(False)
         self.progress_bar.setValue(0)
+        self.report_output.clear()
         self.open_file_checkbox.setEnabled(False)
 
         # Create and setup the worker thread
@@ -167,6 +183,7 @@ class DeepResearchGUI(QMainWindow):
         self.worker.finished.connect(self.on_complete)
         self.worker.error.connect(self.on_error)
         self.worker.log.connect(self.log_message)
+        self.worker.chunk.connect(self.append_report_chunk)
         #self.worker.preview.connect(self.preview_results)
 
         # Start the worker thread
@@ -178,6 +195,10 @@ class DeepResearchGUI(QMainWindow):
     def log_message(self, message):
         self.log_output.append(message)
 
+    def append_report_chunk(self, text):
+        self.report_output.moveCursor(QTextCursor.MoveOperation.End)
+        self.report_output.insertPlainText(text)
+
     #def preview_results(self, results):
        # QMessageBox.information(self, "Result Preview", results)
 
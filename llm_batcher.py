@@ -0,0 +1,138 @@
+import time
+import asyncio
+from typing import Generic, Optional, Type, TypeVar
+
+from pydantic import BaseModel, Field, create_model
+from google import genai
+from google.genai import types
+
+from config import Config
+from model_router import model_router, TaskClass
+
+config = Config()
+
+ResultT = TypeVar("ResultT", bound=BaseModel)
+
+
+class MicroBatcher(Generic[ResultT]):
+    """
+    Collects small LLM requests of the same shape (e.g., URL ratings or relevance checks) from concurrent
+    callers over a short window and answers them with one structured multi-item call.
+
+    Every caller awaits its own typed result; under tight RPM limits one request slot serves the whole batch.
+
+    Library code: the research pipeline makes no small per-item LLM calls, the relevance batcher below is only
+    used by the opt-in LLM judge of the search hit ranking (config.RANKER_LLM_JUDGE).
+    """
+
+    def __init__(self, instructions: str, result_type: Type[ResultT],
+                    window: float = config.BATCH_WINDOW, max_batch_size: int = config.BATCH_MAX_SIZE,
+                    task_class: TaskClass = TaskClass.EXTRACTION, client: Optional[genai.Client] = None):
+        """
+        Args:
+            instructions (str): What to do with every item.
+            result_type (Type[ResultT]): Pydantic model of the result for one item.
+            window (float): Seconds to wait for more requests before a batch is sent.
+            max_batch_size (int): A batch is sent immediately when it reaches this size.
+            task_class (TaskClass): Task class for the model router.
+            client (Optional[genai.Client]): Gemini client (a new one is created if not given).
+        """
+        self.instructions = instructions
+        self.result_type = result_type
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.task_class = task_class
+        self.client = client or genai.Client(api_key=config.GEMINI_API_KEY)
+
+        item_type = create_model(
+            f"{result_type.__name__}Item",
+            id=(int, Field(description="The id of the input item.")),
+            result=(result_type, ...))
+        self.batch_type = create_model(
+            f"{result_type.__name__}Batch",
+            results=(list[item_type], Field(description="One result for every input item.")))
+
+        # Pending requests per event loop (futures can only be resolved on their own loop)
+        self.pending: dict[asyncio.AbstractEventLoop, list[tuple[str, asyncio.Future]]] = {}
+        self.timers: dict[asyncio.AbstractEventLoop, asyncio.TimerHandle] = {}
+        # Running batch calls (the event loop only keeps weak references to its tasks)
+        self._tasks: set[asyncio.Task] = set()
+
+    async def submit(self, item: str) -> ResultT:
+        """Adds an item to the next batch and returns its result."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self.pending.setdefault(loop, [])
+        pending.append((item, future))
+
+        if len(pending) >= self.max_batch_size:
+            self._flush(loop)
+        elif loop not in self.timers:
+            self.timers[loop] = loop.call_later(self.window, self._flush, loop)
+
+        return await future
+
+    def _flush(self, loop: asyncio.AbstractEventLoop):
+        if timer := self.timers.pop(loop, None):
+            timer.cancel()
+
+        batch = self.pending.pop(loop, [])
+        if batch:
+            task = loop.create_task(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _get_prompt(self, batch: list[tuple[str, asyncio.Future]]) -> str:
+        items = "\n\n".join(f'<item id="{k}">\n{item}\n</item>' for k, (item, _) in enumerate(batch))
+        return f"""
+        {self.instructions}
+
+        Handle every item on its own and return exactly one result per item id.
+
+        # Items:
+        {items}
+        """
+
+    async def _run_batch(self, batch: list[tuple[str, asyncio.Future]]):
+        prompt = self._get_prompt(batch)
+        try:
+            model_name = model_router.choose(self.task_class, prompt_tokens=len(prompt) // 4, structured_output=True)
+            start = time.time()
+            response = await self.client.aio.models.generate_content(
+                model=model_name,
+                contents=prompt,
+                config=types.GenerateContentConfig(
+                    response_mime_type="application/json",
+                    response_schema=self.batch_type,
+                )
+            )
+            model_router.record(model_name, time.time() - start, response.usage_metadata)
+            results = {item.id: item.result for item in self.batch_type.model_validate_json(response.text).results}
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for k, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            if k in results:
+                future.set_result(results[k])
+            else:
+                future.set_exception(ValueError(f"Batch response has no result for item {k}"))
+
+
+class RelevanceRating(BaseModel):
+    rating: int = Field(description="The relevance of the text for the search query (value between 0 and 100).")
+
+
+relevanceBatcher = MicroBatcher(
+    instructions="Please rate how relevant each text is for the search query in the item (value between 0 and 100).",
+    result_type=RelevanceRating)
+
+
+async def rate_relevance_async(search_query: str, text: str) -> int:
+    """Relevance (0-100) of a text for a search query (batched with concurrent relevance checks)."""
+    result = await relevanceBatcher.submit(f"Search query: {search_query}\n\nText:\n{text}")
+    return min(max(result.rating, 0), 100)
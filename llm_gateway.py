@@ -0,0 +1,194 @@
+import time
+import asyncio
+import threading
+import contextvars
+from enum import StrEnum
+from typing import AsyncIterator, Iterator, Optional
+
+import httpx
+from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from config import Config
+from agent_utils import AsyncRateLimiter
+from telemetry import span, record_span
+
+config = Config()
+
+
+class Provider(StrEnum):
+    PERPLEXITY = "perplexity"
+    OPENROUTER = "openrouter"
+    DEEPSEEK = "deepseek"
+
+
+def get_provider_settings(provider: Provider) -> tuple[str, Optional[str], int]:
+    """Base URL, API key and requests per minute of an OpenAI-compatible provider."""
+    return {
+        Provider.PERPLEXITY: (config.PERPLEXITY_BASE_URL, config.PERPLEXITY_API_KEY, config.PERPLEXITY_RPM),
+        Provider.OPENROUTER: (config.OPENROUTER_BASE_URL, config.OPENROUTER_API_KEY, config.OPENROUTER_RPM),
+        Provider.DEEPSEEK: (config.DEEPSEEK_BASE_URL, config.DEEPSEEK_API_KEY, config.DEEPSEEK_RPM),
+    }[provider]
+
+
+class LLMGateway:
+    """
+    One entry point for the OpenAI-compatible providers (Perplexity, OpenRouter, DeepSeek).
+
+    Every base URL gets one pooled AsyncOpenAI client (kept-alive connections, shared retry policy)
+    and one rate limiter. Clients are kept per event loop, because their connection pool is bound
+    to the loop they are used on. Sync callers are served on the gateway's own background loop,
+    so they share one connection pool as well.
+    """
+
+    def __init__(self, max_retries: int = config.MAX_RETRIES, timeout: float = config.LLM_REQUEST_TIMEOUT,
+                    max_connections: int = config.LLM_MAX_CONNECTIONS):
+        """
+        Args:
+            max_retries (int): Retries of failed requests (429, 5xx, connection errors) with exponential backoff.
+            timeout (float): Request timeout in seconds.
+            max_connections (int): Size of the connection pool of every client.
+        """
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.max_connections = max_connections
+
+        self.clients: dict[tuple[asyncio.AbstractEventLoop, str], AsyncOpenAI] = {}
+        self.limiters: dict[str, AsyncRateLimiter] = {}
+        self.lock = threading.Lock()
+
+        self.loop = None  # Background loop for sync callers (created on first use)
+
+    def _get_client(self, provider: Provider) -> AsyncOpenAI:
+        base_url, api_key, _ = get_provider_settings(provider)
+        loop = asyncio.get_running_loop()
+
+        with self.lock:
+            # Drop the clients of finished loops (e.g., from asyncio.run)
+            for key in [key for key in self.clients if key[0].is_closed()]:
+                del self.clients[key]
+
+            if (loop, base_url) not in self.clients:
+                self.clients[(loop, base_url)] = AsyncOpenAI(
+                    base_url=base_url,
+                    api_key=api_key,
+                    max_retries=self.max_retries,
+                    timeout=self.timeout,
+                    http_client=httpx.AsyncClient(
+                        timeout=self.timeout,
+                        limits=httpx.Limits(
+                            max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_connections)))
+            return self.clients[(loop, base_url)]
+
+    def _get_limiter(self, provider: Provider) -> AsyncRateLimiter:
+        base_url, _, rpm = get_provider_settings(provider)
+        with self.lock:
+            if base_url not in self.limiters:
+                self.limiters[base_url] = AsyncRateLimiter(rpm=rpm)
+            return self.limiters[base_url]
+
+    def _get_event_loop(self) -> asyncio.AbstractEventLoop:
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, daemon=True).start()
+            return self.loop
+
+    async def complete(self, provider: Provider, model: str, messages: list[dict], **kwargs) -> ChatCompletion:
+        """
+        Non-streaming chat completion.
+
+        Args:
+            provider (Provider): The provider (selects base URL, API key and rate limit).
+            model (str): Model name at the provider.
+            messages (list[dict]): Chat messages.
+            **kwargs: Further arguments of chat.completions.create (e.g., extra_body).
+        """
+        client = self._get_client(provider)
+        await self._get_limiter(provider).acquire()
+        with span("llm", provider=str(provider), model=model) as llm_span:
+            response = await client.chat.completions.create(model=model, messages=messages, **kwargs)
+            if response.usage:
+                llm_span.set(prompt_tokens=response.usage.prompt_tokens, completion_tokens=response.usage.completion_tokens)
+            return response
+
+    async def stream(self, provider: Provider, model: str, messages: list[dict], **kwargs) -> AsyncIterator[ChatCompletionChunk]:
+        """Streaming chat completion (same arguments as complete), yields the chunks as they arrive."""
+        client = self._get_client(provider)
+        await self._get_limiter(provider).acquire()
+        start = time.time()
+        usage = None
+        response = await client.chat.completions.create(model=model, messages=messages, stream=True, **kwargs)
+        try:
+            async for chunk in response:
+                usage = chunk.usage or usage
+                yield chunk
+        finally:
+            await response.close()
+            # Traced after the stream ended (an open span would leak into the consumer's context)
+            record_span("llm", start, time.time(), provider=str(provider), model=model, stream=True,
+                        prompt_tokens=usage.prompt_tokens if usage else None,
+                        completion_tokens=usage.completion_tokens if usage else None)
+
+    async def request(self, provider: Provider, method: str, path: str, body: Optional[dict] = None) -> dict:
+        """
+        Request to a provider endpoint outside of chat completions (e.g., Perplexity async jobs),
+        with the same pooled client, retries and rate limit.
+
+        Args:
+            provider (Provider): The provider.
+            method (str): "get" or "post".
+            path (str): Path relative to the provider base URL.
+            body (Optional[dict]): JSON body of a post request.
+        """
+        client = self._get_client(provider)
+        await self._get_limiter(provider).acquire()
+        with span("provider.request", provider=str(provider), method=method, path=path) as request_span:
+            if method == "post":
+                response = await client.post(path, body=body, cast_to=httpx.Response)
+            else:
+                response = await client.get(path, cast_to=httpx.Response)
+            request_span.set(bytes=len(response.content))
+        return response.json()
+
+    def run_sync(self, coroutine, context: Optional[contextvars.Context] = None):
+        """
+        Runs a coroutine on the gateway's background loop and waits for its result.
+        The coroutine runs in a copy of the caller's context, so its spans and resources are
+        recorded for the calling task (see telemetry.collect_ledger).
+
+        Args:
+            coroutine: The coroutine to run.
+            context (Optional[contextvars.Context]): Context to run in (default: copy of the current context).
+        """
+        context = context or contextvars.copy_context()
+
+        async def run_in_context():
+            return await asyncio.get_running_loop().create_task(coroutine, context=context)
+
+        return asyncio.run_coroutine_threadsafe(run_in_context(), self._get_event_loop()).result()
+
+    def complete_sync(self, provider: Provider, model: str, messages: list[dict], **kwargs) -> ChatCompletion:
+        """Blocking version of complete (runs on the gateway's background loop)."""
+        return self.run_sync(self.complete(provider, model, messages, **kwargs))
+
+    def stream_sync(self, provider: Provider, model: str, messages: list[dict], **kwargs) -> Iterator[ChatCompletionChunk]:
+        """Blocking version of stream (runs on the gateway's background loop)."""
+        context = contextvars.copy_context()
+        chunks = self.stream(provider, model, messages, **kwargs)
+
+        async def next_chunk():
+            return await chunks.__anext__()
+
+        try:
+            while True:
+                try:
+                    yield self.run_sync(next_chunk(), context)
+                except StopAsyncIteration:
+                    break
+        finally:
+            self.run_sync(chunks.aclose(), context)
+
+
+llm_gateway = LLMGateway()
@@ -0,0 +1,211 @@
+import json
+import time
+import threading
+from collections import deque, defaultdict
+from dataclasses import dataclass, asdict
+from enum import StrEnum
+from typing import Optional
+
+from config import Config
+from telemetry import record_span
+
+config = Config()
+
+
+class TaskClass(StrEnum):
+    """
+    Kind of work a model call does (decides the minimum model tier).
+    """
+    EXTRACTION = "extraction"        # query extraction, URL rating, relevance checks
+    SUMMARIZATION = "summarization"  # map step of the report generation
+    SEARCH = "search"                # google grounding search
+    PLANNING = "planning"            # structured query planning
+    REASONING = "reasoning"          # reasoning chats
+    REPORT = "report"                # final research report
+
+
+MIN_TIER = {
+    TaskClass.EXTRACTION: 1,
+    TaskClass.SUMMARIZATION: 1,
+    TaskClass.SEARCH: 2,
+    TaskClass.PLANNING: 2,
+    TaskClass.REASONING: 3,
+    TaskClass.REPORT: 3,
+}
+
+
+@dataclass
+class ModelProfile:
+    name: str
+    provider: str               # "gemini", "deepseek" or "openrouter"
+    tier: int                   # capability (1 = lite ... 4 = strongest)
+    rpm: int                    # requests per minute
+    rpd: Optional[int]          # requests per day (None = no daily limit)
+    context_window: int         # input tokens
+    input_cost: float           # USD per 1M input tokens
+    output_cost: float          # USD per 1M output tokens
+    latency_prior: float        # expected seconds per call (used until latencies are observed)
+    grounding: bool = False     # supports the google search tool
+    structured_output: bool = True  # supports JSON schema responses
+
+
+def get_model_catalog(config: Config = config) -> list[ModelProfile]:
+    """The models of the Config catalog with their limits, prices and expected latencies."""
+    return [
+        ModelProfile(config.LITE2_MODEL, "gemini", 1, 30, 1500, 1_000_000, 0.0, 0.0, 1.5),
+        ModelProfile(config.FLASH2_MODEL, "gemini", 2, 15, 1500, 1_000_000, 0.0, 0.0, 3.0, grounding=True),
+        ModelProfile(config.FLASH2T_MODEL, "gemini", 3, 10, 1500, 1_000_000, 0.0, 0.0, 15.0, structured_output=False),
+        ModelProfile(config.PRO2_MODEL, "gemini", 4, 2, 50, 2_000_000, 0.0, 0.0, 20.0, grounding=True),
+        ModelProfile(config.DEEPSEEK_R1, "deepseek", 4, 60, None, 64_000, 0.55, 2.19, 60.0, structured_output=False),
+        ModelProfile(config.OPENROUTER_DEEPSEEK_R1_FREE, "openrouter", 4, 20, 200, 64_000, 0.0, 0.0, 90.0, structured_output=False),
+        ModelProfile(config.OPENROUTER_DEEPSEEK_R1, "openrouter", 4, 60, None, 64_000, 0.55, 2.19, 60.0, structured_output=False),
+    ]
+
+
+class ModelRouter:
+    """
+    Picks a model per call from the catalog based on the task class, the prompt size,
+    the observed p50/p95 latencies, the remaining quota and the cost.
+
+    Every decision is kept in memory (and appended to a JSONL log file if configured) for tuning.
+    """
+
+    # Score weights (lower score wins)
+    LATENCY_WEIGHT = 1.0    # per second of expected latency
+    COST_WEIGHT = 1000.0    # per USD of expected cost
+    QUOTA_WEIGHT = 20.0     # for a fully used quota
+    TIER_WEIGHT = 5.0       # per tier above the required one
+
+    def __init__(self, catalog: Optional[list[ModelProfile]] = None,
+                    decision_log_path: Optional[str] = config.ROUTER_DECISION_LOG):
+        self.catalog = {profile.name: profile for profile in (catalog or get_model_catalog())}
+        self.decision_log_path = decision_log_path
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(lambda: deque(maxlen=100))
+        self.requests = defaultdict(deque)  # model name -> request timestamps (last 24h)
+        self.decisions = deque(maxlen=1000)
+
+    def _percentile(self, model_name: str, percentile: float) -> float:
+        samples = sorted(self.latencies[model_name])
+        if not samples:
+            return self.catalog[model_name].latency_prior
+        return samples[min(len(samples) - 1, int(percentile * len(samples)))]
+
+    def _headroom(self, profile: ModelProfile, now: float) -> float:
+        """Share of the quota that is still available (0 = exhausted)."""
+        timestamps = self.requests[profile.name]
+        while timestamps and now - timestamps[0] > 24 * 60 * 60:
+            timestamps.popleft()
+
+        last_minute = sum(1 for timestamp in timestamps if now - timestamp < 60)
+        headroom = 1 - last_minute / profile.rpm
+        if profile.rpd:
+            headroom = min(headroom, 1 - len(timestamps) / profile.rpd)
+        return max(headroom, 0.0)
+
+    def _score(self, profile: ModelProfile, task_class: TaskClass, prompt_tokens: int,
+                output_tokens: int, headroom: float) -> float:
+        p50 = self._percentile(profile.name, 0.5)
+        p95 = self._percentile(profile.name, 0.95)
+        latency = (p50 + 0.25 * (p95 - p50)) * (1 + prompt_tokens / 100_000)
+        cost = (prompt_tokens * profile.input_cost + output_tokens * profile.output_cost) / 1_000_000
+
+        return (self.LATENCY_WEIGHT * latency
+                + self.COST_WEIGHT * cost
+                + self.QUOTA_WEIGHT * (1 - headroom)
+                + self.TIER_WEIGHT * (profile.tier - MIN_TIER[task_class]))
+
+    def choose(self, task_class: TaskClass, prompt_tokens: int = 0, output_tokens: int = 1000,
+                providers: tuple[str, ...] = ("gemini",), grounding: bool = False,
+                structured_output: bool = False) -> str:
+        """
+        Returns the model name for a call (and counts the call against the model's quota).
+
+        Args:
+            task_class (TaskClass): The kind of work.
+            prompt_tokens (int): Estimated input tokens.
+            output_tokens (int): Estimated output tokens.
+            providers (tuple[str, ...]): Providers the caller can talk to.
+            grounding (bool): The call needs the google search tool.
+            structured_output (bool): The call needs a JSON schema response.
+        """
+        with self.lock:
+            now = time.time()
+            candidates = [
+                profile for profile in self.catalog.values()
+                if profile.provider in providers
+                and profile.tier >= MIN_TIER[task_class]
+                and profile.context_window >= prompt_tokens + output_tokens
+                and (profile.grounding or not grounding)
+                and (profile.structured_output or not structured_output)
+            ]
+            if not candidates:
+                raise ValueError(f"No model in the catalog fits task class '{task_class}' ({prompt_tokens} prompt tokens)")
+
+            headrooms = {profile.name: self._headroom(profile, now) for profile in candidates}
+            scores = {
+                profile.name: self._score(profile, task_class, prompt_tokens, output_tokens, headrooms[profile.name])
+                for profile in candidates
+            }
+
+            # Models with exhausted quota are only used if every candidate is exhausted
+            available = [name for name in scores if headrooms[name] > 0] or list(scores)
+            model_name = min(available, key=scores.get)
+            self.requests[model_name].append(now)
+
+            decision = {
+                "time": now,
+                "task_class": str(task_class),
+                "prompt_tokens": prompt_tokens,
+                "model": model_name,
+                "scores": {name: round(score, 3) for name, score in scores.items()},
+                "headroom": {name: round(headroom, 3) for name, headroom in headrooms.items()},
+            }
+            self.decisions.append(decision)
+
+        if self.decision_log_path:
+            with open(self.decision_log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(decision) + "\n")
+
+        return model_name
+
+    def record(self, model_name: str, latency: float, usage=None):
+        """
+        Records the observed latency of a finished call (and traces it as "llm" span).
+
+        Args:
+            model_name (str): The model that was called.
+            latency (float): Duration of the call in seconds.
+            usage: Usage metadata of the Gemini response (token counts), if available.
+        """
+        with self.lock:
+            self.latencies[model_name].append(latency)
+
+        cached_tokens = getattr(usage, "cached_content_token_count", None)
+        end = time.time()
+        record_span("llm", end - latency, end,
+                    provider="gemini",
+                    model=model_name,
+                    prompt_tokens=getattr(usage, "prompt_token_count", None),
+                    completion_tokens=getattr(usage, "candidates_token_count", None),
+                    cached_tokens=cached_tokens,
+                    cache_hit=bool(cached_tokens))
+
+    def get_stats(self) -> dict[str, dict]:
+        """p50/p95 latency, number of samples and remaining quota per model."""
+        with self.lock:
+            now = time.time()
+            return {
+                name: {
+                    "p50": self._percentile(name, 0.5),
+                    "p95": self._percentile(name, 0.95),
+                    "samples": len(self.latencies[name]),
+                    "headroom": self._headroom(profile, now),
+                    "profile": asdict(profile),
+                }
+                for name, profile in self.catalog.items()
+            }
+
+
+# Create a singleton instance
+model_router = ModelRouter()
@@ -0,0 +1,113 @@
+import json
+import zlib
+from dataclasses import dataclass, asdict
+
+import numpy as np
+
+from config import Config
+from citations import SearchResult, canonical_url
+from passage_retrieval import split_passages, get_terms
+from task_manager import task_manager, TaskManager
+
+config = Config()
+
+MINHASH_PRIME = (1 << 61) - 1
+MINHASH_SEED = 42
+SHINGLE_SIZE = 3  # words per shingle
+
+
+@dataclass
+class NoveltyPoint:
+    batch: int
+    searches: int  # searches done so far (all batches)
+    new_urls: int
+    urls: int      # URLs cited in the batch
+    new_passages: int
+    passages: int  # passages of the batch
+    novelty: float
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def from_json(cls, data: str) -> "NoveltyPoint":
+        return cls(**json.loads(data))
+
+
+class MinHasher:
+    """MinHash signatures of texts (word shingles, one vectorized universal hash per permutation)."""
+
+    def __init__(self, permutations: int = config.MINHASH_PERMUTATIONS, seed: int = MINHASH_SEED):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, 1 << 31, size=permutations, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 31, size=permutations, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        terms = get_terms(text)
+        shingles = {" ".join(terms[k:k + SHINGLE_SIZE]) for k in range(max(len(terms) - SHINGLE_SIZE + 1, 1))}
+        hashes = np.array([zlib.crc32(shingle.encode("utf-8")) for shingle in shingles], dtype=np.uint64)
+        # a < 2^31 and hashes < 2^32, so the products fit into uint64
+        return ((self.a[:, None] * hashes[None, :] + self.b[:, None]) % MINHASH_PRIME).min(axis=1)
+
+
+class NoveltyTracker:
+    """
+    Measures the marginal novelty of search result batches: the share of cited URLs (canonical)
+    and of passages (near-duplicates found with MinHash LSH) that no earlier batch contained.
+    """
+
+    def __init__(self, bands: int = config.MINHASH_BANDS, min_jaccard: float = config.NOVELTY_DUPLICATE_JACCARD):
+        self.hasher = MinHasher()
+        self.bands = bands
+        self.rows = len(self.hasher.a) // bands
+        self.min_jaccard = min_jaccard
+        self.seen_urls: set[str] = set()
+        self.signatures: list[np.ndarray] = []
+        self.buckets: dict[tuple, list[int]] = {}
+        self.searches = 0
+        self.curve: list[NoveltyPoint] = []
+
+    def _band_keys(self, signature: np.ndarray) -> list[tuple]:
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+    def add_passage(self, text: str) -> bool:
+        """Adds a passage and returns whether it is new (no near-duplicate seen before)."""
+        signature = self.hasher.signature(text)
+        keys = self._band_keys(signature)
+        candidates = {index for key in keys for index in self.buckets.get(key, [])}
+        if any(np.mean(self.signatures[index] == signature) >= self.min_jaccard for index in candidates):
+            return False
+
+        self.signatures.append(signature)
+        for key in keys:
+            self.buckets.setdefault(key, []).append(len(self.signatures) - 1)
+        return True
+
+    def add_batch(self, results: list[SearchResult]) -> NoveltyPoint:
+        """Adds the results of a search batch and returns its novelty (mean of URL and passage novelty)."""
+        urls = {canonical_url(source.url) for result in results for answer in result.answers for source in answer.sources}
+        new_urls = urls - self.seen_urls
+        self.seen_urls |= urls
+
+        passages = [passage for result in results for answer in result.answers for passage in split_passages(answer.text)]
+        new_passages = sum(self.add_passage(passage) for passage in passages)
+
+        shares = [len(new_urls) / len(urls)] if urls else []
+        shares += [new_passages / len(passages)] if passages else []
+        self.searches += len(results)
+        point = NoveltyPoint(
+            batch=len(self.curve),
+            searches=self.searches,
+            new_urls=len(new_urls),
+            urls=len(urls),
+            new_passages=new_passages,
+            passages=len(passages),
+            novelty=sum(shares) / len(shares) if shares else 0.0)
+        self.curve.append(point)
+        return point
+
+
+def get_novelty_curve(task_id: str, manager: TaskManager = task_manager) -> list[NoveltyPoint]:
+    """The novelty curve of a task (one point per search batch, stored by the adaptive search)."""
+    stored = manager.load_checkpoints(task_id, "novelty")
+    return [NoveltyPoint.from_json(stored[key]) for key in sorted(stored, key=int)]
@@ -0,0 +1,206 @@
+import re
+import zlib
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+
+from config import Config
+from citations import ReferenceTable, SearchResult
+from context_packer import (PackedSource, PackedContext, CITATION_PATTERN, TERM_PATTERN,
+                                estimate_tokens, strip_indentation, merge_references, truncate_to_tokens)
+
+config = Config()
+
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+")
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+@dataclass
+class Passage:
+    source_index: int  # Position of the search result (planner order)
+    position: int      # Position of the passage in its search result
+    text: str          # Text with global citation numbers
+    references: set[int] = field(default_factory=set)
+    tokens: int = 0
+    score: float = 0.0
+
+
+def get_terms(text: str) -> list[str]:
+    return TERM_PATTERN.findall(text.lower())
+
+
+def split_passages(text: str, max_tokens: int = config.PASSAGE_TOKENS) -> list[str]:
+    """
+    Splits a text into passages of up to max_tokens: consecutive paragraphs are merged,
+    paragraphs above the limit are split at sentence boundaries.
+    """
+    pieces = []
+    for paragraph in text.split("\n\n"):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) <= max_tokens:
+            pieces.append(paragraph)
+        else:
+            pieces.extend(SENTENCE_PATTERN.split(paragraph))
+
+    passages, current = [], []
+    for piece in pieces:
+        if current and estimate_tokens("\n\n".join(current + [piece])) > max_tokens:
+            passages.append("\n\n".join(current))
+            current = []
+        current.append(truncate_to_tokens(piece, max_tokens))
+    if current:
+        passages.append("\n\n".join(current))
+    return passages
+
+
+def bm25_scores(passage_terms: list[list[str]], queries: list[str]) -> np.ndarray:
+    """
+    BM25 scores of all passages for all queries (the passages are the corpus).
+
+    Returns:
+        np.ndarray: Scores with shape (passages, queries).
+    """
+    query_counts = [Counter(get_terms(query)) for query in queries]
+    vocabulary = {term: k for k, term in enumerate(dict.fromkeys(term for counts in query_counts for term in counts))}
+    if not vocabulary or not passage_terms:
+        return np.zeros((len(passage_terms), len(queries)))
+
+    # Term frequencies of the query terms only
+    tf = np.zeros((len(passage_terms), len(vocabulary)))
+    for row, terms in enumerate(passage_terms):
+        for term, count in Counter(terms).items():
+            if term in vocabulary:
+                tf[row, vocabulary[term]] = count
+
+    query_matrix = np.zeros((len(queries), len(vocabulary)))
+    for row, counts in enumerate(query_counts):
+        for term, count in counts.items():
+            query_matrix[row, vocabulary[term]] = count
+
+    lengths = np.array([len(terms) for terms in passage_terms], dtype=float)
+    document_frequency = (tf > 0).sum(axis=0)
+    idf = np.log(1 + (len(passage_terms) - document_frequency + 0.5) / (document_frequency + 0.5))
+    length_norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / (lengths.mean() or 1.0))
+    weights = tf * (BM25_K1 + 1) / (tf + length_norm[:, None]) * idf
+    return weights @ query_matrix.T
+
+
+def hash_embeddings(texts: list[str], dim: int = config.RETRIEVAL_EMBEDDING_DIM, bigrams: bool = True) -> np.ndarray:
+    """
+    Local embeddings (no API call): signed feature hashing of the terms (and their bigrams), L2 normalized.
+
+    Returns:
+        np.ndarray: Embeddings with shape (texts, dim).
+    """
+    embeddings = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        terms = get_terms(text)
+        features = terms + [f"{a} {b}" for a, b in zip(terms, terms[1:])] if bigrams else terms
+        hashes = np.array([zlib.crc32(feature.encode("utf-8")) for feature in features], dtype=np.uint64)
+        if len(hashes):
+            signs = np.where(hashes & (1 << 31), -1.0, 1.0).astype(np.float32)
+            np.add.at(embeddings[row], (hashes % dim).astype(np.int64), signs)
+
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.where(norms == 0, 1.0, norms)
+
+
+def score_passages(passages: list[Passage], query: str, sub_queries: Optional[list[str]] = None,
+                        use_embeddings: bool = config.RETRIEVAL_EMBEDDINGS) -> np.ndarray:
+    """
+    Relevance of the passages: BM25 (normalized per query), optionally mixed with the cosine similarity
+    of local embeddings. The user query counts config.RETRIEVAL_QUERY_WEIGHT, the best matching sub-query the rest.
+    """
+    queries = [query] + [sub_query for sub_query in (sub_queries or []) if sub_query.strip()]
+    texts = [passage.text for passage in passages]
+
+    scores = bm25_scores([get_terms(text) for text in texts], queries)
+    scores = scores / np.where(scores.max(axis=0) > 0, scores.max(axis=0), 1.0)
+
+    if use_embeddings:
+        similarity = hash_embeddings(texts) @ hash_embeddings(queries).T
+        weight = config.RETRIEVAL_EMBEDDING_WEIGHT
+        scores = (1 - weight) * scores + weight * np.clip(similarity, 0.0, None)
+
+    if len(queries) == 1:
+        return scores[:, 0]
+    return config.RETRIEVAL_QUERY_WEIGHT * scores[:, 0] + (1 - config.RETRIEVAL_QUERY_WEIGHT) * scores[:, 1:].max(axis=1)
+
+
+def retrieve_passages(results: list[str | SearchResult], query: str, sub_queries: Optional[list[str]] = None,
+                        max_tokens: int = config.RETRIEVAL_CONTEXT_TOKENS) -> PackedContext:
+    """
+    Builds the report context from the best passages of the search results (instead of whole results).
+
+    The results are split into passages, every passage is scored against the user query and the planned
+    sub-queries, and the best passages are taken until the token budget is full (k adapts to the budget,
+    passages far below the best one are left out even if there is room). The passages keep their citations
+    and are put back in source order.
+
+    Args:
+        results (list[str | SearchResult]): Search results (in planner order).
+        query (str): The user search query.
+        sub_queries (Optional[list[str]]): The planned search queries.
+        max_tokens (int): Token budget for the context.
+
+    Returns:
+        PackedContext: Same structure as pack_search_results (one packed source per result with selected passages).
+    """
+    references = ReferenceTable()
+    passages = []
+
+    for k, result in enumerate(results):
+        if isinstance(result, SearchResult):
+            text, used = result.render_with_references(references)
+            text = strip_indentation(text)
+        else:
+            text, used = merge_references(result, references)
+
+        for position, passage_text in enumerate(split_passages(text)):
+            cited = {int(ref_id) for ref_id in CITATION_PATTERN.findall(passage_text)} & used
+            passages.append(Passage(k, position, passage_text, cited, estimate_tokens(passage_text)))
+
+    if passages:
+        for passage, score in zip(passages, score_passages(passages, query, sub_queries)):
+            passage.score = float(score)
+
+    # Greedy selection by score within the budget (reference lines count against it)
+    budget = max_tokens - 10 * len(results)
+    min_score = config.RETRIEVAL_MIN_SCORE * max((passage.score for passage in passages), default=0.0)
+    selected, cited = [], set()
+    for passage in sorted(passages, key=lambda passage: passage.score, reverse=True):
+        if passage.score < min_score:
+            break
+        cost = passage.tokens + estimate_tokens(references.format(passage.references - cited))
+        if cost > budget:
+            continue
+        selected.append(passage)
+        cited |= passage.references
+        budget -= cost
+
+    sources = []
+    for passage in sorted(selected, key=lambda passage: (passage.source_index, passage.position)):
+        if not sources or sources[-1].index != passage.source_index:
+            sources.append(PackedSource(index=passage.source_index, text=passage.text))
+        else:
+            sources[-1].text += "\n\n" + passage.text
+        sources[-1].references |= passage.references
+        sources[-1].relevance = max(sources[-1].relevance, passage.score)
+
+    parts = []
+    for source in sources:
+        source.tokens = estimate_tokens(source.text)
+        parts.append(f"# Result query {source.index + 1}:\n{source.text}")
+    if cited:
+        parts.append(f"# References\n{references.format(cited)}")
+
+    print(f"Passage retrieval: {len(selected)} of {len(passages)} passages from {len(sources)} results")
+    text = "\n\n".join(parts)
+    return PackedContext(sources=sources, references=references, text=text, tokens=estimate_tokens(text))
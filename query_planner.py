@@ -0,0 +1,118 @@
+import math
+import time
+from enum import StrEnum
+from typing import Optional
+
+from pydantic import BaseModel, Field
+from google import genai
+from google.genai import types
+
+from config import Config
+from model_router import model_router, TaskClass
+from passage_retrieval import hash_embeddings
+
+config = Config()
+
+
+class QuerySource(StrEnum):
+    """
+    Where a planned query should be searched.
+    """
+    WEB = "web"
+    SCHOLAR = "scholar"
+    NEWS = "news"
+
+
+class PlannedQuery(BaseModel):
+    query: str = Field(description="The search query (plain text, as it would be typed into the search engine).")
+    source: QuerySource = Field(default=QuerySource.WEB, description="Where to search: 'web' (google search), 'scholar' (google scholar, for scientific papers) or 'news' (google news, for recent events).")
+
+
+class QueryPlan(BaseModel):
+    queries: list[PlannedQuery] = Field(description="The search queries, sorted by relevance/impact (most relevant first).")
+
+
+def get_query_plan_prompt(search_query: str, max_queries: int) -> str:
+    return f"""
+    We have to improve the search results given a user search query.
+    Please think of up to {max_queries} search queries (plain text) that would increase the quality of the search results, when we combine all the search results.
+    The queries should cover different aspects of the user search query (no paraphrases of the same query).
+
+    For every query, choose the best source: 'web' (default), 'scholar' (scientific papers) or 'news' (recent events).
+
+    Please sort the queries based on relevance/impact. First queries are more relevant than last.
+
+    # User Search Query:
+    {search_query}
+    """
+
+
+def cluster_queries(queries: list[PlannedQuery], min_similarity: float = config.QUERY_CLUSTER_SIMILARITY
+                        ) -> tuple[list[PlannedQuery], list[tuple[PlannedQuery, PlannedQuery]]]:
+    """
+    Clusters near-paraphrases among the planned queries (local term embeddings, no API call).
+
+    The queries are visited in planner order: a query joins the cluster of the first kept query with the same
+    source that is at least min_similarity similar, otherwise it becomes the representative of a new cluster.
+
+    Returns:
+        tuple: The kept queries (one per cluster, planner order) and the pruned queries with their representative.
+    """
+    if not queries:
+        return [], []
+
+    embeddings = hash_embeddings([planned_query.query for planned_query in queries], bigrams=False)
+    similarity = embeddings @ embeddings.T
+
+    kept, pruned = [], []
+    for k, planned_query in enumerate(queries):
+        representative = next((j for j in kept if queries[j].source == planned_query.source
+                                    and similarity[k, j] >= min_similarity), None)
+        if representative is None:
+            kept.append(k)
+        else:
+            pruned.append((planned_query, queries[representative]))
+
+    return [queries[k] for k in kept], pruned
+
+
+async def plan_search_queries_async(search_query: str, max_queries: int = 10,
+                                        client: Optional[genai.Client] = None, dedupe: bool = True) -> QueryPlan:
+    """
+    Plans the search queries for a user search query with a single structured-output call.
+
+    With dedupe the planner is asked for config.QUERY_OVERPLAN_FACTOR times more queries, near-paraphrases
+    are pruned (see cluster_queries) and the plan is filled up to max_queries with distinct queries.
+
+    Args:
+        search_query (str): The user search query.
+        max_queries (int): Maximum number of planned queries.
+        client (Optional[genai.Client]): Gemini client (a new one is created if not given).
+        dedupe (bool): Prune near-paraphrases.
+
+    Returns:
+        QueryPlan: The planned queries, ranked (most relevant first).
+    """
+    client = client or genai.Client(api_key=config.GEMINI_API_KEY)
+    requested = math.ceil(max_queries * config.QUERY_OVERPLAN_FACTOR) if dedupe else max_queries
+    prompt = get_query_plan_prompt(search_query, requested)
+    model_name = model_router.choose(TaskClass.PLANNING, prompt_tokens=len(prompt) // 4, structured_output=True)
+
+    start = time.time()
+    response = await client.aio.models.generate_content(
+        model=model_name,
+        contents=prompt,
+        config=types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=QueryPlan,
+        )
+    )
+    model_router.record(model_name, time.time() - start, response.usage_metadata)
+
+    plan = QueryPlan.model_validate_json(response.text)
+    if dedupe:
+        plan.queries, pruned = cluster_queries(plan.queries)
+        for planned_query, representative in pruned:
+            print(f"Pruned query: {planned_query.query} (similar to: {representative.query})")
+    plan.queries = plan.queries[:max_queries]
+    return plan
@@ -0,0 +1,215 @@
+import time
+from contextlib import aclosing
+from dataclasses import dataclass
+from enum import StrEnum
+from typing import AsyncIterator, Callable, Optional
+
+from pydantic import BaseModel, Field
+from google import genai
+from google.genai import types
+
+from config import Config
+from llm_gateway import llm_gateway, Provider
+from model_router import model_router
+
+config = Config()
+
+geminiClient = genai.Client(api_key=config.GEMINI_API_KEY)
+
+
+class ReasoningModelResponse(BaseModel):
+    reasoning_content: Optional[str] = Field(description="The reasoning/thinking chain-of-thought output of the model.")
+    final_answer: str = Field(description="The final response/answer of the model (after thinking).")
+
+
+class ReasoningBackend(StrEnum):
+    DEEPSEEK = "deepseek"  # DeepSeek API (deepseek-reasoner)
+    OPENROUTER = "openrouter"  # DeepSeek R1 via OpenRouter
+    GEMINI = "gemini"  # Gemini flash thinking
+
+
+class ReasoningEventType(StrEnum):
+    THOUGHT = "thought"  # Delta of the reasoning/thinking output
+    ANSWER = "answer"  # Delta of the final answer
+    USAGE = "usage"  # Token usage of the call
+    DONE = "done"  # End of the stream
+
+
+@dataclass
+class ReasoningUsage:
+    input_tokens: int = 0
+    output_tokens: int = 0
+    reasoning_tokens: int = 0
+
+
+@dataclass
+class ReasoningEvent:
+    type: ReasoningEventType
+    text: str = ""
+    usage: Optional[ReasoningUsage] = None
+    stopped_early: bool = False  # Only set on DONE: the stop condition ended the stream
+
+
+# Stop conditions get every answer delta and keep their own state, so checking them stays linear in the answer length
+StopCondition = Callable[[str], bool]
+
+
+def stop_after_lines(num_lines: int) -> StopCondition:
+    """Stops once the answer has num_lines complete lines."""
+    count = 0
+
+    def check(delta: str) -> bool:
+        nonlocal count
+        count += delta.count("\n")
+        return count >= num_lines
+
+    return check
+
+
+def stop_after_marker(marker: str) -> StopCondition:
+    """Stops once the answer contains the marker (e.g., the end of a section)."""
+    tail = ""
+
+    def check(delta: str) -> bool:
+        nonlocal tail
+        text = tail + delta
+        if marker in text:
+            return True
+        tail = text[-(len(marker) - 1):] if len(marker) > 1 else ""
+        return False
+
+    return check
+
+
+def stop_after_json_object() -> StopCondition:
+    """Stops once the answer contains one complete JSON object (text before the object is ignored)."""
+    depth, started, in_string, escaped = 0, False, False, False
+
+    def check(delta: str) -> bool:
+        nonlocal depth, started, in_string, escaped
+        for char in delta:
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"' and started:
+                in_string = True
+            elif char == "{":
+                depth += 1
+                started = True
+            elif char == "}" and started:
+                depth -= 1
+                if depth == 0:
+                    return True
+        return False
+
+    return check
+
+
+async def _stream_openai_compatible(provider: Provider, model: str, user_input: str, thought_field: str,
+                                        **kwargs) -> AsyncIterator[ReasoningEvent]:
+    async with aclosing(llm_gateway.stream(
+        provider,
+        model=model,
+        messages=[{"role": "user", "content": user_input}],
+        **kwargs
+    )) as chunks:
+        async for chunk in chunks:
+            if chunk.choices:
+                delta = chunk.choices[0].delta
+                # The reasoning output is an extra field of the delta (reasoning_content at DeepSeek, reasoning at OpenRouter)
+                if thought := getattr(delta, thought_field, None):
+                    yield ReasoningEvent(ReasoningEventType.THOUGHT, thought)
+                if delta.content:
+                    yield ReasoningEvent(ReasoningEventType.ANSWER, delta.content)
+
+            if chunk.usage:
+                details = getattr(chunk.usage, "completion_tokens_details", None)
+                yield ReasoningEvent(ReasoningEventType.USAGE, usage=ReasoningUsage(
+                    input_tokens=chunk.usage.prompt_tokens or 0,
+                    output_tokens=chunk.usage.completion_tokens or 0,
+                    reasoning_tokens=getattr(details, "reasoning_tokens", None) or 0))
+
+
+async def _stream_gemini(user_input: str) -> AsyncIterator[ReasoningEvent]:
+    usage = None
+    start = time.time()
+    try:
+        async with aclosing(await geminiClient.aio.models.generate_content_stream(
+            model=config.FLASH2T_MODEL,
+            contents=user_input,
+            config=types.GenerateContentConfig(
+                thinking_config=types.ThinkingConfig(include_thoughts=True),
+                http_options=types.HttpOptions(api_version='v1alpha'),
+            )
+        )) as chunks:
+            async for chunk in chunks:
+                if chunk.candidates and chunk.candidates[0].content:
+                    for part in chunk.candidates[0].content.parts or []:
+                        if part.text:
+                            event_type = ReasoningEventType.THOUGHT if part.thought else ReasoningEventType.ANSWER
+                            yield ReasoningEvent(event_type, part.text)
+                # Every chunk carries the usage so far, only the last one is reported
+                usage = chunk.usage_metadata or usage
+    finally:
+        model_router.record(config.FLASH2T_MODEL, time.time() - start, usage)
+
+    if usage:
+        yield ReasoningEvent(ReasoningEventType.USAGE, usage=ReasoningUsage(
+            input_tokens=usage.prompt_token_count or 0,
+            output_tokens=usage.candidates_token_count or 0,
+            reasoning_tokens=getattr(usage, "thoughts_token_count", None) or 0))
+
+
+def _get_backend_stream(user_input: str, backend: ReasoningBackend) -> AsyncIterator[ReasoningEvent]:
+    if backend == ReasoningBackend.DEEPSEEK:
+        return _stream_openai_compatible(Provider.DEEPSEEK, config.DEEPSEEK_R1, user_input, "reasoning_content",
+                                            stream_options={"include_usage": True})
+    if backend == ReasoningBackend.OPENROUTER:
+        return _stream_openai_compatible(Provider.OPENROUTER, config.OPENROUTER_DEEPSEEK_R1, user_input, "reasoning",
+                                            extra_body={"include_reasoning": True, "usage": {"include": True}})
+    return _stream_gemini(user_input)
+
+
+async def stream_reasoning(user_input: str, backend: ReasoningBackend = ReasoningBackend.GEMINI,
+                            stop_when: Optional[StopCondition] = None) -> AsyncIterator[ReasoningEvent]:
+    """
+    Streams a reasoning model call as typed events (thought deltas, answer deltas, usage, done),
+    the same for all backends.
+
+    Args:
+        user_input (str): The user's query or input to be processed by the model.
+        backend (ReasoningBackend): The reasoning model backend.
+        stop_when (Optional[StopCondition]): Called with every answer delta (see stop_after_*).
+            When it returns True the stream is closed, so no further tokens are consumed.
+
+    Returns:
+        AsyncIterator[ReasoningEvent]: The events, the last one is always DONE.
+    """
+    stopped_early = False
+    async with aclosing(_get_backend_stream(user_input, backend)) as events:
+        async for event in events:
+            yield event
+            if stop_when and event.type == ReasoningEventType.ANSWER and stop_when(event.text):
+                stopped_early = True
+                break
+
+    yield ReasoningEvent(ReasoningEventType.DONE, stopped_early=stopped_early)
+
+
+async def collect_reasoning(user_input: str, backend: ReasoningBackend = ReasoningBackend.GEMINI,
+                                stop_when: Optional[StopCondition] = None) -> ReasoningModelResponse:
+    """Runs stream_reasoning and joins the thought and answer deltas (kept as chunk lists while streaming)."""
+    thought_chunks, answer_chunks = [], []
+    async for event in stream_reasoning(user_input, backend, stop_when):
+        if event.type == ReasoningEventType.THOUGHT:
+            thought_chunks.append(event.text)
+        elif event.type == ReasoningEventType.ANSWER:
+            answer_chunks.append(event.text)
+
+    return ReasoningModelResponse(
+        reasoning_content="".join(thought_chunks) or None,
+        final_answer="".join(answer_chunks))
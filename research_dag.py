@@ -0,0 +1,429 @@
+import time
+import asyncio
+from dataclasses import dataclass, field
+from enum import StrEnum
+from typing import Any, Awaitable, Callable, Optional
+
+from pydantic import BaseModel, Field
+from google.genai import types
+
+from config import Config
+from agent_utils import AsyncRateLimiter
+from agent_tools import crawl4ai_website_async
+from model_router import model_router, TaskClass
+from citations import CitationSource, CitationSpan, CitedText, SearchResult, canonical_url
+from document_store import document_store
+from search_ranker import rank_search_hits_async
+from telemetry import span
+from passage_retrieval import retrieve_passages
+from context_packer import pack_search_results, estimate_tokens, truncate_to_tokens
+from query_planner import PlannedQuery, plan_search_queries_async
+from extensive_search import (geminiClient, search_planned_query_async, get_report_context_async, get_retrieval_budget,
+                                get_reasoning_chat_async, get_research_report_prompt,
+                                load_checkpoints_async, save_checkpoint_async)
+
+config = Config()
+
+
+class NodeType(StrEnum):
+    PLAN = "plan"            # plans the search queries of the user query
+    SEARCH = "search"        # runs one planned query
+    CRAWL = "crawl"          # crawls one source of a search result
+    SUMMARIZE = "summarize"  # summarizes a round of searches/crawls and finds the open questions
+    FOLLOW_UP = "follow_up"  # plans the search queries for one open question (next depth)
+
+
+class NodeStatus(StrEnum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    SKIPPED = "skipped"  # not run because a budget was exhausted
+
+
+@dataclass
+class ResearchNode:
+    id: int
+    type: NodeType
+    payload: dict
+    depth: int = 0
+    dependencies: set[int] = field(default_factory=set)
+    status: NodeStatus = NodeStatus.PENDING
+    result: Any = None
+    error: Optional[str] = None
+
+
+@dataclass
+class ResearchBudget:
+    max_depth: int = config.DAG_MAX_DEPTH  # follow-up rounds after the first round
+    max_nodes: int = config.DAG_MAX_NODES
+    max_seconds: float = config.DAG_MAX_SECONDS
+    min_novelty: float = config.DAG_MIN_NOVELTY  # share of new sources below which a branch has converged
+
+
+NodeHandler = Callable[["ResearchDAG", ResearchNode], Awaitable[Any]]
+
+
+class ResearchDAG:
+    """
+    Runs a graph of research nodes with explicit dependencies.
+
+    A node becomes ready when all its dependencies are finished (failed dependencies don't block it,
+    the handler sees their missing results). Handlers can extend the graph while it runs, e.g., a search
+    node adds crawl nodes and makes the summarize node of its round wait for them.
+    Ready nodes run concurrently, limited by a global concurrency and per node type limits
+    (concurrency and requests per minute). New nodes are rejected beyond the depth or node budget,
+    and once the time budget is used up no further node is started, running nodes are cancelled
+    and the remaining nodes are skipped.
+    """
+
+    def __init__(self, handlers: dict[NodeType, NodeHandler], budget: Optional[ResearchBudget] = None,
+                    concurrency: int = config.DAG_CONCURRENCY,
+                    type_limits: Optional[dict[NodeType, tuple[int, Optional[int]]]] = None):
+        """
+        Args:
+            handlers (dict[NodeType, NodeHandler]): The coroutine that runs a node, per node type.
+            budget (Optional[ResearchBudget]): Depth, node and time limits.
+            concurrency (int): Max. number of nodes running at the same time.
+            type_limits (Optional[dict[NodeType, tuple[int, Optional[int]]]]): (concurrency, rpm) per node type.
+        """
+        self.handlers = handlers
+        self.budget = budget or ResearchBudget()
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.type_semaphores = {node_type: asyncio.Semaphore(limit) for node_type, (limit, _) in (type_limits or {}).items()}
+        self.type_limiters = {node_type: AsyncRateLimiter(rpm=rpm) for node_type, (_, rpm) in (type_limits or {}).items() if rpm}
+
+        self.nodes: dict[int, ResearchNode] = {}
+        self.start_time = None
+        self.stop_reason: Optional[str] = None
+
+    def add_node(self, node_type: NodeType, payload: dict, depth: int = 0,
+                    depends_on: tuple[int, ...] = (), blocks: tuple[int, ...] = ()) -> Optional[ResearchNode]:
+        """
+        Adds a node to the graph.
+
+        Args:
+            node_type (NodeType): The node type.
+            payload (dict): Input of the handler.
+            depth (int): Research depth of the node (0 = first round).
+            depends_on (tuple[int, ...]): Nodes that have to finish first.
+            blocks (tuple[int, ...]): Pending nodes that have to wait for the new node.
+
+        Returns:
+            Optional[ResearchNode]: The node, None if the depth or node budget doesn't allow it.
+        """
+        if depth > self.budget.max_depth:
+            return None
+        if len(self.nodes) >= self.budget.max_nodes:
+            self.stop_reason = self.stop_reason or "node budget"
+            return None
+
+        node = ResearchNode(id=len(self.nodes), type=node_type, payload=payload, depth=depth, dependencies=set(depends_on))
+        self.nodes[node.id] = node
+        for node_id in blocks:
+            if self.nodes[node_id].status == NodeStatus.PENDING:
+                self.nodes[node_id].dependencies.add(node.id)
+        return node
+
+    def dependency_results(self, node: ResearchNode) -> list[Any]:
+        """Results of the finished dependencies of a node (in the order they were added)."""
+        return [self.nodes[node_id].result for node_id in sorted(node.dependencies)
+                    if self.nodes[node_id].status == NodeStatus.DONE]
+
+    def _time_is_up(self) -> bool:
+        if time.time() - self.start_time < self.budget.max_seconds:
+            return False
+        self.stop_reason = "time budget"
+        return True
+
+    def _is_ready(self, node: ResearchNode) -> bool:
+        finished = (NodeStatus.DONE, NodeStatus.FAILED, NodeStatus.SKIPPED)
+        return node.status == NodeStatus.PENDING and all(self.nodes[node_id].status in finished for node_id in node.dependencies)
+
+    async def _run_node(self, node: ResearchNode):
+        # Per-type slot and rate limit first, so a node waiting for them doesn't hold one of the global slots
+        type_semaphore = self.type_semaphores.get(node.type)
+        if type_semaphore:
+            await type_semaphore.acquire()
+        try:
+            if limiter := self.type_limiters.get(node.type):
+                await limiter.acquire()
+            async with self.semaphore:
+                if self._time_is_up():
+                    # The slot was free only after the time budget
+                    node.status = NodeStatus.SKIPPED
+                    return
+                with span(f"dag.{node.type}", node_id=node.id, depth=node.depth):
+                    node.result = await self.handlers[node.type](self, node)
+            node.status = NodeStatus.DONE
+        except Exception as e:
+            print(f"Research node {node.id} ({node.type}) failed: {e}")
+            node.status = NodeStatus.FAILED
+            node.error = str(e)
+        finally:
+            if type_semaphore:
+                type_semaphore.release()
+
+    async def run(self):
+        """Runs the graph until no node is left (or the time budget is used up)."""
+        self.start_time = time.time()
+        running: dict[asyncio.Task, ResearchNode] = {}
+
+        while True:
+            for node in [node for node in self.nodes.values() if self._is_ready(node)]:
+                if self._time_is_up():
+                    break
+                node.status = NodeStatus.RUNNING
+                running[asyncio.create_task(self._run_node(node))] = node
+
+            if not running:
+                break
+
+            remaining_time = self.budget.max_seconds - (time.time() - self.start_time)
+            done, _ = await asyncio.wait(running, timeout=max(remaining_time, 0), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                running.pop(task)
+
+            if not done:
+                self.stop_reason = "time budget"
+                for task, node in running.items():
+                    task.cancel()
+                    node.status = NodeStatus.SKIPPED
+                await asyncio.gather(*running, return_exceptions=True)
+                break
+
+        for node in self.nodes.values():
+            if node.status == NodeStatus.PENDING:
+                node.status = NodeStatus.SKIPPED
+
+    def get_stats(self) -> dict:
+        stats = {"nodes": len(self.nodes), "stop_reason": self.stop_reason or "converged",
+                    "seconds": round(time.time() - (self.start_time or time.time()), 1)}
+        for node in self.nodes.values():
+            key = f"{node.type}_{node.status}"
+            stats[key] = stats.get(key, 0) + 1
+        return stats
+
+
+class RoundSummary(BaseModel):
+    findings: str = Field(description="The main findings of the search results with their citations (e.g. '... [3]').")
+    open_questions: list[str] = Field(description="Search queries for the most important gaps that the search results don't answer yet (empty if the search results are sufficient).")
+
+
+def get_round_summary_prompt(search_query: str, results_text: str, max_questions: int) -> str:
+    return f"""
+        Please summarize the main findings of the following search results with respect to the user search query.
+        Keep the citations exactly as they are in the input text (e.g. "... affected the stock market [12].").
+
+        Then name up to {max_questions} search queries for the most important open questions that the search results don't answer.
+        Don't repeat aspects that are already covered. Return no queries if the search results answer the user search query.
+
+        # User Search Query:
+        {search_query}
+
+        # Search Results (text):
+        {results_text}
+        """
+
+
+def crawled_document_result(url: str, text: str) -> SearchResult:
+    """A crawled document as search result (the whole text cites its URL)."""
+    text = truncate_to_tokens(text, config.DAG_CRAWL_TOKENS)
+    return SearchResult(query=url, answers=[CitedText(
+        text=text,
+        spans=[CitationSpan(start=0, end=len(text), ref_ids=[1])],
+        sources=[CitationSource(ref_id=1, url=url)],
+        provider="crawled page")])
+
+
+class ResearchGraph:
+    """
+    Iterative multi-branch deep research on top of ResearchDAG (see system_prompts/chain_of_agents.txt).
+
+    Round 0: plan -> searches (-> crawls of their top sources) -> summarize.
+    Every summarize node checks the novelty of its round (share of sources not seen before). If the branch
+    hasn't converged, every open question becomes a follow-up node, which plans its own searches and
+    summarize node one level deeper. Branches run concurrently, queries and crawled URLs are never repeated.
+
+    With a task id, search results (by query) and crawled documents (by URL) are checkpointed,
+    a resumed task takes them from the checkpoints instead of searching/crawling again.
+    Crawled documents are also kept in the shared document store: a run starts with the stored documents
+    that match the user query, and pages crawled by earlier runs are taken from the store.
+    """
+
+    def __init__(self, search_query: str, budget: Optional[ResearchBudget] = None, task_id: Optional[str] = None):
+        self.search_query = search_query
+        self.task_id = task_id
+        self.seen_queries: set[str] = set()
+        self.seen_urls: set[str] = set()
+        self.stored_urls: set[str] = set()  # URLs of the documents the run started with
+        self.results: list[SearchResult] = []
+        self.stored: dict[str, dict[str, str]] = {}  # stage -> key -> checkpoint
+
+        self.dag = ResearchDAG(
+            handlers={
+                NodeType.PLAN: self._plan,
+                NodeType.SEARCH: self._search,
+                NodeType.CRAWL: self._crawl,
+                NodeType.SUMMARIZE: self._summarize,
+                NodeType.FOLLOW_UP: self._follow_up,
+            },
+            budget=budget,
+            type_limits={
+                NodeType.SEARCH: (config.SEARCH_CONCURRENCY, config.DAG_SEARCH_RPM),
+                NodeType.CRAWL: (config.CRAWL_CONCURRENCY, None),
+                NodeType.PLAN: (config.DAG_CONCURRENCY, config.DAG_LLM_RPM),
+                NodeType.SUMMARIZE: (config.DAG_CONCURRENCY, config.DAG_LLM_RPM),
+                NodeType.FOLLOW_UP: (config.DAG_CONCURRENCY, config.DAG_LLM_RPM),
+            })
+
+    def _add_searches(self, queries: list[PlannedQuery], depth: int, summarize_id: int):
+        for planned_query in queries:
+            key = planned_query.query.strip().lower()
+            if key in self.seen_queries:
+                continue
+            self.seen_queries.add(key)
+            self.dag.add_node(NodeType.SEARCH, {"query": planned_query}, depth, blocks=(summarize_id,))
+
+    async def _plan_round(self, query: str, max_queries: int, depth: int):
+        plan = await plan_search_queries_async(query, max_queries, geminiClient)
+        summarize = self.dag.add_node(NodeType.SUMMARIZE, {}, depth)
+        if summarize:
+            self._add_searches(plan.queries, depth, summarize.id)
+        return plan
+
+    async def _plan(self, dag: ResearchDAG, node: ResearchNode):
+        return await self._plan_round(self.search_query, config.DAG_QUERIES_PER_ROUND, node.depth)
+
+    async def _follow_up(self, dag: ResearchDAG, node: ResearchNode):
+        print(f"Follow-up (depth {node.depth}): {node.payload['question']}")
+        query = f"{node.payload['question']}\n\n(Open question of the research on: {self.search_query})"
+        return await self._plan_round(query, config.DAG_QUERIES_PER_FOLLOW_UP, node.depth)
+
+    async def _search(self, dag: ResearchDAG, node: ResearchNode) -> SearchResult:
+        planned_query = node.payload["query"]
+        if stored := self.stored["search"].get(planned_query.query):
+            result = SearchResult.from_json(stored)
+        else:
+            print(f"Search query ({planned_query.source}, depth {node.depth}): {planned_query.query}")
+            result = await search_planned_query_async(planned_query)
+            await save_checkpoint_async(self.task_id, "search", planned_query.query, result.to_json())
+        self.results.append(result)
+
+        # Crawl the best sources of the result, ranked locally (the summarize node of this round waits for them).
+        # Grounding sources link to a redirect, their title is the domain of the site (see search_ranker.get_hit_host)
+        blocking = tuple(node_id for node_id, other in dag.nodes.items()
+                            if other.type == NodeType.SUMMARIZE and node.id in other.dependencies)
+        hits = [{"link": source.url, "title": source.title or "", "position": position + 1}
+                    for answer in result.answers for position, source in enumerate(answer.sources)]
+        crawls = 0
+        for hit in await rank_search_hits_async(planned_query.query, hits, cutoff=config.DAG_CRAWLS_PER_SEARCH):
+            if crawls >= config.DAG_CRAWLS_PER_SEARCH:
+                break
+            url = canonical_url(hit["link"])
+            if url in self.seen_urls or url in self.stored_urls or any(other.payload.get("url") == url for other in dag.nodes.values()):
+                continue
+            if dag.add_node(NodeType.CRAWL, {"url": url, "link": hit["link"]}, node.depth, blocks=blocking):
+                crawls += 1
+        return result
+
+    async def _crawl(self, dag: ResearchDAG, node: ResearchNode) -> SearchResult:
+        if stored := self.stored["crawl"].get(node.payload["url"]):
+            result = SearchResult.from_json(stored)
+        else:
+            with span("crawl.lookup", url=node.payload["link"]) as lookup_span:
+                document = await asyncio.to_thread(document_store.get_by_url, node.payload["link"])
+                lookup_span.set(cache_hit=bool(document))
+            if document:
+                text = document.content
+            else:
+                print(f"Crawling: {node.payload['link']}")
+                text = await crawl4ai_website_async(node.payload["link"])
+                if not text:
+                    raise ValueError("Empty page")
+                await asyncio.to_thread(document_store.add_document, node.payload["link"], text,
+                                        query=self.search_query)
+            result = crawled_document_result(node.payload["link"], text)
+            await save_checkpoint_async(self.task_id, "crawl", node.payload["url"], result.to_json())
+        self.results.append(result)
+        return result
+
+    def _novelty(self, results: list[SearchResult]) -> float:
+        # Share of the cited sources of a round that no earlier round has seen
+        urls = {canonical_url(source.url) for result in results for answer in result.answers for source in answer.sources}
+        new_urls = urls - self.seen_urls
+        self.seen_urls |= urls
+        return len(new_urls) / len(urls) if urls else 0.0
+
+    async def _summarize(self, dag: ResearchDAG, node: ResearchNode) -> RoundSummary:
+        results = [result for result in dag.dependency_results(node) if isinstance(result, SearchResult)]
+
+        novelty = self._novelty(results)
+        print(f"Round at depth {node.depth}: {len(results)} results, novelty {novelty:.2f}")
+
+        packed = pack_search_results(results, self.search_query, config.MAP_REDUCE_GROUP_TOKENS)
+        prompt = get_round_summary_prompt(self.search_query, packed.text, config.DAG_FOLLOW_UPS_PER_ROUND)
+        model_name = model_router.choose(TaskClass.SUMMARIZATION, prompt_tokens=estimate_tokens(prompt), structured_output=True)
+        start = time.time()
+        response = await geminiClient.aio.models.generate_content(
+            model=model_name,
+            contents=prompt,
+            config=types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_schema=RoundSummary,
+            )
+        )
+        model_router.record(model_name, time.time() - start, response.usage_metadata)
+        summary = RoundSummary.model_validate_json(response.text)
+
+        # Convergence: the round found (almost) nothing new, or there is nothing left to ask
+        if novelty < dag.budget.min_novelty or not summary.open_questions:
+            print(f"Branch converged at depth {node.depth}")
+            return summary
+
+        for question in summary.open_questions[:config.DAG_FOLLOW_UPS_PER_ROUND]:
+            dag.add_node(NodeType.FOLLOW_UP, {"question": question}, node.depth + 1, depends_on=(node.id,))
+        return summary
+
+    async def run(self) -> list[SearchResult]:
+        """Runs the research graph and returns all search results and crawled documents."""
+        for stage in ("search", "crawl"):
+            self.stored[stage] = await load_checkpoints_async(self.task_id, stage)
+
+        # Already crawled material first
+        documents = await asyncio.to_thread(document_store.hybrid_search, self.search_query,
+                                                limit=config.DOCUMENT_STORE_SEED_RESULTS)
+        for document in documents:
+            self.stored_urls.add(canonical_url(document.url))
+            self.results.append(crawled_document_result(document.url, document.content))
+        if documents:
+            print(f"Starting with {len(documents)} stored documents")
+
+        self.dag.add_node(NodeType.PLAN, {"query": self.search_query})
+        await self.dag.run()
+        print(f"Research graph finished: {self.dag.get_stats()}")
+        return self.results
+
+
+async def run_dag_research_async(search_query: str, budget: Optional[ResearchBudget] = None,
+                                    task_id: Optional[str] = None) -> str:
+    """
+    Research pipeline with the research graph instead of a single search round, the best passages of
+    the collected results (map-reduced if needed) go into the same report prompt as run_research_async.
+    With a task id the searches, crawls and the report are checkpointed.
+    """
+    if report := (await load_checkpoints_async(task_id, "report")).get("draft"):
+        print("Resuming from checkpoint: report")
+        return report
+
+    graph = ResearchGraph(search_query, budget, task_id)
+    results = await graph.run()
+
+    packed = retrieve_passages(results, search_query, sorted(graph.seen_queries), get_retrieval_budget(results))
+    result_text = await get_report_context_async(search_query, packed)
+
+    print("Writing report now ...")
+    reasoning_chat = get_reasoning_chat_async()
+    report = await reasoning_chat(get_research_report_prompt(search_query, result_text))
+    await save_checkpoint_async(task_id, "report", "draft", report)
+    return report
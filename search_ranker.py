@@ -0,0 +1,203 @@
+import re
+import math
+import asyncio
+from datetime import datetime, timedelta
+from typing import Optional
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from config import Config
+from passage_retrieval import bm25_scores, get_terms
+
+config = Config()
+
+# Quality priors of domains (0 = low value, 1 = high value), a domain also matches its subdomains.
+# Domains that aren't listed get NEUTRAL_DOMAIN_PRIOR.
+DOMAIN_PRIORS = {
+    "wikipedia.org": 0.8,
+    "arxiv.org": 0.9,
+    "nature.com": 0.9,
+    "science.org": 0.9,
+    "sciencedirect.com": 0.85,
+    "springer.com": 0.85,
+    "ieee.org": 0.85,
+    "acm.org": 0.85,
+    "nih.gov": 0.9,
+    "who.int": 0.85,
+    "github.com": 0.7,
+    "stackoverflow.com": 0.7,
+    "reuters.com": 0.75,
+    "apnews.com": 0.75,
+    "medium.com": 0.4,
+    "reddit.com": 0.35,
+    "quora.com": 0.2,
+    "pinterest.com": 0.05,
+    "facebook.com": 0.1,
+    "instagram.com": 0.05,
+    "tiktok.com": 0.05,
+    "x.com": 0.15,
+    "twitter.com": 0.15,
+}
+TLD_PRIORS = {"gov": 0.8, "edu": 0.8, "int": 0.75, "org": 0.6}
+NEUTRAL_DOMAIN_PRIOR = 0.5
+# Google search grounding links point to this redirect host, the title of the source is the domain of the site
+GROUNDING_REDIRECT_HOST = "vertexaisearch.cloud.google.com"
+UNKNOWN_FRESHNESS = 0.5
+
+RELATIVE_DATE_PATTERN = re.compile(r"(\d+)\s+(minute|hour|day|week|month|year)s?\s+ago", re.IGNORECASE)
+YEAR_PATTERN = re.compile(r"\b(19|20)\d{2}\b")
+DATE_FORMATS = ("%b %d, %Y", "%B %d, %Y", "%d %b %Y", "%d %B %Y", "%Y-%m-%d", "%d.%m.%Y")
+RELATIVE_UNITS = {
+    "minute": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+    "week": timedelta(weeks=1),
+    "month": timedelta(days=30),
+    "year": timedelta(days=365),
+}
+
+
+def get_hit_host(hit: dict) -> str:
+    """Host of the site of a search hit (for grounding redirect links the domain given as title)."""
+    host = (urlsplit(hit.get("link", "")).hostname or "").lower()
+    if host == GROUNDING_REDIRECT_HOST:
+        return hit.get("title", "").strip().lower()
+    return host
+
+
+def get_domain_prior(host: str) -> float:
+    """Quality prior of a domain (the most specific listed domain wins)."""
+    labels = host.lower().removeprefix("www.").split(".")
+    for k in range(len(labels) - 1):
+        domain = ".".join(labels[k:])
+        if domain in DOMAIN_PRIORS:
+            return DOMAIN_PRIORS[domain]
+    return TLD_PRIORS.get(labels[-1], NEUTRAL_DOMAIN_PRIOR)
+
+
+def parse_hit_date(value, now: Optional[datetime] = None) -> Optional[datetime]:
+    """Parses the date of a search hit ("3 days ago", "Mar 5, 2024", a year, ...), None if there is none."""
+    if value is None or value == "":
+        return None
+    now = now or datetime.now()
+    text = str(value).strip()
+
+    if match := RELATIVE_DATE_PATTERN.search(text):
+        return now - int(match.group(1)) * RELATIVE_UNITS[match.group(2).lower()]
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format)
+        except ValueError:
+            continue
+    if match := YEAR_PATTERN.search(text):
+        return datetime(int(match.group(0)), 7, 1)
+    return None
+
+
+def get_freshness(value, now: Optional[datetime] = None) -> float:
+    """Exponential decay of the age of a hit (1 = today, 0.5 after config.RANKER_HALF_LIFE_DAYS)."""
+    now = now or datetime.now()
+    date = parse_hit_date(value, now)
+    if date is None:
+        return UNKNOWN_FRESHNESS
+    age_days = max((now - date).days, 0)
+    return math.exp(-math.log(2) * age_days / config.RANKER_HALF_LIFE_DAYS)
+
+
+def score_search_hits(query: str, hits: list[dict], now: Optional[datetime] = None) -> np.ndarray:
+    """
+    Local relevance scores of search hits (Serper organic/scholar/news items) without LLM calls.
+
+    All hits are scored in one batch: BM25 of title and snippet against the query (normalized to the best hit),
+    domain quality prior, freshness of the date and the search engine position.
+
+    Returns:
+        np.ndarray: One score per hit (between 0 and 1).
+    """
+    if not hits:
+        return np.zeros(0)
+
+    texts = [f"{hit.get('title', '')} {hit.get('snippet', '')}" for hit in hits]
+    relevance = bm25_scores([get_terms(text) for text in texts], [query])[:, 0]
+    relevance = relevance / (relevance.max() or 1.0)
+
+    domain = np.array([get_domain_prior(get_hit_host(hit)) for hit in hits])
+    freshness = np.array([get_freshness(hit.get("date") or hit.get("year"), now) for hit in hits])
+    positions = np.array([hit.get("position") or k + 1 for k, hit in enumerate(hits)], dtype=float)
+    rank_prior = 1 / np.sqrt(positions)
+
+    weights = np.array([config.RANKER_RELEVANCE_WEIGHT, config.RANKER_DOMAIN_WEIGHT,
+                            config.RANKER_FRESHNESS_WEIGHT, config.RANKER_POSITION_WEIGHT])
+    features = np.stack([relevance, domain, freshness, rank_prior], axis=1)
+    return features @ weights / weights.sum()
+
+
+def rank_search_hits(query: str, hits: list[dict], top_n: Optional[int] = None) -> list[dict]:
+    """
+    Sorts search hits by their local score (best first, the score is added as "score").
+
+    Args:
+        query (str): The search query.
+        hits (list[dict]): Serper items with title, link, snippet, date/year and position.
+        top_n (Optional[int]): Number of hits to keep (None = all).
+    """
+    scores = score_search_hits(query, hits)
+    ranked = [dict(hit, score=float(score)) for hit, score in zip(hits, scores)]
+    ranked.sort(key=lambda hit: hit["score"], reverse=True)
+    return ranked if top_n is None else ranked[:top_n]
+
+
+async def judge_uncertain_hits_async(query: str, hits: list[dict], cutoff_score: float,
+                                        margin: float = config.RANKER_LLM_MARGIN,
+                                        max_hits: int = config.RANKER_LLM_MAX_HITS) -> list[dict]:
+    """
+    Asks the LLM only about the hits the local score can't decide: hits within margin of the cutoff score
+    (closest first, at most max_hits) get a relevance rating (batched with concurrent checks, see llm_batcher),
+    which is mixed into their score. Without a rating (failed call) a hit keeps its local score.
+    Only used with config.RANKER_LLM_JUDGE (see rank_search_hits_async).
+
+    Args:
+        query (str): The search query.
+        hits (list[dict]): Hits with a "score" (see rank_search_hits).
+        cutoff_score (float): Score that decides whether a hit is used (e.g., crawled).
+
+    Returns:
+        list[dict]: The hits sorted by their new score (best first).
+    """
+    from llm_batcher import rate_relevance_async
+
+    uncertain = sorted((hit for hit in hits if abs(hit["score"] - cutoff_score) <= margin),
+                        key=lambda hit: abs(hit["score"] - cutoff_score))[:max_hits]
+    ratings = await asyncio.gather(
+        *(rate_relevance_async(query, f"{hit.get('title', '')}\n{hit.get('link', '')}\n{hit.get('snippet', '')}")
+            for hit in uncertain),
+        return_exceptions=True)
+
+    for hit, rating in zip(uncertain, ratings):
+        if isinstance(rating, Exception):
+            print(f"Relevance rating failed (local score is kept): {rating}")
+            continue
+        hit["score"] = (1 - config.RANKER_LLM_WEIGHT) * hit["score"] + config.RANKER_LLM_WEIGHT * rating / 100
+
+    return sorted(hits, key=lambda hit: hit["score"], reverse=True)
+
+
+async def rank_search_hits_async(query: str, hits: list[dict], top_n: Optional[int] = None,
+                                    cutoff: int = config.CRAWL_TOP_N) -> list[dict]:
+    """
+    rank_search_hits, with config.RANKER_LLM_JUDGE the hits around the cutoff rank (the first cutoff hits
+    are used) get an LLM rating if the local score doesn't separate them (no LLM call for a clear cutoff).
+
+    Args:
+        query (str): The search query.
+        hits (list[dict]): Serper items with title, link, snippet, date/year and position.
+        top_n (Optional[int]): Number of hits to keep (None = all).
+        cutoff (int): Number of hits that are used (e.g., crawled), only hits close to its score are judged.
+    """
+    ranked = rank_search_hits(query, hits)
+    if config.RANKER_LLM_JUDGE and 0 < cutoff < len(ranked):
+        # Between the last used and the first unused hit, both count as uncertain only if they are close
+        cutoff_score = (ranked[cutoff - 1]["score"] + ranked[cutoff]["score"]) / 2
+        ranked = await judge_uncertain_hits_async(query, ranked, cutoff_score)
+    return ranked if top_n is None else ranked[:top_n]
@@ -1,11 +1,16 @@
 import streamlit as st
 import numpy as np
+import time
+import asyncio
 from datetime import datetime
 import pandas as pd
 
 from agent_tools import BasicSearchModel, ReasoningModel
-from extensive_search import run_research
+from agent_utils import iterate_sync
+from extensive_search import stream_research_async
 from task_manager import task_manager, TaskStatus
+from deep_research_jobs import DEEP_RESEARCH_TASK_TYPE, start_deep_research_job
+from telemetry import start_metrics_server
 
 st.set_page_config(page_title="DeepResearchHS", 
                     page_icon=":books:", 
@@ -37,9 +42,31 @@ def save_markdown(content, filename):
         f.write(content)
     return filename
 
+async def run_research_task(task_id, search_query):
+    """
+    Runs the research pipeline and stores the streamed report as partial result (about once per second).
+    The stages are checkpointed, a retried or recovered task continues from them.
+    """
+    chunks = []
+    last_update = time.time()
+    async for chunk in stream_research_async(search_query, task_id=task_id):
+        chunks.append(chunk)
+        if time.time() - last_update > 1:
+            await asyncio.to_thread(task_manager.update_partial_result, task_id, "".join(chunks))
+            last_update = time.time()
+
+    return "".join(chunks)
+
+task_manager.register_task_type("DeepResearch (Google)", run_research_task)
+
 def main():
     st.title("DeepResearchHS")
 
+    # Restart the tasks that were running when the last process stopped (no-op once they are running)
+    task_manager.recover_tasks()
+    # Prometheus metrics endpoint (no-op unless config.METRICS_PORT is set, started once per process)
+    start_metrics_server()
+
     # Create tabs for main interface and task management
     tab1, tab2 = st.tabs(["Research", "Task Queue"])
     
@@ -56,13 +83,19 @@ def main():
         if button and search_query_text:
             if model_selector == "Quick Search (Google)":
                 # Direct execution for Quick Search
+                searchAgent = BasicSearchModel() 
+                response_title = "Quick Search Result"
+                
+                st.markdown(f"## {response_title}")
                 with st.spinner(f"Running {model_selector}..."):
-                    searchAgent = BasicSearchModel() 
-                    response = searchAgent(search_query_text)
-                    response_title = "Quick Search Result"
-                    
-                    st.markdown(f"## {response_title}")
-                    st.markdown(response)
+                    results = []
+                    result_area = st.empty()
+                    with result_area.container():
+                        response = st.write_stream(iterate_sync(searchAgent.stream_async(search_query_text, results.append)))
+                    if results:
+                        # Replace the streamed text by the complete result with its inline citations
+                        response = results[0].render()
+                        result_area.markdown(response)
                     
                     # Add download button for the result
                     st.download_button(
@@ -74,15 +107,13 @@ def main():
             else:
                 # Add task to queue for other modes
                 try:
-                    # Add task to queue
-                    task_id = task_manager.add_task(search_query_text, model_selector)
-                    
-                    # Start the task in the background
-                    if model_selector == "Perplexitiy DeepSearch":
-                        #task_manager.start_task(task_id, get_article, search_query_text)
-                        pass
+                    # Add task to queue and start it in the background
+                    if model_selector == DEEP_RESEARCH_TASK_TYPE:
+                        # Runs as Perplexity async job (tracked in the task database, resumed after restarts)
+                        start_deep_research_job(search_query_text)
                     elif model_selector == "DeepResearch (Google)":
-                        task_manager.start_task(task_id, run_research, search_query_text)
+                        task_id = task_manager.add_task(search_query_text, model_selector)
+                        task_manager.start_task(task_id, run_research_task, task_id, search_query_text)
                     
                     st.success(f"Query added to Task Queue! Check the Task Queue tab for progress.")
                     
@@ -133,10 +164,17 @@ def main():
                     st.write(f"**Query:** {task['query']}")
                     st.write(f"**Type:** {task['task_type']}")
                     st.write(f"**Status:** {task['status']}")
+                    if task.get('external_status'):
+                        st.write(f"**Provider Job Status:** {task['external_status']}")
                     
                     elapsed_time, is_running = task_manager.get_task_elapsed_time(task['id'])
                     st.write(f"**Elapsed Time:** {format_time_delta(elapsed_time)}")
                     
+                    # LLM tokens, search calls, crawled bytes, cache hits and stage times of the task
+                    if ledger := task_manager.get_task_ledger(task['id']):
+                        st.write("**Resources:**")
+                        st.json(ledger, expanded=False)
+                    
                     # Show cancel button for running or queued tasks
                     if task['status'] in [TaskStatus.QUEUED, TaskStatus.RUNNING]:
                         if st.button(f"Cancel Task", key=f"cancel_{task['id']}"):
@@ -146,6 +184,20 @@ def main():
                             else:
                                 st.error("Failed to cancel task.")
                     
+                    # Failed tasks can be retried (they continue from their last checkpoint)
+                    if task['status'] == TaskStatus.FAILED:
+                        if st.button(f"Retry Task", key=f"retry_{task['id']}"):
+                            if task_manager.retry_task(task['id']):
+                                st.success("Task restarted!")
+                                st.rerun()
+                            else:
+                                st.error("Failed to retry task.")
+                    
+                    # Show the streamed report of running tasks
+                    if task['status'] == TaskStatus.RUNNING and task.get('partial_result'):
+                        st.markdown("### Report (in progress):")
+                        st.markdown(task['partial_result'])
+                    
                     # Show result for completed tasks
                     if task['status'] == TaskStatus.COMPLETED and task['result']:
                         st.markdown("### Result:")
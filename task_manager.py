@@ -1,13 +1,20 @@
 import sqlite3
 import os
+import asyncio
 import time
 import json
 import threading
 import uuid
 from datetime import datetime
+from concurrent.futures import Future, InvalidStateError
 from enum import Enum
 from typing import List, Dict, Any, Optional, Tuple
 
+from config import Config
+from telemetry import span, record_transition, collect_ledger, TaskLedger
+
+config = Config()
+
 class TaskStatus(str, Enum):
     QUEUED = "Queued"
     RUNNING = "Running"
@@ -19,7 +26,11 @@ class TaskManager:
     def __init__(self, db_path="tasks.db"):
         self.db_path = db_path
         self.tasks_lock = threading.Lock()
-        self.running_tasks = {}  # Store thread objects
+        self.running_tasks = {}  # Store thread objects (or futures for async tasks)
+        self.loop = None  # Shared event loop for async tasks (created on first use)
+        self.loop_lock = threading.Lock()
+        self.task_types = {}  # task_type -> task function (used to restart recovered tasks)
+        self.heartbeat_thread = None  # Keeps the running tasks of this process alive (started on first use)
         self._init_db()
     
     def _init_db(self):
@@ -35,11 +46,46 @@ class TaskManager:
                 started_at REAL,
                 completed_at REAL,
                 result TEXT,
-                error TEXT
+                error TEXT,
+                partial_result TEXT,
+                external_id TEXT,
+                external_status TEXT,
+                args TEXT,
+                owner_pid INTEGER,
+                heartbeat_at REAL
+            )
+            ''')
+            self._add_missing_columns(conn, {"partial_result": "TEXT", "external_id": "TEXT", "external_status": "TEXT", "args": "TEXT",
+                                                "owner_pid": "INTEGER", "heartbeat_at": "REAL"})
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                task_id TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                key TEXT NOT NULL,
+                data TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (task_id, stage, key)
+            )
+            ''')
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS ledger (
+                task_id TEXT NOT NULL,
+                category TEXT NOT NULL,
+                name TEXT NOT NULL,
+                metric TEXT NOT NULL,
+                value REAL NOT NULL,
+                PRIMARY KEY (task_id, category, name, metric)
             )
             ''')
             conn.commit()
     
+    def _add_missing_columns(self, conn, columns: Dict[str, str]):
+        """Add columns that are missing in databases created by older versions."""
+        existing = {row[1] for row in conn.execute('PRAGMA table_info(tasks)')}
+        for name, column_type in columns.items():
+            if name not in existing:
+                conn.execute(f'ALTER TABLE tasks ADD COLUMN {name} {column_type}')
+    
     def add_task(self, query: str, task_type: str) -> str:
         """Add a new task to the queue and return its ID."""
         task_id = str(uuid.uuid4())
@@ -61,6 +107,7 @@ class TaskManager:
             ''', (task_id, query, task_type, TaskStatus.QUEUED, created_at))
             conn.commit()
         
+        record_transition(task_id, TaskStatus.QUEUED, task_type=task_type)
         return task_id
     
     def start_task(self, task_id: str, task_func, *args, **kwargs):
@@ -73,14 +120,201 @@ class TaskManager:
             if task[0] != TaskStatus.QUEUED:
                 raise ValueError(f"Task {task_id} is not in QUEUED state")
             
-            # Update task status to RUNNING
+            # Update task status to RUNNING (the arguments are kept to restart the task after a crash)
             started_at = time.time()
             conn.execute('''
-            UPDATE tasks SET status = ?, started_at = ?
+            UPDATE tasks SET status = ?, started_at = COALESCE(started_at, ?), args = ?, owner_pid = ?, heartbeat_at = ?
             WHERE id = ?
-            ''', (TaskStatus.RUNNING, started_at, task_id))
+            ''', (TaskStatus.RUNNING, started_at, self._serialize_args(args, kwargs), os.getpid(), started_at, task_id))
             conn.commit()
         
+        record_transition(task_id, TaskStatus.RUNNING)
+        self._launch_task(task_id, task_func, *args, **kwargs)
+    
+    def _serialize_args(self, args: tuple, kwargs: dict) -> Optional[str]:
+        try:
+            return json.dumps({"args": list(args), "kwargs": kwargs})
+        except TypeError:
+            return None  # Not JSON serializable, the task can't be restarted automatically
+    
+    def register_task_type(self, task_type: str, task_func):
+        """Register the task function of a task type, so recovered or retried tasks of this type can be restarted."""
+        self.task_types[task_type] = task_func
+    
+    def _restart_task(self, task: Dict[str, Any]) -> bool:
+        task_func = self.task_types.get(task['task_type'])
+        if not task_func or not task.get('args'):
+            return False
+        
+        stored = json.loads(task['args'])
+        self.start_task(task['id'], task_func, *stored["args"], **stored["kwargs"])
+        return True
+    
+    def _requeue_orphaned_tasks(self, task_types: List[str]) -> List[str]:
+        """
+        Re-enqueue the RUNNING tasks whose owner process stopped (crash/restart): tasks without a heartbeat
+        for config.TASK_HEARTBEAT_TIMEOUT seconds. Tasks of live processes (e.g., a Streamlit app sharing
+        the database) keep running, and two processes never claim the same task.
+        """
+        if not task_types:
+            return []
+        
+        cutoff = time.time() - config.TASK_HEARTBEAT_TIMEOUT
+        requeued = []
+        with self.tasks_lock, sqlite3.connect(self.db_path) as conn:
+            rows = conn.execute(f'''
+            SELECT id FROM tasks WHERE status = ? AND COALESCE(heartbeat_at, 0) < ?
+            AND task_type IN ({",".join("?" * len(task_types))})
+            ''', (TaskStatus.RUNNING, cutoff, *task_types)).fetchall()
+            for (task_id,) in rows:
+                if task_id in self.running_tasks:
+                    continue
+                # Only if no other process claimed the task meanwhile
+                updated = conn.execute('''
+                UPDATE tasks SET status = ?, owner_pid = NULL WHERE id = ? AND status = ? AND COALESCE(heartbeat_at, 0) < ?
+                ''', (TaskStatus.QUEUED, task_id, TaskStatus.RUNNING, cutoff)).rowcount
+                if updated:
+                    requeued.append(task_id)
+            conn.commit()
+        
+        for task_id in requeued:
+            record_transition(task_id, TaskStatus.QUEUED, recovered=True)
+        return requeued
+    
+    def recover_tasks(self, task_type: Optional[str] = None) -> List[str]:
+        """
+        Restart the tasks whose process stopped while they were RUNNING (they continue from their checkpoints).
+        Only tasks of registered task types with stored arguments are restarted, repeated calls are no-ops.
+        
+        Args:
+            task_type: Only tasks of this type (default: all registered task types)
+        
+        Returns:
+            List[str]: The ids of the restarted tasks.
+        """
+        task_types = [name for name in self.task_types if task_type is None or name == task_type]
+        restarted = []
+        for task_id in self._requeue_orphaned_tasks(task_types):
+            task = self.get_task(task_id)
+            try:
+                if self._restart_task(task):
+                    restarted.append(task_id)
+            except ValueError as e:
+                print(f"Recovering task {task_id} failed: {e}")
+        
+        if restarted:
+            print(f"Recovered {len(restarted)} task(s)")
+        return restarted
+    
+    def retry_task(self, task_id: str) -> bool:
+        """Run a FAILED task again (it continues from its checkpoints)."""
+        with self.tasks_lock, sqlite3.connect(self.db_path) as conn:
+            updated = conn.execute('''
+            UPDATE tasks SET status = ?, error = NULL, started_at = NULL, completed_at = NULL
+            WHERE id = ? AND status = ?
+            ''', (TaskStatus.QUEUED, task_id, TaskStatus.FAILED)).rowcount
+            conn.commit()
+        
+        if updated:
+            record_transition(task_id, TaskStatus.QUEUED, retry=True)
+        return bool(updated) and self._restart_task(self.get_task(task_id))
+    
+    def save_checkpoint(self, task_id: str, stage: str, key: str, data: str):
+        """Store the output of a task stage (e.g., stage "search", key = query index)."""
+        with self.tasks_lock, sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+            INSERT OR REPLACE INTO checkpoints (task_id, stage, key, data, created_at)
+            VALUES (?, ?, ?, ?, ?)
+            ''', (task_id, stage, key, data, time.time()))
+            conn.commit()
+    
+    def load_checkpoints(self, task_id: str, stage: str) -> Dict[str, str]:
+        """Get the stored outputs of a task stage (key -> data)."""
+        with sqlite3.connect(self.db_path) as conn:
+            rows = conn.execute('''
+            SELECT key, data FROM checkpoints WHERE task_id = ? AND stage = ?
+            ''', (task_id, stage)).fetchall()
+            return dict(rows)
+    
+    def save_ledger(self, task_id: str, ledger: TaskLedger):
+        """Add the resources of a task run to its ledger (a retried or recovered task accumulates all runs)."""
+        rows = ledger.rows()
+        if not rows:
+            return
+        with self.tasks_lock, sqlite3.connect(self.db_path) as conn:
+            conn.executemany('''
+            INSERT INTO ledger (task_id, category, name, metric, value) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (task_id, category, name, metric) DO UPDATE SET value = value + excluded.value
+            ''', [(task_id, *row) for row in rows])
+            conn.commit()
+    
+    def get_task_ledger(self, task_id: str) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """Get the ledger of a task (category -> name -> metric -> value, see telemetry.TaskLedger)."""
+        with sqlite3.connect(self.db_path) as conn:
+            rows = conn.execute('''
+            SELECT category, name, metric, value FROM ledger WHERE task_id = ? ORDER BY category, name, metric
+            ''', (task_id,)).fetchall()
+            return self._nest_ledger_rows(rows)
+    
+    def get_ledger_totals(self, task_type: Optional[str] = None, since: Optional[float] = None) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """
+        Get the summed ledgers of all tasks (e.g., tokens per model or search calls per provider for capacity planning).
+        
+        Args:
+            task_type: Only tasks of this type
+            since: Only tasks created after this timestamp
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            rows = conn.execute('''
+            SELECT l.category, l.name, l.metric, SUM(l.value) FROM ledger l JOIN tasks t ON t.id = l.task_id
+            WHERE (? IS NULL OR t.task_type = ?) AND (? IS NULL OR t.created_at >= ?)
+            GROUP BY l.category, l.name, l.metric ORDER BY l.category, l.name, l.metric
+            ''', (task_type, task_type, since, since)).fetchall()
+            return self._nest_ledger_rows(rows)
+    
+    def get_task_costs(self, task_type: Optional[str] = None, since: Optional[float] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Get the most expensive tasks (by LLM tokens) with their summed resources, to find expensive query patterns.
+        
+        Args:
+            task_type: Only tasks of this type
+            since: Only tasks created after this timestamp
+            limit: Maximum number of tasks
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            tasks = conn.execute('''
+            SELECT t.id, t.query, t.task_type, t.status, t.created_at,
+                SUM(CASE WHEN l.category = 'llm' AND l.metric = 'calls' THEN l.value ELSE 0 END) AS llm_calls,
+                SUM(CASE WHEN l.category = 'llm' AND l.metric = 'prompt_tokens' THEN l.value ELSE 0 END) AS prompt_tokens,
+                SUM(CASE WHEN l.category = 'llm' AND l.metric = 'completion_tokens' THEN l.value ELSE 0 END) AS completion_tokens,
+                SUM(CASE WHEN l.category = 'search' THEN l.value ELSE 0 END) AS search_calls,
+                SUM(CASE WHEN l.category = 'crawl' AND l.metric = 'bytes' THEN l.value ELSE 0 END) AS bytes_crawled,
+                SUM(CASE WHEN l.category = 'cache' THEN l.value ELSE 0 END) AS cache_hits
+            FROM tasks t JOIN ledger l ON l.task_id = t.id
+            WHERE (? IS NULL OR t.task_type = ?) AND (? IS NULL OR t.created_at >= ?)
+            GROUP BY t.id
+            ORDER BY prompt_tokens + completion_tokens DESC
+            LIMIT ?
+            ''', (task_type, task_type, since, since, limit)).fetchall()
+            return [dict(task) for task in tasks]
+    
+    def _nest_ledger_rows(self, rows: List[Tuple[str, str, str, float]]) -> Dict[str, Dict[str, Dict[str, float]]]:
+        ledger = {}
+        for category, name, metric, value in rows:
+            ledger.setdefault(category, {}).setdefault(name, {})[metric] = value
+        return ledger
+    
+    def _launch_task(self, task_id: str, task_func, *args, **kwargs):
+        # Async tasks share one event loop, sync tasks get their own thread
+        # (both are registered before they start, a fast task removes its entry when done)
+        self._start_heartbeat()
+        if asyncio.iscoroutinefunction(task_func):
+            future = Future()
+            self.running_tasks[task_id] = future
+            self._get_event_loop().call_soon_threadsafe(self._start_task_async, future, task_id, task_func, args, kwargs)
+            return
+
         # Start task in a separate thread
         thread = threading.Thread(
             target=self._run_task,
@@ -91,29 +325,120 @@ class TaskManager:
         self.running_tasks[task_id] = thread
         thread.start()
     
+    def _start_task_async(self, future: Future, task_id: str, task_func, args: tuple, kwargs: dict):
+        """Start an async task on the shared event loop, cancelling its registered future cancels the task."""
+        if future.cancelled():
+            self.running_tasks.pop(task_id, None)
+            return
+        
+        task = self.loop.create_task(self._run_task_async(task_id, task_func, *args, **kwargs))
+        future.add_done_callback(lambda _: self.loop.call_soon_threadsafe(task.cancel))
+        
+        def set_done(_):
+            try:
+                future.set_result(None)
+            except InvalidStateError:
+                pass  # Cancelled meanwhile
+        task.add_done_callback(set_done)
+    
+    def _start_heartbeat(self):
+        with self.loop_lock:
+            if self.heartbeat_thread is None:
+                self.heartbeat_thread = threading.Thread(target=self._heartbeat, daemon=True)
+                self.heartbeat_thread.start()
+    
+    def _heartbeat(self):
+        """Mark the running tasks of this process as alive (other processes only recover tasks with a stale heartbeat)."""
+        while True:
+            time.sleep(config.TASK_HEARTBEAT_INTERVAL)
+            task_ids = list(self.running_tasks)
+            if not task_ids:
+                continue
+            try:
+                with self.tasks_lock, sqlite3.connect(self.db_path) as conn:
+                    conn.execute(f'''
+                    UPDATE tasks SET heartbeat_at = ? WHERE status = ? AND id IN ({",".join("?" * len(task_ids))})
+                    ''', (time.time(), TaskStatus.RUNNING, *task_ids))
+                    conn.commit()
+            except sqlite3.Error as e:
+                print(f"Task heartbeat failed: {e}")
+    
+    def _get_event_loop(self) -> asyncio.AbstractEventLoop:
+        """Return the shared event loop, starting it in a daemon thread on first use."""
+        with self.loop_lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, daemon=True).start()
+            return self.loop
+    
+    def _complete_task(self, task_id: str, result: str):
+        with self.tasks_lock, sqlite3.connect(self.db_path) as conn:
+            completed_at = time.time()
+            conn.execute('''
+            UPDATE tasks SET status = ?, completed_at = ?, result = ?
+            WHERE id = ?
+            ''', (TaskStatus.COMPLETED, completed_at, result, task_id))
+            conn.commit()
+        record_transition(task_id, TaskStatus.COMPLETED)
+    
+    def _fail_task(self, task_id: str, error: str):
+        with self.tasks_lock, sqlite3.connect(self.db_path) as conn:
+            completed_at = time.time()
+            conn.execute('''
+            UPDATE tasks SET status = ?, completed_at = ?, error = ?
+            WHERE id = ?
+            ''', (TaskStatus.FAILED, completed_at, error, task_id))
+            conn.commit()
+        record_transition(task_id, TaskStatus.FAILED, error=error)
+    
     def _run_task(self, task_id: str, task_func, *args, **kwargs):
         """Run the task and update its status when done."""
+        ledger = TaskLedger()
         try:
-            result = task_func(*args, **kwargs)
-            with self.tasks_lock, sqlite3.connect(self.db_path) as conn:
-                completed_at = time.time()
-                conn.execute('''
-                UPDATE tasks SET status = ?, completed_at = ?, result = ?
-                WHERE id = ?
-                ''', (TaskStatus.COMPLETED, completed_at, result, task_id))
-                conn.commit()
+            with collect_ledger(ledger), span("task", task_id=task_id):
+                result = task_func(*args, **kwargs)
+            self._complete_task(task_id, result)
         except Exception as e:
-            with self.tasks_lock, sqlite3.connect(self.db_path) as conn:
-                completed_at = time.time()
-                conn.execute('''
-                UPDATE tasks SET status = ?, completed_at = ?, error = ?
-                WHERE id = ?
-                ''', (TaskStatus.FAILED, completed_at, str(e), task_id))
-                conn.commit()
+            self._fail_task(task_id, str(e))
         finally:
+            self.save_ledger(task_id, ledger)
             if task_id in self.running_tasks:
                 del self.running_tasks[task_id]
     
+    async def _run_task_async(self, task_id: str, task_func, *args, **kwargs):
+        """Run an async task on the shared event loop and update its status when done."""
+        ledger = TaskLedger()
+        try:
+            with collect_ledger(ledger), span("task", task_id=task_id):
+                result = await task_func(*args, **kwargs)
+            await asyncio.to_thread(self._complete_task, task_id, result)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            await asyncio.to_thread(self._fail_task, task_id, str(e))
+        finally:
+            await asyncio.to_thread(self.save_ledger, task_id, ledger)
+            if task_id in self.running_tasks:
+                del self.running_tasks[task_id]
+    
+    def update_external_job(self, task_id: str, external_id: Optional[str] = None, external_status: Optional[str] = None):
+        """Store the id and status of the provider job behind a task (e.g., a Perplexity async request)."""
+        with self.tasks_lock, sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+            UPDATE tasks SET external_id = COALESCE(?, external_id), external_status = COALESCE(?, external_status)
+            WHERE id = ?
+            ''', (external_id, external_status, task_id))
+            conn.commit()
+    
+    def update_partial_result(self, task_id: str, partial_result: str):
+        """Store the partial result of a running task (e.g., a report that is still streaming)."""
+        with self.tasks_lock, sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+            UPDATE tasks SET partial_result = ?
+            WHERE id = ?
+            ''', (partial_result, task_id))
+            conn.commit()
+    
     def cancel_task(self, task_id: str) -> bool:
         """Cancel a task if it's still in QUEUED or RUNNING state."""
         with self.tasks_lock, sqlite3.connect(self.db_path) as conn:
@@ -127,9 +452,14 @@ class TaskManager:
                 WHERE id = ?
                 ''', (TaskStatus.CANCELLED, time.time(), task_id))
                 conn.commit()
+                record_transition(task_id, TaskStatus.CANCELLED)
                 
-                # If the task is running, we can't really stop the thread,
-                # but we can mark it as cancelled in the database
+                # If the task is running in a thread, we can't really stop it,
+                # but we can mark it as cancelled in the database.
+                # Async tasks on the shared loop are cancelled directly.
+                running_task = self.running_tasks.get(task_id)
+                if isinstance(running_task, Future):
+                    running_task.cancel()
                 return True
             
             return False
@@ -151,6 +481,18 @@ class TaskManager:
             tasks = conn.execute('SELECT * FROM tasks ORDER BY created_at DESC').fetchall()
             return [dict(task) for task in tasks]
     
+    def get_unfinished_tasks(self, task_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Get all QUEUED or RUNNING tasks (optionally of one task type), oldest first."""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            query = 'SELECT * FROM tasks WHERE status IN (?, ?)'
+            params = [TaskStatus.QUEUED, TaskStatus.RUNNING]
+            if task_type is not None:
+                query += ' AND task_type = ?'
+                params.append(task_type)
+            tasks = conn.execute(query + ' ORDER BY created_at', params).fetchall()
+            return [dict(task) for task in tasks]
+    
     def get_task_elapsed_time(self, task_id: str) -> Tuple[float, bool]:
         """
         Get the elapsed time for a task in seconds and whether it's still running.
@@ -212,6 +554,11 @@ class TaskManager:
         cutoff_time = time.time() - (days_to_keep * 24 * 60 * 60)
         
         with self.tasks_lock, sqlite3.connect(self.db_path) as conn:
+            for table in ("checkpoints", "ledger"):
+                conn.execute(f'''
+                DELETE FROM {table} WHERE task_id IN (
+                    SELECT id FROM tasks WHERE created_at < ? AND status IN (?, ?, ?))
+                ''', (cutoff_time, TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.CANCELLED))
             conn.execute('''
             DELETE FROM tasks
             WHERE created_at < ? AND status IN (?, ?, ?)
@@ -237,7 +584,9 @@ class TaskManager:
             if task_id in self.running_tasks:
                 self.cancel_task(task_id)
             
-            # Delete the task from the database
+            # Delete the task (and its checkpoints and ledger) from the database
+            conn.execute('DELETE FROM checkpoints WHERE task_id = ?', (task_id,))
+            conn.execute('DELETE FROM ledger WHERE task_id = ?', (task_id,))
             conn.execute('DELETE FROM tasks WHERE id = ?', (task_id,))
             conn.commit()
             return True
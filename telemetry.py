@@ -0,0 +1,332 @@
+import json
+import time
+import bisect
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterator, Optional
+
+from opentelemetry import trace
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+
+from config import Config
+
+config = Config()
+
+tracer = trace.get_tracer("deep_research")
+
+# Latency buckets in seconds (LLM calls and crawls take seconds to minutes)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+class Counter:
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{format_labels(dict(key))} {value}" for key, value in self.values.items()]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, description: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.values: dict[tuple, list] = {}  # labels -> [bucket counts, sum, count]
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        counts, total, count = self.values.get(key) or [[0] * len(self.buckets), 0.0, 0]
+        position = bisect.bisect_left(self.buckets, value)
+        if position < len(self.buckets):
+            counts[position] += 1
+        self.values[key] = [counts, total + value, count + 1]
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in self.values.items():
+            labels = dict(key)
+            cumulative = 0
+            for bucket, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{format_labels(labels | {'le': bucket})} {cumulative}")
+            lines.append(f"{self.name}_bucket{format_labels(labels | {'le': '+Inf'})} {count}")
+            lines.append(f"{self.name}_sum{format_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {count}")
+        return lines
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+
+class MetricsRegistry:
+    """In-process metrics in Prometheus text format (no metrics library or collector needed)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.span_seconds = Histogram("research_span_duration_seconds", "Duration of the pipeline spans.")
+        self.spans = Counter("research_spans_total", "Finished pipeline spans by outcome.")
+        self.tokens = Counter("research_llm_tokens_total", "LLM tokens by model and kind (prompt/completion).")
+        self.bytes = Counter("research_bytes_total", "Downloaded bytes (crawled pages).")
+        self.cache_hits = Counter("research_cache_hits_total", "Spans answered from a cache or store.")
+        self.transitions = Counter("research_task_transitions_total", "TaskManager status transitions.")
+
+    def observe_span(self, name: str, seconds: float, attributes: dict[str, Any], error: bool):
+        with self.lock:
+            self.span_seconds.observe(seconds, span=name)
+            self.spans.inc(span=name, outcome="error" if error else "ok")
+            model = attributes.get("model", "")
+            for kind in ("prompt", "completion"):
+                if tokens := attributes.get(f"{kind}_tokens"):
+                    self.tokens.inc(tokens, model=model, kind=kind)
+            if num_bytes := attributes.get("bytes"):
+                self.bytes.inc(num_bytes, span=name)
+            if attributes.get("cache_hit"):
+                self.cache_hits.inc(span=name)
+
+    def observe_transition(self, status: str):
+        with self.lock:
+            self.transitions.inc(status=status)
+
+    def render(self) -> str:
+        with self.lock:
+            metrics = (self.span_seconds, self.spans, self.tokens, self.bytes, self.cache_hits, self.transitions)
+            return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+class TaskLedger:
+    """
+    Resources used by one task, collected from the spans that finish while the task runs (see collect_ledger):
+    LLM calls and tokens per model, search API calls per provider, other provider requests (e.g., Perplexity
+    async jobs), crawled pages and bytes, cache hits per span and the summed wall time per stage
+    (parallel DAG nodes overlap).
+
+    Values are keyed by (category, name, metric), e.g. ("llm", "gemini-2.0-flash", "prompt_tokens").
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values: dict[tuple[str, str, str], float] = defaultdict(float)
+
+    def add(self, category: str, name: str, metric: str, value: float = 1.0):
+        with self.lock:
+            self.values[(category, name, metric)] += value
+
+    def observe_span(self, name: str, seconds: float, attributes: dict[str, Any]):
+        if name == "llm":
+            model = attributes.get("model", "")
+            self.add("llm", model, "calls")
+            for metric in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+                if tokens := attributes.get(metric):
+                    self.add("llm", model, metric, tokens)
+        elif name == "search.api":
+            self.add("search", attributes.get("provider", ""), "calls")
+        elif name == "provider.request":
+            self.add("provider", attributes.get("provider", ""), "requests")
+        elif name == "crawl":
+            method = attributes.get("method", "")
+            self.add("crawl", method, "pages")
+            self.add("crawl", method, "bytes", attributes.get("bytes", 0))
+        elif name.startswith(("stage.", "dag.")):
+            self.add("stage", name, "seconds", seconds)
+            self.add("stage", name, "calls")
+
+        if attributes.get("cache_hit"):
+            self.add("cache", name, "hits")
+
+    def rows(self) -> list[tuple[str, str, str, float]]:
+        with self.lock:
+            return [(category, name, metric, value) for (category, name, metric), value in self.values.items()]
+
+
+_task_ledger: ContextVar[Optional[TaskLedger]] = ContextVar("task_ledger", default=None)
+
+
+@contextmanager
+def collect_ledger(ledger: Optional[TaskLedger] = None) -> Iterator[TaskLedger]:
+    """
+    Adds every span finished in this context to the ledger (also in the asyncio tasks and
+    asyncio.to_thread calls started from it, they inherit the context).
+    """
+    ledger = ledger or TaskLedger()
+    token = _task_ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _task_ledger.reset(token)
+
+
+def _observe(name: str, seconds: float, attributes: dict[str, Any], error: bool):
+    metrics.observe_span(name, seconds, attributes, error)
+    if ledger := _task_ledger.get():
+        ledger.observe_span(name, seconds, attributes)
+
+
+class JsonlSpanExporter(SpanExporter):
+    """Offline span exporter: appends every finished span as one JSON line to a local file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def export(self, spans) -> SpanExportResult:
+        lines = []
+        for span in spans:
+            parent = span.parent.span_id if span.parent else None
+            lines.append(json.dumps({
+                "name": span.name,
+                "trace_id": f"{span.context.trace_id:032x}",
+                "span_id": f"{span.context.span_id:016x}",
+                "parent_id": f"{parent:016x}" if parent else None,
+                "start": span.start_time / 1e9,
+                "end": span.end_time / 1e9,
+                "duration": (span.end_time - span.start_time) / 1e9,
+                "status": span.status.status_code.name,
+                "attributes": dict(span.attributes or {}),
+            }, default=str))
+        with self.lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(line + "\n" for line in lines))
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+
+_setup_lock = threading.Lock()
+_configured = False
+
+
+def setup_telemetry():
+    """
+    Configures tracing once per process (repeated calls are no-ops): logfire as OpenTelemetry SDK
+    with head sampling (config.TELEMETRY_SAMPLE_RATE), the scrubbing callback and the local JSONL exporter.
+    Spans are only sent to Logfire if a Logfire token is configured.
+    """
+    global _configured
+    with _setup_lock:
+        if _configured or not config.TELEMETRY_ENABLED:
+            return
+        import logfire
+        from agent_utils import scrubbing_callback
+
+        processors = [BatchSpanProcessor(JsonlSpanExporter(config.TELEMETRY_SPAN_FILE))] if config.TELEMETRY_SPAN_FILE else []
+        logfire.configure(
+            service_name="deep_research",
+            send_to_logfire="if-token-present",
+            console=False,
+            scrubbing=logfire.ScrubbingOptions(callback=scrubbing_callback),
+            sampling=logfire.SamplingOptions(head=config.TELEMETRY_SAMPLE_RATE),
+            additional_span_processors=processors,
+        )
+        _configured = True
+
+
+def _clean(attributes: dict[str, Any]) -> dict[str, Any]:
+    # OpenTelemetry attributes have to be primitive values
+    return {key: value if isinstance(value, (str, bool, int, float)) else str(value)
+                for key, value in attributes.items() if value is not None}
+
+
+class SpanHandle:
+    """Yielded by span(): attributes that are only known at the end (tokens, bytes, cache hits)."""
+
+    def __init__(self, otel_span):
+        self.otel_span = otel_span
+        self.attributes: dict[str, Any] = {}
+
+    def set(self, **attributes):
+        attributes = _clean(attributes)
+        self.attributes.update(attributes)
+        self.otel_span.set_attributes(attributes)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[SpanHandle]:
+    """
+    Traces a block (pipeline stage, search, crawl, LLM call, ...) and records its duration and attributes
+    as metrics. Works in sync and async code, nested spans become child spans.
+
+    Usage:
+        with span("crawl", url=url) as s:
+            text = await crawl(url)
+            s.set(bytes=len(text))
+    """
+    setup_telemetry()
+    start = time.perf_counter()
+    error = False
+    with tracer.start_as_current_span(name, attributes=_clean(attributes)) as otel_span:
+        handle = SpanHandle(otel_span)
+        handle.attributes.update(_clean(attributes))
+        try:
+            yield handle
+        except BaseException:
+            error = True
+            raise
+        finally:
+            _observe(name, time.perf_counter() - start, handle.attributes, error)
+
+
+def record_span(name: str, start: float, end: float, **attributes):
+    """Records a span that already finished (start/end as time.time() values), e.g. a timed LLM call."""
+    setup_telemetry()
+    attributes = _clean(attributes)
+    otel_span = tracer.start_span(name, attributes=attributes, start_time=int(start * 1e9))
+    otel_span.end(end_time=int(end * 1e9))
+    _observe(name, end - start, attributes, False)
+
+
+def record_transition(task_id: str, status: str, **attributes):
+    """Records a TaskManager status transition (instant span and transition counter)."""
+    now = time.time()
+    record_span("task.transition", now, now, task_id=task_id, status=str(status), **attributes)
+    metrics.observe_transition(str(status))
+
+
+def render_metrics() -> str:
+    return metrics.render()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_metrics_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_metrics_server(port: Optional[int] = config.METRICS_PORT) -> Optional[ThreadingHTTPServer]:
+    """Serves the metrics at http://localhost:{port}/metrics in a daemon thread (once per process, None = off)."""
+    global _metrics_server
+    with _setup_lock:
+        if _metrics_server is None and port:
+            _metrics_server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+            threading.Thread(target=_metrics_server.serve_forever, daemon=True).start()
+        return _metrics_server
@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+# No API keys or telemetry exports are needed, all external services are replaced by local stubs
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ.setdefault("TELEMETRY_ENABLED", "false")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The modules create their databases (tasks.db, documents.db, ...) in the working directory on import
+os.chdir(tempfile.mkdtemp(prefix="research_tests_"))
@@ -0,0 +1,23 @@
+from artifact_store import ArtifactStore
+
+
+def test_compact_keeps_the_latest_artifacts_and_all_appended_records(tmp_path):
+    store = ArtifactStore(str(tmp_path), mmap_threshold=100)
+    for k in range(5):
+        store.put("results", {"round": k, "text": f"result {k} " * 50})
+    store.append("corpus", {"url": "https://a.example", "text": "a" * 200})
+    store.append("corpus", {"url": "https://b.example", "text": "b"})
+    size = sum(path.stat().st_size for path in tmp_path.iterdir())
+
+    assert store.compact() == 4
+    assert sum(path.stat().st_size for path in tmp_path.iterdir()) < size
+
+    for reopened in (store, ArtifactStore(str(tmp_path), mmap_threshold=100)):
+        assert reopened.count("results") == 1
+        assert reopened.get("results") == {"round": 4, "text": "result 4 " * 50}
+        assert list(reopened.iter_records("corpus")) == [{"url": "https://a.example", "text": "a" * 200},
+                                                            {"url": "https://b.example", "text": "b"}]
+
+    store.put("results", {"round": 5, "text": ""})
+    assert store.get("results") == {"round": 5, "text": ""}
+    assert store.compact() == 1
@@ -0,0 +1,37 @@
+from types import SimpleNamespace
+
+from citations import canonical_url, parse_marked_citations, splice_grounding_parts
+
+
+def support(part_index, start, end, chunk_indices):
+    segment = SimpleNamespace(part_index=part_index, start_index=start, end_index=end)
+    return SimpleNamespace(segment=segment, grounding_chunk_indices=chunk_indices)
+
+
+def chunk(url):
+    return SimpleNamespace(web=SimpleNamespace(uri=url, title=""))
+
+
+def test_marked_citations_without_url_are_removed():
+    cited = parse_marked_citations("Alpha [1] beta [3][2].", ["https://a.example", "https://b.example"])
+
+    assert cited.text == "Alpha beta."
+    assert cited.render() == "Alpha [1] beta [2]."
+    assert [source.url for source in cited.sources] == ["https://a.example", "https://b.example"]
+
+
+def test_grounding_offsets_are_relative_to_their_part():
+    parts = ["Ünïcode first. ", "Second part."]
+    supports = [support(0, 0, len("Ünïcode first.".encode("utf-8")), [0]),
+                support(1, 0, len("Second part."), [1])]
+
+    cited = splice_grounding_parts(parts, supports, [chunk("https://a.example"), chunk("https://b.example")])
+
+    assert cited.text == "".join(parts)
+    assert cited.render() == "Ünïcode first. [1] Second part. [2]"
+
+
+def test_only_exact_tracking_keys_are_dropped():
+    assert canonical_url("https://example.com/a?utm_source=x&ref=home&id=1") == "https://example.com/a?id=1"
+    assert canonical_url("https://example.com/a?reference=1") != canonical_url("https://example.com/a?reference=2")
+    assert canonical_url("https://example.com/a?sourceid=7&refid=3") == "https://example.com/a?sourceid=7&refid=3"
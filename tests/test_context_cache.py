@@ -0,0 +1,97 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from config import Config
+from context_cache import CorpusCache
+
+config = Config()
+
+LARGE_CORPUS = "Data centers used 240 to 340 TWh in 2022 [1]. " * (config.CORPUS_CACHE_MIN_TOKENS // 8)
+SMALL_CORPUS = "Data centers used 240 to 340 TWh in 2022 [1]."
+
+
+class StubCaches:
+    """Local stand-in of client.aio.caches (the Gemini cached content API)."""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.created = []
+        self.deleted = []
+
+    async def create(self, model, config):
+        if self.fail:
+            raise RuntimeError("caching not supported")
+        self.created.append((model, config))
+        return SimpleNamespace(name=f"cachedContents/{len(self.created)}")
+
+    async def delete(self, name):
+        self.deleted.append(name)
+
+
+class StubModels:
+    def __init__(self):
+        self.calls = []
+
+    async def generate_content(self, model, contents, config=None):
+        self.calls.append((model, contents, config))
+        return SimpleNamespace(text=f"answer {len(self.calls)}", usage_metadata=None)
+
+
+class StubClient:
+    def __init__(self, fail: bool = False):
+        self.aio = SimpleNamespace(caches=StubCaches(fail), models=StubModels())
+
+
+async def ask(corpus: str, client: StubClient, prompts: list[str]) -> list[str]:
+    async with CorpusCache(corpus, "Answer questions about the corpus.", client=client) as cache:
+        return list(await asyncio.gather(*(cache.generate(prompt) for prompt in prompts)))
+
+
+def test_corpus_is_uploaded_once_and_referenced_by_every_call():
+    client = StubClient()
+    answers = asyncio.run(ask(LARGE_CORPUS, client, ["Question 1", "Question 2", "Question 3"]))
+
+    assert answers == ["answer 1", "answer 2", "answer 3"]
+    assert len(client.aio.caches.created) == 1
+    model, cache_config = client.aio.caches.created[0]
+    assert model == config.CORPUS_CACHE_MODEL
+    assert cache_config.ttl == f"{config.CORPUS_CACHE_TTL}s"
+    assert cache_config.contents[0].parts[0].text == LARGE_CORPUS
+
+    for _, contents, call_config in client.aio.models.calls:
+        assert contents.startswith("Question")
+        assert call_config.cached_content == "cachedContents/1"
+
+
+def test_cache_is_deleted_when_the_run_is_done():
+    client = StubClient()
+    asyncio.run(ask(LARGE_CORPUS, client, ["Question"]))
+
+    assert client.aio.caches.deleted == ["cachedContents/1"]
+
+
+def test_cache_is_deleted_when_a_call_fails():
+    client = StubClient()
+
+    async def failing_run():
+        async with CorpusCache(LARGE_CORPUS, client=client):
+            raise ValueError("report failed")
+
+    with pytest.raises(ValueError):
+        asyncio.run(failing_run())
+    assert client.aio.caches.deleted == ["cachedContents/1"]
+
+
+@pytest.mark.parametrize("corpus, fail", [(SMALL_CORPUS, False), (LARGE_CORPUS, True)])
+def test_corpus_is_sent_inline_without_cache(corpus, fail):
+    client = StubClient(fail)
+    answers = asyncio.run(ask(corpus, client, ["Question"]))
+
+    assert answers == ["answer 1"]
+    assert client.aio.caches.created == []
+    assert client.aio.caches.deleted == []
+    _, contents, call_config = client.aio.models.calls[0]
+    assert contents == f"{corpus}\n\nQuestion"
+    assert call_config.cached_content is None
@@ -0,0 +1,32 @@
+import pytest
+
+from context_packer import pack_search_results, estimate_tokens
+
+
+def search_result(topic: str, n_references: int) -> str:
+    references = "\n".join(f"[{k}] Source {k} about {topic} https://{topic}.example/{k}" for k in range(1, n_references + 1))
+    citations = "".join(f"[{k}]" for k in range(1, n_references + 1))
+    return f"Findings about {topic} {citations}. " + "More details. " * 20 + f"\n\nReferences:\n\n{references}"
+
+
+def test_context_fits_the_budget():
+    results = [search_result(topic, 3) for topic in ("solar", "wind", "hydro")]
+
+    packed = pack_search_results(results, "solar power", max_tokens=200)
+
+    assert packed.text
+    assert packed.tokens <= 200
+
+
+def test_least_relevant_sources_are_dropped_when_references_dont_fit():
+    results = [search_result("solar", 8), search_result("wind", 8)]
+
+    packed = pack_search_results(results, "solar power", max_tokens=estimate_tokens(results[0]))
+
+    assert [source.index for source in packed.sources] == [0]
+    assert "wind.example" not in packed.text
+
+
+def test_too_small_budget_raises():
+    with pytest.raises(ValueError):
+        pack_search_results([search_result("solar", 3)], "solar power", max_tokens=10)
@@ -0,0 +1,113 @@
+import asyncio
+import itertools
+
+import pytest
+
+import deep_research_jobs
+from deep_research_jobs import (DeepResearchJobStatus, get_deep_research_status, run_deep_research_job,
+                                    start_deep_research_job, wait_for_deep_research)
+from llm_gateway import llm_gateway
+from task_manager import task_manager, TaskStatus
+
+
+class LocalPerplexity:
+    """
+    Stand-in for the Perplexity async API (replaces LLMGateway.request): every submitted job goes through
+    the next scripted list of statuses, one status per poll (the last one is kept).
+    """
+
+    def __init__(self, *scripts: list[str]):
+        self.scripts = iter(scripts)
+        self.jobs: dict[str, list[str]] = {}
+        self.ids = itertools.count(1)
+        self.submits = 0
+        self.polls = 0
+
+    async def request(self, provider, method: str, path: str, body: dict = None) -> dict:
+        if method == "post":
+            self.submits += 1
+            request_id = f"job-{next(self.ids)}"
+            self.jobs[request_id] = list(next(self.scripts))
+            return {"id": request_id, "status": DeepResearchJobStatus.CREATED}
+
+        self.polls += 1
+        request_id = path.rsplit("/", 1)[-1]
+        statuses = self.jobs[request_id]
+        status = statuses.pop(0) if len(statuses) > 1 else statuses[0]
+        job = {"id": request_id, "status": status}
+        if status == DeepResearchJobStatus.COMPLETED:
+            job["response"] = {
+                "choices": [{"message": {"content": "<think>Planning.</think>Findings of the research [1][7]."}}],
+                "citations": ["https://example.com/source"],
+            }
+        if status == DeepResearchJobStatus.FAILED:
+            job["error_message"] = "provider error"
+        return job
+
+
+@pytest.fixture
+def provider(monkeypatch, request) -> LocalPerplexity:
+    local_provider = LocalPerplexity(*request.param)
+    monkeypatch.setattr(llm_gateway, "request", local_provider.request)
+    return local_provider
+
+
+@pytest.mark.parametrize("provider", [[["IN_PROGRESS", "IN_PROGRESS", "COMPLETED"]]], indirect=True)
+def test_job_is_submitted_and_polled_until_completed(provider):
+    task_id = task_manager.add_task("query", deep_research_jobs.DEEP_RESEARCH_TASK_TYPE)
+
+    result = asyncio.run(run_deep_research_job(task_id, "query", poll_interval=0))
+
+    assert "Findings of the research [1]." in result
+    assert "Planning" not in result
+    assert "https://example.com/source" in result
+    assert (provider.submits, provider.polls) == (1, 3)
+    task = task_manager.get_task(task_id)
+    assert (task["external_id"], task["external_status"]) == ("job-1", DeepResearchJobStatus.COMPLETED)
+
+
+@pytest.mark.parametrize("provider", [[["COMPLETED"]]], indirect=True)
+def test_task_runs_on_the_task_manager(provider):
+    task_id = start_deep_research_job("query")
+
+    result = asyncio.run(wait_for_deep_research(task_id, poll_interval=0.01))
+
+    assert "Findings of the research" in result
+    status = get_deep_research_status(task_id)
+    assert (status["status"], status["job_status"]) == (TaskStatus.COMPLETED, DeepResearchJobStatus.COMPLETED)
+
+
+@pytest.mark.parametrize("provider", [[["FAILED"], ["COMPLETED"]]], indirect=True)
+def test_failed_job_is_resubmitted_on_retry(provider):
+    task_id = start_deep_research_job("query")
+    with pytest.raises(RuntimeError, match="provider error"):
+        asyncio.run(wait_for_deep_research(task_id, poll_interval=0.01))
+
+    assert task_manager.retry_task(task_id)
+    result = asyncio.run(wait_for_deep_research(task_id, poll_interval=0.01))
+
+    assert "Findings of the research" in result
+    assert provider.submits == 2
+    assert task_manager.get_task(task_id)["external_id"] == "job-2"
+
+
+@pytest.mark.parametrize("provider", [[["COMPLETED"]]], indirect=True)
+def test_resumed_task_waits_for_its_existing_job(provider):
+    provider.jobs["job-0"] = [DeepResearchJobStatus.COMPLETED]
+    task_id = task_manager.add_task("query", deep_research_jobs.DEEP_RESEARCH_TASK_TYPE)
+    task_manager.update_external_job(task_id, "job-0", DeepResearchJobStatus.IN_PROGRESS)
+
+    asyncio.run(run_deep_research_job(task_id, "query", poll_interval=0))
+
+    assert (provider.submits, provider.polls) == (0, 1)
+
+
+@pytest.mark.parametrize("provider", [[["IN_PROGRESS"]]], indirect=True)
+def test_job_times_out(provider):
+    task_id = task_manager.add_task("query", deep_research_jobs.DEEP_RESEARCH_TASK_TYPE)
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(run_deep_research_job(task_id, "query", poll_interval=0.01, timeout=0.05))
+
+    assert provider.polls > 1
+    assert task_manager.get_task(task_id)["external_status"] == DeepResearchJobStatus.IN_PROGRESS
@@ -0,0 +1,44 @@
+import sqlite3
+
+import numpy as np
+
+from document_store import DocumentStore
+
+
+def test_url_with_known_content_points_to_the_stored_document(tmp_path):
+    store = DocumentStore(str(tmp_path / "documents.db"))
+    document_id, is_new = store.add_document("https://example.com/article", "Same article text.", title="Article")
+    assert is_new
+
+    mirror_id, is_new = store.add_document("https://mirror.example.org/copy?utm_source=x", "same  ARTICLE text.")
+    assert (mirror_id, is_new) == (document_id, False)
+
+    document = store.get_by_url("https://mirror.example.org/copy")
+    assert document.id == document_id
+    assert document.url == "https://example.com/article"
+    assert store.get_by_url("https://example.com/article").id == document_id
+    assert store.get_by_url("https://unknown.example.com/") is None
+    assert store.count() == 1
+
+
+def test_recrawled_url_points_to_the_latest_content(tmp_path):
+    store = DocumentStore(str(tmp_path / "documents.db"))
+    store.add_document("https://example.com/news", "First version.")
+    latest_id, _ = store.add_document("https://example.com/news", "Second version.")
+
+    assert store.get_by_url("https://example.com/news").id == latest_id
+
+
+
+def test_hybrid_search_finds_documents_by_their_stored_embedding(tmp_path):
+    store = DocumentStore(str(tmp_path / "documents.db"))
+    store.add_document("https://example.com/solar", "Solar panels convert sunlight into electricity.")
+    wind_id, _ = store.add_document("https://example.com/wind", "Wind turbines generate electricity from wind.")
+    store.add_document("https://example.com/other", "A recipe for apple pie.")
+
+    with sqlite3.connect(store.db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM documents WHERE embedding IS NULL").fetchone()[0] == 0
+
+    results = store.hybrid_search("wind turbines", limit=2)
+    assert results[0].id == wind_id
+    assert store.hybrid_search("wind turbines", np.zeros(8), limit=2)[0].id == wind_id
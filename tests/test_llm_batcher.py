@@ -0,0 +1,77 @@
+import json
+import time
+import asyncio
+import threading
+from types import SimpleNamespace
+
+from llm_batcher import MicroBatcher, RelevanceRating
+
+
+class StubModels:
+    """Answers every batch call with one rating per item (the rating is the length of the item text)."""
+
+    def __init__(self):
+        self.batches: list[list[str]] = []
+        self.lock = threading.Lock()
+
+    async def generate_content(self, model, contents, config=None):
+        items = [part.split("\n", 1)[1].rsplit("\n</item>", 1)[0] for part in contents.split('<item id="')[1:]]
+        with self.lock:
+            self.batches.append(items)
+        results = [{"id": k, "result": {"rating": len(item)}} for k, item in enumerate(items)]
+        return SimpleNamespace(text=json.dumps({"results": results}), usage_metadata=None)
+
+
+def get_batcher(window: float, max_batch_size: int) -> tuple[MicroBatcher, StubModels]:
+    models = StubModels()
+    client = SimpleNamespace(aio=SimpleNamespace(models=models))
+    return MicroBatcher("Rate every item.", RelevanceRating, window=window, max_batch_size=max_batch_size, client=client), models
+
+
+def test_full_batch_is_sent_without_waiting_for_the_window():
+    batcher, models = get_batcher(window=30, max_batch_size=3)
+
+    async def run():
+        return await asyncio.gather(*(batcher.submit("x" * k) for k in (1, 2, 3)))
+
+    start = time.time()
+    results = asyncio.run(run())
+
+    assert time.time() - start < 5
+    assert [result.rating for result in results] == [1, 2, 3]
+    assert models.batches == [["x", "xx", "xxx"]]
+    assert not batcher._tasks
+
+
+def test_partial_batch_is_sent_after_the_window():
+    batcher, models = get_batcher(window=0.05, max_batch_size=3)
+
+    async def run():
+        return await asyncio.gather(*(batcher.submit("x" * k) for k in (1, 2, 3, 4)))
+
+    start = time.time()
+    results = asyncio.run(run())
+
+    assert time.time() - start >= 0.05
+    assert [result.rating for result in results] == [1, 2, 3, 4]
+    assert models.batches == [["x", "xx", "xxx"], ["xxxx"]]
+
+
+def test_batches_are_kept_per_event_loop():
+    batcher, models = get_batcher(window=0.1, max_batch_size=10)
+    results = {}
+
+    def run(name: str):
+        async def submit_all():
+            return await asyncio.gather(*(batcher.submit(f"{name}{k}") for k in range(3)))
+        results[name] = asyncio.run(submit_all())
+
+    threads = [threading.Thread(target=run, args=(name,)) for name in ("a", "bb")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [result.rating for result in results["a"]] == [2, 2, 2]
+    assert [result.rating for result in results["bb"]] == [3, 3, 3]
+    assert sorted(models.batches) == [["a0", "a1", "a2"], ["bb0", "bb1", "bb2"]]
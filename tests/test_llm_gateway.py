@@ -0,0 +1,91 @@
+import asyncio
+
+import httpx
+
+import llm_gateway as llm_gateway_module
+from llm_gateway import LLMGateway, Provider, llm_gateway
+from telemetry import TaskLedger, collect_ledger, span
+
+
+async def fake_completion(model: str):
+    with span("llm", model=model, prompt_tokens=12, completion_tokens=3):
+        await asyncio.sleep(0)
+    return "answer"
+
+
+async def fake_stream():
+    for k in range(3):
+        with span("provider.request", provider="perplexity"):
+            yield k
+
+
+def test_sync_calls_are_recorded_in_the_callers_ledger():
+    with collect_ledger(TaskLedger()) as ledger:
+        assert llm_gateway.run_sync(fake_completion("sonar")) == "answer"
+
+    assert sorted(ledger.rows()) == [("llm", "sonar", "calls", 1.0), ("llm", "sonar", "completion_tokens", 3.0),
+                                        ("llm", "sonar", "prompt_tokens", 12.0)]
+
+
+def test_streamed_chunks_are_recorded_in_the_callers_ledger(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "stream", lambda *args, **kwargs: fake_stream())
+
+    with collect_ledger(TaskLedger()) as ledger:
+        assert list(llm_gateway.stream_sync("perplexity", "sonar", [])) == [0, 1, 2]
+
+    assert ledger.rows() == [("provider", "perplexity", "requests", 3.0)]
+
+
+def mock_provider(monkeypatch, responses: list[httpx.Response]) -> list[httpx.Request]:
+    # All clients of the gateway talk to a local handler instead of the provider
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return responses.pop(0) if len(responses) > 1 else responses[0]
+
+    monkeypatch.setattr(llm_gateway_module.config, "PERPLEXITY_API_KEY", "test")
+    class MockAsyncClient(httpx.AsyncClient):
+        def __init__(self, **kwargs):
+            super().__init__(transport=httpx.MockTransport(handler), **kwargs)
+
+    monkeypatch.setattr(llm_gateway_module.httpx, "AsyncClient", MockAsyncClient)
+    return requests
+
+
+def completion(text: str) -> httpx.Response:
+    return httpx.Response(200, json={
+        "id": "completion", "object": "chat.completion", "created": 0, "model": "sonar",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 3, "completion_tokens": 1, "total_tokens": 4}})
+
+
+def test_one_pooled_client_per_provider_and_loop(monkeypatch):
+    mock_provider(monkeypatch, [completion("answer")])
+    gateway = LLMGateway()
+
+    async def ask_twice():
+        responses = await asyncio.gather(*(gateway.complete(Provider.PERPLEXITY, "sonar", []) for _ in range(2)))
+        return [response.choices[0].message.content for response in responses]
+
+    assert asyncio.run(ask_twice()) == ["answer", "answer"]
+    assert len(gateway.clients) == 1
+    first_client = next(iter(gateway.clients.values()))
+
+    # A new event loop gets its own client, the client of the closed loop is dropped
+    asyncio.run(ask_twice())
+    assert len(gateway.clients) == 1
+    assert next(iter(gateway.clients.values())) is not first_client
+
+
+def test_rate_limited_request_is_retried(monkeypatch):
+    requests = mock_provider(monkeypatch, [
+        httpx.Response(429, headers={"retry-after-ms": "10"}, json={"error": "rate limited"}),
+        completion("answer"),
+    ])
+    gateway = LLMGateway(max_retries=2)
+
+    response = gateway.complete_sync(Provider.PERPLEXITY, "sonar", [{"role": "user", "content": "question"}])
+
+    assert response.choices[0].message.content == "answer"
+    assert len(requests) == 2
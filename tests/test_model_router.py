@@ -0,0 +1,45 @@
+import time
+
+import pytest
+
+from model_router import ModelProfile, ModelRouter, TaskClass
+
+
+def catalog():
+    return [
+        ModelProfile("lite", "gemini", 1, 1, None, 100_000, 0.0, 0.0, 1.0),
+        ModelProfile("flash", "gemini", 2, 10, None, 1_000_000, 0.0, 0.0, 3.0, grounding=True),
+        ModelProfile("paid", "deepseek", 4, 60, None, 64_000, 0.55, 2.19, 2.0),
+    ]
+
+
+def test_cheapest_fast_model_that_fits_the_task_wins():
+    router = ModelRouter(catalog(), decision_log_path=None)
+
+    assert router.choose(TaskClass.EXTRACTION) == "lite"
+    assert router.choose(TaskClass.SEARCH, grounding=True) == "flash"
+    # Too large for the context window of the lite model
+    assert router.choose(TaskClass.EXTRACTION, prompt_tokens=200_000) == "flash"
+    with pytest.raises(ValueError):
+        router.choose(TaskClass.REPORT)
+
+
+def test_observed_latencies_replace_the_prior():
+    router = ModelRouter(catalog(), decision_log_path=None)
+    for _ in range(5):
+        router.record("lite", 30.0)
+
+    assert router.get_stats()["lite"]["p50"] == 30.0
+    assert router.choose(TaskClass.EXTRACTION) == "flash"
+
+
+def test_exhausted_quota_falls_back_to_the_next_model():
+    router = ModelRouter(catalog(), decision_log_path=None)
+
+    assert [router.choose(TaskClass.EXTRACTION) for _ in range(3)] == ["lite", "flash", "flash"]
+    assert router.get_stats()["lite"]["headroom"] == 0.0
+
+    # Every candidate exhausted: the best one is used anyway
+    router.requests["flash"].extend([time.time()] * 10)
+    assert router.choose(TaskClass.EXTRACTION) == "lite"
+    assert router.decisions[-1]["headroom"] == {"lite": 0.0, "flash": 0.0}
@@ -0,0 +1,27 @@
+from citations import CitationSource, CitedText, SearchResult
+from novelty import NoveltyTracker
+
+PASSAGE = "Solid state batteries replace the liquid electrolyte with a ceramic or polymer layer, which is safer and denser."
+
+
+def result(text: str, *urls: str) -> SearchResult:
+    sources = [CitationSource(k + 1, url) for k, url in enumerate(urls)]
+    return SearchResult(query="batteries", answers=[CitedText(text=text, sources=sources)])
+
+
+def test_batches_with_known_urls_and_passages_are_not_novel():
+    tracker = NoveltyTracker()
+
+    first = tracker.add_batch([result(PASSAGE, "https://example.com/a", "https://example.com/b")])
+    assert (first.new_urls, first.urls, first.new_passages, first.passages, first.novelty) == (2, 2, 1, 1, 1.0)
+
+    # Same passage (near-duplicate) and a known URL with tracking parameters, one new URL
+    second = tracker.add_batch([result(PASSAGE.replace("safer", "safer,"), "https://example.com/a?utm_source=x",
+                                        "https://example.com/c")])
+    assert (second.new_urls, second.new_passages) == (1, 0)
+    assert second.novelty == 0.25
+
+    third = tracker.add_batch([result("Sodium ion cells use cheap and abundant materials instead of lithium.")] * 2)
+    assert (third.urls, third.new_passages, third.passages, third.novelty) == (0, 1, 2, 0.5)
+    assert [point.searches for point in tracker.curve] == [1, 2, 4]
+    assert tracker.add_batch([]).novelty == 0.0
@@ -0,0 +1,35 @@
+import asyncio
+from types import SimpleNamespace
+
+from query_planner import PlannedQuery, QueryPlan, QuerySource, cluster_queries, plan_search_queries_async
+
+
+def test_paraphrases_of_the_same_source_are_pruned():
+    queries = [
+        PlannedQuery(query="solar panel efficiency 2024"),
+        PlannedQuery(query="wind turbine noise regulations"),
+        PlannedQuery(query="2024 solar panel efficiency"),
+        PlannedQuery(query="solar panel efficiency 2024", source=QuerySource.SCHOLAR),
+    ]
+
+    kept, pruned = cluster_queries(queries)
+
+    assert kept == [queries[0], queries[1], queries[3]]
+    assert pruned == [(queries[2], queries[0])]
+    assert cluster_queries([]) == ([], [])
+
+
+def test_plan_is_deduplicated_and_cut_to_max_queries():
+    planned = QueryPlan(queries=[PlannedQuery(query=query) for query in
+                                    ["battery recycling", "recycling battery", "lithium prices", "cobalt mining"]])
+    calls = []
+
+    async def generate_content(model, contents, config):
+        calls.append(contents)
+        return SimpleNamespace(text=planned.model_dump_json(), usage_metadata=None)
+
+    client = SimpleNamespace(aio=SimpleNamespace(models=SimpleNamespace(generate_content=generate_content)))
+    plan = asyncio.run(plan_search_queries_async("battery supply chain", max_queries=2, client=client))
+
+    assert [planned_query.query for planned_query in plan.queries] == ["battery recycling", "lithium prices"]
+    assert "up to 3 search queries" in calls[0]
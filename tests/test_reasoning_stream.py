@@ -0,0 +1,68 @@
+import asyncio
+from types import SimpleNamespace
+
+import reasoning_stream
+from llm_gateway import llm_gateway
+from reasoning_stream import (ReasoningBackend, ReasoningEventType, collect_reasoning, stop_after_lines,
+                                stream_reasoning)
+
+
+def delta_chunk(reasoning=None, content=None, usage=None):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(reasoning=reasoning, content=content))],
+                            usage=usage)
+
+
+def gemini_chunk(*parts, usage=None):
+    content = SimpleNamespace(parts=[SimpleNamespace(text=text, thought=thought) for text, thought in parts])
+    return SimpleNamespace(candidates=[SimpleNamespace(content=content)], usage_metadata=usage)
+
+
+async def collect_events(stream):
+    return [event async for event in stream]
+
+
+def test_openrouter_reasoning_and_content_become_thought_and_answer_events(monkeypatch):
+    closed = []
+
+    async def fake_stream(provider, model, messages, **kwargs):
+        try:
+            yield delta_chunk(reasoning="Let me think.")
+            yield delta_chunk(reasoning=" Done.", content="First line\n")
+            yield delta_chunk(content="Second line\n")
+            yield delta_chunk(content="never consumed")
+        finally:
+            closed.append(True)
+
+    monkeypatch.setattr(llm_gateway, "stream", fake_stream)
+
+    events = asyncio.run(collect_events(stream_reasoning("question", ReasoningBackend.OPENROUTER)))
+    events = [(event.type, event.text) for event in events]
+    assert events[:4] == [(ReasoningEventType.THOUGHT, "Let me think."), (ReasoningEventType.THOUGHT, " Done."),
+                            (ReasoningEventType.ANSWER, "First line\n"), (ReasoningEventType.ANSWER, "Second line\n")]
+    assert events[-1] == (ReasoningEventType.DONE, "")
+
+    response = asyncio.run(collect_reasoning("question", ReasoningBackend.OPENROUTER, stop_when=stop_after_lines(2)))
+    assert response.reasoning_content == "Let me think. Done."
+    assert response.final_answer == "First line\nSecond line\n"
+    assert closed == [True, True]
+
+
+def test_gemini_thought_parts_are_split_from_the_answer(monkeypatch):
+    usage = SimpleNamespace(prompt_token_count=10, candidates_token_count=5, thoughts_token_count=3)
+
+    async def chunks():
+        yield gemini_chunk(("Thinking...", True))
+        yield gemini_chunk(("Answer", False), usage=usage)
+
+    async def generate_content_stream(model, contents, config):
+        return chunks()
+
+    monkeypatch.setattr(reasoning_stream, "geminiClient",
+                        SimpleNamespace(aio=SimpleNamespace(models=SimpleNamespace(
+                            generate_content_stream=generate_content_stream))))
+
+    events = asyncio.run(collect_events(stream_reasoning("question")))
+    assert [(event.type, event.text) for event in events[:2]] == [(ReasoningEventType.THOUGHT, "Thinking..."),
+                                                                    (ReasoningEventType.ANSWER, "Answer")]
+    assert events[2].usage.reasoning_tokens == 3
+    assert events[3].type == ReasoningEventType.DONE and not events[3].stopped_early
@@ -0,0 +1,47 @@
+import asyncio
+from types import SimpleNamespace
+
+import extensive_search
+from citations import ReferenceTable
+from context_packer import PackedContext, PackedSource
+from extensive_search import get_report_context_async, get_retrieval_budget
+
+
+def packed_context(texts: list[str]) -> PackedContext:
+    references = ReferenceTable()
+    sources = [PackedSource(index=k, text=text, references={references.add(f"https://example.com/{k}")})
+                for k, text in enumerate(texts)]
+    text = "\n\n".join(texts)
+    return PackedContext(sources=sources, references=references, text=text, tokens=len(text) // 4)
+
+
+def test_large_corpora_keep_more_passages_for_map_reduce(monkeypatch):
+    monkeypatch.setattr(extensive_search.config, "MAP_REDUCE_TOKEN_THRESHOLD", 100)
+
+    assert get_retrieval_budget(["short result [1]"]) == extensive_search.config.RETRIEVAL_CONTEXT_TOKENS
+    assert get_retrieval_budget(["long result " * 50]) == extensive_search.config.REPORT_CONTEXT_TOKENS
+
+
+def test_only_contexts_above_the_threshold_are_map_reduced(monkeypatch):
+    monkeypatch.setattr(extensive_search.config, "MAP_REDUCE_TOKEN_THRESHOLD", 100)
+    monkeypatch.setattr(extensive_search.config, "MAP_REDUCE_GROUP_TOKENS", 100)
+    prompts = []
+
+    async def generate_content(model, contents):
+        prompts.append(contents)
+        return SimpleNamespace(text=f"Summary {len(prompts)} [1].", usage_metadata=None)
+
+    monkeypatch.setattr(extensive_search, "geminiClient",
+                        SimpleNamespace(aio=SimpleNamespace(models=SimpleNamespace(generate_content=generate_content))))
+
+    small = packed_context(["Fact [1]."])
+    assert asyncio.run(get_report_context_async("query", small)) == small.text
+    assert prompts == []
+
+    large = packed_context([f"Fact {k} [{k + 1}]. " * 30 for k in range(3)])
+    context = asyncio.run(get_report_context_async("query", large))
+
+    # One map call per source group, the global reference list is appended
+    assert len(prompts) == 3
+    assert context.startswith("# Summary 1:\nSummary")
+    assert context.endswith("# References\n[1] https://example.com/0\n[2] https://example.com/1\n[3] https://example.com/2")
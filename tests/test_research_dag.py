@@ -0,0 +1,56 @@
+import time
+import asyncio
+
+from research_dag import NodeStatus, NodeType, ResearchBudget, ResearchDAG
+
+
+def test_nodes_waiting_for_their_type_limit_dont_hold_global_slots():
+    started = []
+
+    async def search(dag, node):
+        started.append(node.type)
+        await asyncio.sleep(0.05)
+
+    async def crawl(dag, node):
+        started.append(node.type)
+
+    async def run():
+        dag = ResearchDAG({NodeType.SEARCH: search, NodeType.CRAWL: crawl}, concurrency=2,
+                            type_limits={NodeType.SEARCH: (1, None)})
+        for _ in range(3):
+            dag.add_node(NodeType.SEARCH, {})
+        for _ in range(2):
+            dag.add_node(NodeType.CRAWL, {})
+        await dag.run()
+
+    asyncio.run(run())
+
+    # The searches run one at a time, the crawls use the free global slot meanwhile
+    assert started[:3] == [NodeType.SEARCH, NodeType.CRAWL, NodeType.CRAWL]
+
+
+def test_no_node_is_taken_after_the_time_budget():
+    started = []
+
+    async def search(dag, node):
+        started.append(node.id)
+        # Blocks the event loop past the time budget, e.g., parsing a large result
+        time.sleep(0.15)
+        dag.add_node(NodeType.CRAWL, {}, depends_on=(node.id,))
+
+    async def crawl(dag, node):
+        started.append(node.id)
+
+    async def run():
+        dag = ResearchDAG({NodeType.SEARCH: search, NodeType.CRAWL: crawl}, ResearchBudget(max_seconds=0.1),
+                            concurrency=1)
+        dag.add_node(NodeType.SEARCH, {})
+        dag.add_node(NodeType.CRAWL, {})
+        await dag.run()
+        return dag
+
+    dag = asyncio.run(run())
+
+    assert started == [0]
+    assert [node.status for node in dag.nodes.values()] == [NodeStatus.DONE, NodeStatus.SKIPPED, NodeStatus.SKIPPED]
+    assert dag.stop_reason == "time budget"
@@ -0,0 +1,65 @@
+import pickle
+from dataclasses import dataclass
+
+import pytest
+from pydantic import BaseModel
+
+import agent_utils
+from agent_utils import load_data, register_data_type, save_data
+from artifact_store import ArtifactStore
+
+
+@register_data_type
+class SearchQueries(BaseModel):
+    google_search: list[str]
+
+
+@register_data_type
+@dataclass
+class Hit:
+    url: str
+    score: float
+
+
+@pytest.fixture(autouse=True)
+def store(monkeypatch, tmp_path) -> ArtifactStore:
+    artifact_store = ArtifactStore(str(tmp_path))
+    monkeypatch.setattr(agent_utils, "artifact_store", artifact_store)
+    monkeypatch.setattr(agent_utils.config, "ARTIFACT_DIR", str(tmp_path))
+    return artifact_store
+
+
+def test_models_and_dataclasses_are_loaded_as_their_class():
+    save_data(SearchQueries(google_search=["a", "b"]), "queries")
+    save_data([Hit("https://a.example", 0.5), Hit("https://b.example", 0.25)], "hits")
+    save_data({"answer": "text", "count": 2}, "plain")
+
+    assert load_data("queries") == SearchQueries(google_search=["a", "b"])
+    assert load_data("hits") == [Hit("https://a.example", 0.5), Hit("https://b.example", 0.25)]
+    assert load_data("plain") == {"answer": "text", "count": 2}
+    assert load_data("missing") is None
+
+
+def test_old_pickle_artifact_raises(tmp_path):
+    with open(tmp_path / "results.pkl", "wb") as f:
+        pickle.dump(["old result"], f)
+
+    with pytest.raises(RuntimeError, match="results.pkl"):
+        load_data("results")
+
+    save_data(["new result"], "results")
+    assert load_data("results") == ["new result"]
+
+
+def test_only_registered_types_are_stored_and_restored(store):
+    @dataclass
+    class Unregistered:
+        value: int
+
+    with pytest.raises(TypeError, match="register_data_type"):
+        save_data(Unregistered(1), "unregistered")
+
+    # A stored class name is looked up in the registry, never imported
+    store.put("forged", {"type": "os:system", "data": "echo"}, schema="data", version=agent_utils.DATA_SCHEMA_VERSION)
+    with pytest.raises(TypeError, match="os:system"):
+        load_data("forged")
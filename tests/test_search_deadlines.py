@@ -0,0 +1,49 @@
+import time
+import asyncio
+
+import pytest
+
+from agent_tools import BasicSearchModel
+from citations import CitedText
+
+
+def search_model(monkeypatch, google, perplexity) -> BasicSearchModel:
+    model = BasicSearchModel(perplexity_search=True)
+    monkeypatch.setattr(model, "_google_search_async", google)
+    monkeypatch.setattr(model, "_perplexity_search_async", perplexity)
+    return model
+
+
+async def answer(text: str, delay: float = 0.0, provider: str = "google") -> CitedText:
+    await asyncio.sleep(delay)
+    return CitedText(text=text, provider=provider)
+
+
+async def fail(query: str):
+    raise RuntimeError("quota exceeded")
+
+
+def test_late_provider_is_skipped(monkeypatch):
+    model = search_model(monkeypatch, lambda query: answer("google answer"),
+                            lambda query: answer("perplexity answer", delay=5, provider="perplexity"))
+
+    start = time.time()
+    result = asyncio.run(model.search_async("query", google_deadline=1, perplexity_deadline=0.1))
+
+    assert [cited.text for cited in result.answers] == ["google answer"]
+    assert time.time() - start < 2
+
+
+def test_failed_provider_is_skipped(monkeypatch):
+    model = search_model(monkeypatch, fail, lambda query: answer("perplexity answer", provider="perplexity"))
+
+    result = asyncio.run(model.search_async("query"))
+
+    assert [cited.provider for cited in result.answers] == ["perplexity"]
+
+
+def test_search_fails_only_without_any_answer(monkeypatch):
+    model = search_model(monkeypatch, fail, lambda query: answer("late", delay=5))
+
+    with pytest.raises(RuntimeError, match="quota exceeded"):
+        asyncio.run(model.search_async("query", perplexity_deadline=0.1))
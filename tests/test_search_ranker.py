@@ -0,0 +1,49 @@
+import asyncio
+
+import llm_batcher
+import search_ranker
+from search_ranker import get_hit_host, rank_search_hits, rank_search_hits_async
+
+REDIRECT = "https://vertexaisearch.cloud.google.com/grounding-api-redirect/AbC123"
+
+
+def test_grounding_redirects_are_ranked_by_the_site_domain():
+    hits = [{"link": REDIRECT, "title": "pinterest.com", "position": 1},
+            {"link": REDIRECT + "x", "title": "arxiv.org", "position": 2}]
+
+    assert get_hit_host(hits[0]) == "pinterest.com"
+    assert [hit["title"] for hit in rank_search_hits("transformer inference", hits)] == ["arxiv.org", "pinterest.com"]
+
+
+def test_ranking_is_local_by_default(monkeypatch):
+    async def no_llm(query, text):
+        raise AssertionError("LLM call while ranking")
+
+    monkeypatch.setattr(llm_batcher, "rate_relevance_async", no_llm)
+    hits = [{"link": f"https://site{k}.example.com/", "title": "transformer inference", "position": k + 1} for k in range(6)]
+
+    ranked = asyncio.run(rank_search_hits_async("transformer inference", hits, cutoff=2))
+
+    assert [hit["link"] for hit in ranked] == [hit["link"] for hit in rank_search_hits("transformer inference", hits)]
+
+
+def test_opt_in_judge_only_rates_hits_close_to_the_cutoff(monkeypatch):
+    rated = []
+
+    async def rating(query, text):
+        rated.append(text.split("\n")[1])
+        return 100
+
+    monkeypatch.setattr(llm_batcher, "rate_relevance_async", rating)
+    monkeypatch.setattr(search_ranker.config, "RANKER_LLM_JUDGE", True)
+    clear_cut = [{"link": "https://arxiv.org/a", "title": "transformer inference", "snippet": "transformer inference", "position": 1},
+                    {"link": "https://pinterest.com/b", "title": "cooking", "position": 9}]
+    close = [{"link": "https://a.example.com/", "title": "transformer inference", "position": 1},
+                {"link": "https://b.example.com/", "title": "transformer inference", "position": 1}]
+
+    asyncio.run(rank_search_hits_async("transformer inference", clear_cut, cutoff=1))
+    assert rated == []
+
+    ranked = asyncio.run(rank_search_hits_async("transformer inference", close, cutoff=1))
+    assert sorted(rated) == ["https://a.example.com/", "https://b.example.com/"]
+    assert len(ranked) == 2
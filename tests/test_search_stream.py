@@ -0,0 +1,37 @@
+import asyncio
+from types import SimpleNamespace
+
+from agent_tools import BasicSearchModel
+
+
+def stream_chunk(text, metadata=None):
+    return SimpleNamespace(text=text, candidates=[SimpleNamespace(grounding_metadata=metadata)])
+
+
+def test_streamed_result_gets_the_citations_of_the_final_metadata(monkeypatch):
+    metadata = SimpleNamespace(
+        grounding_supports=[SimpleNamespace(segment=SimpleNamespace(part_index=None, start_index=0, end_index=15),
+                                            grounding_chunk_indices=[0])],
+        grounding_chunks=[SimpleNamespace(web=SimpleNamespace(uri="https://example.com/solar", title="example.com"))])
+
+    async def chunks():
+        yield stream_chunk("Solar is cheap.")
+        yield stream_chunk(" Wind too.", metadata)
+
+    async def generate_content_stream(model, contents, config):
+        return chunks()
+
+    model = BasicSearchModel()
+    monkeypatch.setattr(model, "client",
+                        SimpleNamespace(aio=SimpleNamespace(models=SimpleNamespace(
+                            generate_content_stream=generate_content_stream))))
+    results = []
+
+    async def run():
+        return [text async for text in model.stream_async("energy prices", results.append)]
+
+    streamed = asyncio.run(run())
+
+    assert streamed[:2] == ["Solar is cheap.", " Wind too."]
+    assert "[1] example.com https://example.com/solar" in streamed[2]
+    assert results[0].answers[0].render() == "Solar is cheap. [1] Wind too."
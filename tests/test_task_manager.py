@@ -0,0 +1,78 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+
+from task_manager import TaskManager, TaskStatus
+
+
+def wait_for_status(manager: TaskManager, task_id: str, status: str, timeout: float = 5.0) -> dict:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        task = manager.get_task(task_id)
+        if task["status"] == status and task_id not in manager.running_tasks:
+            return task
+        time.sleep(0.01)
+    raise AssertionError(f"Task {task_id} didn't reach {status}: {manager.get_task(task_id)}")
+
+
+async def instant_task(query: str) -> str:
+    return f"done: {query}"
+
+
+async def endless_task(query: str) -> str:
+    await asyncio.sleep(3600)
+    return "never"
+
+
+def test_fast_async_task_is_not_left_registered(tmp_path):
+    manager = TaskManager(str(tmp_path / "tasks.db"))
+    for k in range(20):
+        task_id = manager.add_task(f"query {k}", "test")
+        manager.start_task(task_id, instant_task, f"query {k}")
+        assert wait_for_status(manager, task_id, TaskStatus.COMPLETED)["result"] == f"done: query {k}"
+
+
+def test_async_task_is_cancelled(tmp_path):
+    manager = TaskManager(str(tmp_path / "tasks.db"))
+    task_id = manager.add_task("query", "test")
+    manager.start_task(task_id, endless_task, "query")
+
+    assert manager.cancel_task(task_id)
+    wait_for_status(manager, task_id, TaskStatus.CANCELLED)
+
+
+def test_second_manager_does_not_recover_live_tasks(tmp_path):
+    path = str(tmp_path / "tasks.db")
+    streamlit_manager = TaskManager(path)
+    streamlit_manager.register_task_type("test", endless_task)
+    task_id = streamlit_manager.add_task("query", "test")
+    streamlit_manager.start_task(task_id, endless_task, "query")
+
+    # E.g., the CLI started while the app is running
+    cli_manager = TaskManager(path)
+    cli_manager.register_task_type("test", endless_task)
+    assert cli_manager.get_task(task_id)["status"] == TaskStatus.RUNNING
+    assert cli_manager.recover_tasks() == []
+    assert task_id not in cli_manager.running_tasks
+
+    streamlit_manager.cancel_task(task_id)
+
+
+def test_task_of_a_stopped_process_is_recovered_once(tmp_path):
+    path = str(tmp_path / "tasks.db")
+    stopped_manager = TaskManager(path)
+    task_id = stopped_manager.add_task("query", "test")
+    with sqlite3.connect(path) as conn:
+        # RUNNING row of a process that stopped without a heartbeat for longer than the timeout
+        conn.execute("UPDATE tasks SET status = ?, args = ?, owner_pid = ?, heartbeat_at = ? WHERE id = ?",
+                        (TaskStatus.RUNNING, json.dumps({"args": ["query"], "kwargs": {}}), -1, time.time() - 3600, task_id))
+
+    managers = [TaskManager(path), TaskManager(path)]
+    for manager in managers:
+        manager.register_task_type("test", instant_task)
+
+    assert managers[0].recover_tasks() == [task_id]
+    assert managers[1].recover_tasks() == []
+    assert wait_for_status(managers[0], task_id, TaskStatus.COMPLETED)["owner_pid"] == os.getpid()